@@ -1,38 +1,306 @@
 from __future__ import division, print_function
+from collections import OrderedDict
 from subprocess import call
+import multiprocessing
 import argparse
+import shutil
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import json
 import os
+import re
 import time
+import sys
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from monitor import ConvergenceMonitor
+from forcecoeffs import CaseResults, append_polar
+from archive import ARTIFACTS, archive_case
+from pipeline import Pipeline, append_records, report
+from decompose import CELLS_PER_RANK, METHODS
+import decompose
 
-def run_case(foil, alpha, Reynolds, U):
+
+# Template cases (and the files they need) cloned for each case-farm job
+TEMPLATES = ['airfoil_snappyHexMesh', 'airfoil_simpleFoam', 'airfoil_pimpleFoam',
+             'Allrun', 'scripts']
+
+
+def run_case(foil, alpha, Reynolds, U, case='.', procs=None, mesh=None, warm=None,
+             converge=None, archive=None, cores=None, decompose=None, output='output'):
+    """
+    Run one foil at one angle of attack in `case`. With `mesh`, the foil is
+    meshed at zero incidence (or the mesh already saved there is reused) and
+    the angle is set by rotating the flow instead. With `warm`, the steady
+    solution starts from the fields of that converged simpleFoam case. With
+    `converge`, a dict of `ConvergenceMonitor` settings, each solver is
+    stopped once its force coefficients have converged. `archive` is a dict
+    of `archive_case` settings for what to keep of the transient case under
+    `output`/`foil`/Re<Reynolds>_U<U>/`alpha`, or False to keep nothing.
+
+    The stages of Allrun are run one by one, and info['stages'] holds the
+    timing and resource record of each (see `Pipeline`). pimpleFoam runs on
+    `procs` MPI ranks, its decomposeParDict rewritten to match, or with
+    `procs` None on as many of the `cores` as the mesh keeps busy, split as
+    `decompose` says; info['decomposition'] holds the choice.
+
+    Returns the exit status of the first stage to fail (or 0) and a dict of
+    anything learned on the way.
+    """
     # Clean and run case
-    print("Cleaning...")
-    call(["./Allclean"])
-    call(["python", "scripts/NACA2STL.py", foil, str(alpha)])
+    if case == '.':
+        print("Cleaning...")
+        call(["./Allclean"])
+    call(["python", "scripts/NACA2STL.py", foil, str(0 if mesh else alpha)], cwd=case)
     call(["python", "scripts/initial_conditions.py",
           "--Reynolds", str(Reynolds),
-          "--U", str(U)])
+          "--U", str(U),
+          "--alpha", str(alpha if mesh else 0)], cwd=case)
+    if procs:
+        set_subdomains(case, procs)
     print("Running solution...")
-    call(["./Allrun"])
+    info = {}
+    if converge is not None:
+        monitor = ConvergenceMonitor(case, **converge)
+        monitor.start()
+    pipeline = Pipeline(case, procs, mesh=os.path.join(mesh, foil) if mesh else None,
+                        warm=warm, tags=OrderedDict([('foil', foil), ('alpha', float(alpha)),
+                                                     ('Reynolds', Reynolds)]),
+                        cores=cores, decompose=decompose)
+    try:
+        status = pipeline.run()
+    finally:
+        info['stages'] = pipeline.records
+        info['decomposition'] = pipeline.decomposition or dict(procs=procs)
+        if converge is not None:
+            info['convergence'] = monitor.stop()
+
+    # Average the forces over the second half of the transient run, or of the
+    # part that ran if it was stopped early
+    stage = os.path.join(case, 'airfoil_pimpleFoam')
+    end = info.get('convergence', {}).get('airfoil_pimpleFoam', {}).get('time')
+    info['forces'] = CaseResults(stage, end=end).update().summary()
 
     # Save data
-    output_dir = os.getcwd() + '/output/' + foil + '/' + str(alpha)
-    data = os.getcwd() + '/airfoil_pimpleFoam/'
-    call(["rm", "-rf", output_dir])
-    os.makedirs(output_dir)
-    time.sleep(1)
-    call(['cp', '-r', data, output_dir])
+    if archive is not False:
+        dest = os.path.join(output, *FarmState.key(foil, alpha, Reynolds, U).split('/'))
+        info['archive'] = archive_case(stage, dest, manifest=dict(
+            foil=foil, alpha=float(alpha), Reynolds=Reynolds, U=U, status=status,
+            forces=info['forces'], decomposition=info['decomposition']), **(archive or {}))
+    return status, info
+
+
+def case_path(root, foil, alpha, Reynolds, U):
+    # Folder of one farm job; cases at other Reynolds numbers and speeds sit
+    # alongside rather than on top of each other
+    return os.path.join(root, *FarmState.key(foil, alpha, Reynolds, U).split('/'))
+
+
+def polar_path(folder, foil, Reynolds):
+    # Polar of one foil at one Reynolds number, gaining a row per finished case
+    return os.path.join(folder, 'NACA {} Re{:.0f}.dat'.format(foil, Reynolds))
 
 
-def param_sweep(foil, start, stop, step, Reynolds, U):
+def param_sweep(foil, start, stop, step, Reynolds, U, mesh=None, converge=None,
+                archive=None, procs=None, decompose=None):
     alphas = np.arange(start, stop, step)
     print("Running foil {}, alphas {}.".format(foil, alphas))
+    records = []
 
     for alpha in alphas:
         print("Running alpha {}.".format(alpha))
-        run_case(foil, alpha, Reynolds, U)
+        status, info = run_case(foil, alpha, Reynolds, U, procs=procs, mesh=mesh,
+                                converge=converge, archive=archive, decompose=decompose)
+        append_records(os.path.join('output', 'stages.jsonl'), info['stages'])
+        records.extend(info['stages'])
+        if status == 0:
+            append_polar(polar_path('output', foil, Reynolds), foil, Reynolds, alpha,
+                         info['forces'])
+
+    print(report(records))
+
+
+def ignore_generated(folder, names):
+    # Leave out results of earlier runs when cloning the templates
+    generated = []
+    for name in names:
+        path = os.path.join(folder, name)
+        if name.startswith('processor') or name in ('postProcessing', 'liftDrag.png'):
+            generated.append(name)
+        elif os.path.basename(folder) == 'output' and name != '.keep':
+            generated.append(name)
+        elif re.match(r'^[\d.e+-]+$', name) and name != '0' and os.path.isdir(path):
+            generated.append(name)
+    return generated
+
+
+def set_subdomains(case, procs):
+    """
+    Match the pimpleFoam decomposition to a fixed number of MPI ranks. The
+    template splits (2 1 2) for 4 ranks, any other count uses scotch.
+    """
+    settings = dict(procs=procs, method='simple' if procs == 4 else 'scotch', n=(2, 1, 2))
+    decompose.write(os.path.join(case, 'airfoil_pimpleFoam'), settings)
+
+
+def clone_case(case, procs=None):
+    # Make a fresh copy of the template cases to run one job in
+    if os.path.exists(case):
+        shutil.rmtree(case)
+    os.makedirs(case)
+    for name in TEMPLATES:
+        if os.path.isdir(name):
+            shutil.copytree(name, os.path.join(case, name), symlinks=True,
+                            ignore=ignore_generated)
+        else:
+            shutil.copy2(name, case)
+    if procs:
+        set_subdomains(case, procs)
+
+
+def farm_job(job):
+    # Run one (foil, alpha) job in its own copy of the cases
+    (foil, alpha, Reynolds, U, case, procs, cores, decompose, mesh, converge, archive, output,
+     warm) = job
+    info = {}
+    try:
+        clone_case(case)
+        status, info = run_case(foil, alpha, Reynolds, U, case=case, procs=procs,
+                                mesh=mesh, warm=warm, converge=converge, archive=archive,
+                                cores=cores, decompose=decompose, output=output)
+    except Exception as e:
+        print("Job {} alpha {} failed: {}".format(foil, alpha, e))
+        status = -1
+    return foil, alpha, status, info
+
+
+class FarmState(object):
+    """
+    Status of every job in a case farm, saved as JSON after each change so an
+    interrupted sweep can pick up where it left off.
+    """
+
+    def __init__(self, root):
+        self.path = os.path.join(root, 'state.json')
+        self.jobs = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.jobs = json.load(f)
+
+    @staticmethod
+    def key(foil, alpha, Reynolds, U):
+        # Also the job's case folder under the farm root
+        return '{}/Re{:.0f}_U{:g}/{}'.format(foil, Reynolds, U, alpha)
+
+    def status(self, foil, alpha, Reynolds, U):
+        return self.jobs.get(self.key(foil, alpha, Reynolds, U), {}).get('status')
+
+    def set(self, foil, alpha, Reynolds, U, status, **info):
+        job = self.jobs.setdefault(self.key(foil, alpha, Reynolds, U), {})
+        job.update(info, status=status, Reynolds=Reynolds, U=U, updated=time.time())
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.jobs, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
+
+    def nearest(self, foil, alpha, Reynolds):
+        """
+        Key of the finished case of this foil closest in alpha and Reynolds
+        number, counting a factor of 10 in Reynolds number like 10 degrees.
+        """
+        best, distance = None, None
+        for key, job in self.jobs.items():
+            if job['status'] != 'done' or key.split('/')[0] != foil:
+                continue
+            d = abs(float(key.split('/')[-1]) - alpha) + \
+                10*abs(np.log10(job['Reynolds']/Reynolds))
+            if distance is None or d < distance:
+                best, distance = key, d
+        return best
+
+
+def farm(foil, alphas, Reynolds, U, root='cases', slots=None, procs=None, resume=True,
+         rotate=False, warm=False, converge=None, archive=None, decompose=None):
+    """
+    Run each alpha in its own clone of the template cases under `root`
+    (in `root`/foil/Re<Reynolds>_U<U>/alpha), with up to `slots` cases at
+    once. Each case runs pimpleFoam on `procs` MPI ranks, so by default
+    there are as many slots as fit on the cores.
+    With `procs` None the cores are shared out between the slots (as if
+    `procs` were 4 for the default number of slots), and each case uses as
+    many of its share as its mesh keeps busy, split as `decompose` says.
+    With `resume`, jobs that already finished in an earlier sweep are skipped.
+    With `rotate`, the foil is meshed once into `root`/mesh and every alpha
+    reuses that mesh. With `warm`, each case starts from the nearest case
+    finished by the time it is launched, marching outwards from alpha = 0.
+    `converge` and `archive` are passed on to `run_case`, which archives
+    under `root`/output. The averaged force coefficients of each finished
+    case are added to a polar file in `root`, and the timings of its stages
+    to `root`/stages.jsonl.
+    """
+    mesh = os.path.join(root, 'mesh') if rotate else None
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    state = FarmState(root)
+    slots = slots or max(1, multiprocessing.cpu_count() // (procs or 4))
+    cores = max(1, multiprocessing.cpu_count() // slots)
+
+    pending = []
+    for alpha in alphas:
+        if resume and state.status(foil, alpha, Reynolds, U) == 'done':
+            print("Skipping foil {} alpha {} Re {:g}, already done.".format(foil, alpha, Reynolds))
+            continue
+        case = case_path(root, foil, alpha, Reynolds, U)
+        state.set(foil, alpha, Reynolds, U, 'queued', case=case, procs=procs, cores=cores)
+        pending.append((foil, alpha, Reynolds, U, case, procs, cores, decompose, mesh, converge,
+                        archive, os.path.join(root, 'output')))
+
+    if not pending:
+        return state
+    print("Running {} cases, {} at a time on {} cores each.".format(
+        len(pending), slots, procs or "up to {}".format(cores)))
+    if warm:
+        pending.sort(key=lambda job: abs(job[1]))
+
+    # Let the first case make the mesh before the others go looking for it
+    hold = mesh is not None and not os.path.isdir(os.path.join(mesh, foil))
+
+    finished = queue.Queue()
+    pool = multiprocessing.Pool(min(slots, len(pending)))
+    running = 0
+    records = []
+    try:
+        while pending or running:
+            while pending and running < (1 if hold else slots):
+                job = pending.pop(0)
+                source = state.nearest(foil, job[1], Reynolds) if warm else None
+                if source:
+                    source = os.path.join(state.jobs[source]['case'], 'airfoil_simpleFoam')
+                state.set(foil, job[1], Reynolds, U, 'running', warm_start=source)
+                pool.apply_async(farm_job, (job + (source,),), callback=finished.put)
+                running += 1
+
+            foil, alpha, status, info = finished.get()
+            running -= 1
+            hold = False
+            stages = info.pop('stages', [])
+            append_records(os.path.join(root, 'stages.jsonl'), stages)
+            records.extend(stages)
+            state.set(foil, alpha, Reynolds, U, 'done' if status == 0 else 'failed',
+                      returncode=status, **info)
+            if status == 0:
+                append_polar(polar_path(root, foil, Reynolds), foil, Reynolds, alpha,
+                             info['forces'])
+            print("Finished foil {} alpha {}: {}.".format(
+                foil, alpha, state.status(foil, alpha, Reynolds, U)))
+    finally:
+        pool.close()
+        pool.join()
+    print(report(records))
+    return state
 
 
 if __name__ == "__main__":
@@ -45,6 +313,36 @@ if __name__ == "__main__":
     parser.add_argument("--foil", "-f", default="0012", help="Foil")
     parser.add_argument("--Reynolds", "-R", type=float, default=6e6,
                         help="Reynolds number")
+    parser.add_argument("--farm", default=None, metavar="DIR",
+                        help="Run each case in its own copy of the templates under DIR.")
+    parser.add_argument("--slots", "-j", type=int, default=None,
+                        help="Number of cases to run at once (case farm).")
+    parser.add_argument("--procs", "-n", type=int, default=None,
+                        help="MPI ranks per case for pimpleFoam (default: picked from the "
+                             "mesh size and the cores each case gets).")
+    parser.add_argument("--decompose", choices=METHODS, default="scotch",
+                        help="How to split the mesh when picking the ranks.")
+    parser.add_argument("--cells-per-rank", type=int, default=CELLS_PER_RANK,
+                        help="Fewest cells to give each rank when picking the ranks.")
+    parser.add_argument("--restart", action="store_true",
+                        help="Rerun cases already finished in DIR (case farm).")
+    parser.add_argument("--rotate", action="store_true",
+                        help="Mesh each foil once and set alpha by rotating the flow.")
+    parser.add_argument("--warm", action="store_true",
+                        help="Start each case from the nearest finished one (case farm).")
+    parser.add_argument("--converge", type=float, default=None, metavar="TOL",
+                        help="Stop each solver once Cl and Cd settle to within TOL.")
+    parser.add_argument("--window", type=float, default=0.2,
+                        help="Part of each solver's endTime to judge convergence over.")
+    parser.add_argument("--archive", default="tar.gz",
+                        choices=["tar.gz", "tar.bz2", "tar", "dir", "none"],
+                        help="How to save each case in output/ (DIR/output with --farm): one "
+                             "compressed tar file, hard links in a directory, or not at all.")
+    parser.add_argument("--keep", default=",".join(ARTIFACTS),
+                        help="Comma-separated parts of each case to save, of " +
+                             ", ".join(ARTIFACTS) + ".")
+    parser.add_argument("--stubs", action="store_true",
+                        help="Use the stub OpenFOAM executables in stubs/.")
 
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--U", "-U", type=float, default=None, help="Velocity in m/s")
@@ -58,6 +356,28 @@ if __name__ == "__main__":
     if args.U is None and args.Mach is not None:
         args.U = args.Mach * 332
 
+    if args.stubs:
+        os.environ["PATH"] = os.path.abspath("stubs") + os.pathsep + os.environ["PATH"]
+
+    converge = None
+    if args.converge is not None:
+        converge = dict(tolerance=args.converge, window=args.window)
+
+    archive = False
+    if args.archive != "none":
+        archive = dict(format=args.archive, keep=args.keep.split(","))
+
+    # Not `decompose`, which would hide the module from set_subdomains
+    decompose_settings = dict(method=args.decompose, cells_per_rank=args.cells_per_rank)
+
     if args.stop is None:
         args.stop = args.start + 1
-    param_sweep(args.foil, args.start, args.stop, args.step, args.Reynolds, args.U)
+    if args.farm:
+        farm(args.foil, np.arange(args.start, args.stop, args.step), args.Reynolds,
+             args.U, root=args.farm, slots=args.slots, procs=args.procs,
+             resume=not args.restart, rotate=args.rotate, warm=args.warm,
+             converge=converge, archive=archive, decompose=decompose_settings)
+    else:
+        param_sweep(args.foil, args.start, args.stop, args.step, args.Reynolds, args.U,
+                    mesh="mesh" if args.rotate else None, converge=converge,
+                    archive=archive, procs=args.procs, decompose=decompose_settings)
@@ -0,0 +1,140 @@
+from __future__ import division, print_function
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import time
+
+
+# What can be kept from a finished case
+ARTIFACTS = ['forces', 'final', 'setup', 'mesh', 'logs']
+
+# Archive formats, and the tarfile mode to write each with
+FORMATS = {'tar.gz': 'w:gz', 'tar.bz2': 'w:bz2', 'tar': 'w', 'dir': None}
+
+
+def time_dirs(case):
+    # Time directories of a case, in order
+    times = [name for name in os.listdir(case)
+             if re.match(r'^[\d.e+-]+$', name) and os.path.isdir(os.path.join(case, name))]
+    return sorted(times, key=float)
+
+
+def walk(folder):
+    # Every file under folder, in a stable order
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            yield os.path.join(root, name)
+
+
+def mesh_checksum(case):
+    """
+    SHA-1 over the names and contents of the files in constant/polyMesh,
+    enough to tell whether two cases ran on the same mesh.
+    """
+    mesh = os.path.join(case, 'constant', 'polyMesh')
+    sha = hashlib.sha1()
+    for path in walk(mesh):
+        sha.update(os.path.relpath(path, mesh).encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def select(case, keep=ARTIFACTS):
+    """
+    Files of `case` to archive for each of the chosen artifacts, as paths
+    relative to the case.
+    """
+    folders = {'forces': ['postProcessing'],
+               'setup': ['system', 'constant/transportProperties', 'constant/turbulenceProperties',
+                         'constant/RASProperties'],
+               'logs': ['output']}
+    times = time_dirs(case)
+    if times:
+        folders['final'] = [times[-1]]
+
+    files = []
+    for artifact in keep:
+        for name in folders.get(artifact, []):
+            path = os.path.join(case, name)
+            if os.path.isdir(path):
+                files.extend(walk(path))
+            elif os.path.exists(path):
+                files.append(path)
+    if 'logs' in keep and os.path.exists(os.path.join(case, 'liftDrag.png')):
+        files.append(os.path.join(case, 'liftDrag.png'))
+    return [os.path.relpath(path, case) for path in files]
+
+
+def link_or_copy(source, dest):
+    # Hard link where the file system allows it, else copy
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+
+
+def archive_case(case, dest, keep=ARTIFACTS, format='tar.gz', manifest=None):
+    """
+    Save the chosen artifacts of a finished `case` to `dest` (plus the
+    format's extension) as one compressed tar file, or with format 'dir' as
+    hard links in a directory. A manifest.json with the list of files, the
+    mesh checksum and anything in `manifest` goes along with them. The
+    archive only replaces an older one at `dest` once it is complete.
+
+    Returns the path written.
+    """
+    files = select(case, keep)
+    manifest = dict(manifest or {}, case=os.path.abspath(case), files=files)
+    if 'mesh' in keep:
+        manifest['mesh_sha1'] = mesh_checksum(case)
+
+    folder = os.path.dirname(dest)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    path = dest if format == 'dir' else dest + '.' + format
+    tmp = path + '.tmp'
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+
+    if format == 'dir':
+        os.makedirs(tmp)
+        for name in files:
+            target = os.path.join(tmp, name)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            link_or_copy(os.path.join(case, name), target)
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    else:
+        data = json.dumps(manifest, indent=2, sort_keys=True).encode()
+        info = tarfile.TarInfo('manifest.json')
+        info.size, info.mtime = len(data), time.time()
+        with tarfile.open(tmp, FORMATS[format]) as tar:
+            for name in files:
+                tar.add(os.path.join(case, name), arcname=name, recursive=False)
+            tar.addfile(info, io.BytesIO(data))
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive the results of a finished case.")
+    parser.add_argument("case", help="Case directory, e.g. airfoil_pimpleFoam")
+    parser.add_argument("dest", help="Archive path, without extension")
+    parser.add_argument("--keep", default=','.join(ARTIFACTS),
+                        help="Comma-separated artifacts to keep, of " + ', '.join(ARTIFACTS))
+    parser.add_argument("--format", choices=sorted(FORMATS), default='tar.gz')
+    args = parser.parse_args()
+
+    print(archive_case(args.case, args.dest, args.keep.split(','), args.format))
@@ -0,0 +1,81 @@
+from __future__ import division, print_function
+from collections import OrderedDict
+import multiprocessing
+import argparse
+import os
+import foamfile
+
+
+# Fewest cells worth giving an MPI rank. Below this pimpleFoam spends more of
+# each step exchanging processor boundaries than solving.
+CELLS_PER_RANK = 20000
+
+# Decomposition methods to choose from. scotch balances cells and keeps the
+# processor boundaries short without any geometry to go on; hierarchical cuts
+# straight across the plane of the 2D mesh.
+METHODS = ['scotch', 'hierarchical']
+
+
+def ranks(cells, cores, cells_per_rank=CELLS_PER_RANK):
+    # As many ranks as the mesh keeps busy, up to the cores there are
+    return int(max(1, min(cores, cells // cells_per_rank)))
+
+
+def in_plane(n):
+    """
+    Split n ranks as (nx 1 nz), as square as it goes with the longer side
+    along the flow. The mesh is one cell thick in y, the extruded direction,
+    so it is never split that way.
+    """
+    nz = max(d for d in range(1, int(n**0.5) + 1) if n % d == 0)
+    return (n // nz, 1, nz)
+
+
+def choose(cells, cores, method='scotch', cells_per_rank=CELLS_PER_RANK):
+    """
+    Pick the number of ranks for a mesh of `cells` cells given `cores` cores
+    to run it on, and how to split the mesh between them. If the cell count
+    isn't known, all the cores are used. Returns the settings as a dict, with
+    procs = 1 meaning the solver runs on its own without decomposing.
+    """
+    n = ranks(cells, cores, cells_per_rank) if cells else max(1, cores)
+    if method == 'hierarchical':
+        # Drop ranks rather than cut the mesh into long strips
+        while n > 2 and in_plane(n)[0] > 2 * in_plane(n)[2]:
+            n -= 1
+    return OrderedDict([('procs', n), ('method', method if n > 1 else None),
+                        ('n', in_plane(n) if method == 'hierarchical' and n > 1 else None),
+                        ('cells', cells), ('cores', cores),
+                        ('cells_per_rank', cells / n if cells else None)])
+
+
+def contents(settings):
+    # The entries of a decomposeParDict for a set of settings
+    entries = OrderedDict([('numberOfSubdomains', settings['procs']),
+                           ('method', settings['method'])])
+    if settings['method'] in ('simple', 'hierarchical'):
+        coeffs = OrderedDict([('n', tuple(settings['n'])), ('delta', 0.001)])
+        if settings['method'] == 'hierarchical':
+            coeffs['order'] = 'xyz'
+        entries[settings['method'] + 'Coeffs'] = coeffs
+    return entries
+
+
+def write(case, settings):
+    # Write the decomposeParDict of an OpenFOAM case
+    return foamfile.write(os.path.join(case, 'system', 'decomposeParDict'), contents(settings),
+                          'decomposeParDict', location='system')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick the MPI ranks and decomposition for a mesh.")
+    parser.add_argument("cells", type=int, help="Number of cells in the mesh")
+    parser.add_argument("--cores", "-n", type=int, default=multiprocessing.cpu_count(),
+                        help="Cores available to the case")
+    parser.add_argument("--method", choices=METHODS, default='scotch')
+    parser.add_argument("--cells-per-rank", type=int, default=CELLS_PER_RANK)
+    args = parser.parse_args()
+
+    settings = choose(args.cells, args.cores, args.method, args.cells_per_rank)
+    print(foamfile.dumps(contents(settings), 'decomposeParDict', location='system')
+          if settings['procs'] > 1 else 'Run serially.')
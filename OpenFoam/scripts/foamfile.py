@@ -0,0 +1,189 @@
+from __future__ import division, print_function
+from collections import OrderedDict
+import re
+import numpy as np
+
+
+BANNER = """\
+/*--------------------------------*- C++ -*----------------------------------*\\
+| =========                 |                                                 |
+| \\\\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox           |
+|  \\\\    /   O peration     | Version:  2.3.0                                 |
+|   \\\\  /    A nd           | Web:      www.OpenFOAM.org                      |
+|    \\\\/     M anipulation  |                                                 |
+\\*---------------------------------------------------------------------------*/
+"""
+SEPARATOR = "// * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * //\n"
+FOOTER = "// ************************************************************************* //\n"
+
+# Format of every float written, in entries and arrays alike
+FLOAT = '%.8g'
+
+
+class Tokens(tuple):
+    """
+    Items written one after another on a line, e.g. the parts of a block
+    `hex (4 5 1 0 16 17 13 12) (250 100 1) simpleGrading (1 500 1)` or an
+    edge `spline 4 5 <points>`. Plain lists and tuples are written as
+    parenthesised OpenFOAM lists instead.
+    """
+
+    def __new__(cls, *items):
+        return tuple.__new__(cls, items)
+
+
+def scalar(value):
+    if isinstance(value, (bool, np.bool_)):
+        return 'on' if value else 'off'
+    if isinstance(value, (int, np.integer)):
+        return '%d' % value
+    if isinstance(value, (float, np.floating)):
+        return FLOAT % value
+    return str(value)
+
+
+def array(values, indent):
+    """
+    Rows of a 2D array as one `(a b c)` per line, formatted in a single
+    string operation rather than row by row.
+    """
+    values = np.asarray(values)
+    n, k = values.shape
+    fmt = '\n'.join([indent + '(' + ' '.join([FLOAT]*k) + ')']*n)
+    return fmt % tuple(values.ravel()) if n else ''
+
+
+def is_simple(value):
+    # Whether a value fits inline: scalars, vectors, and tokens made of them
+    if isinstance(value, np.ndarray):
+        return value.ndim <= 1
+    if isinstance(value, dict):
+        return False
+    if isinstance(value, Tokens):
+        return all(is_simple(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return all(np.isscalar(v) for v in value)
+    return True
+
+
+def inline(value):
+    # Render a value that fits on one line
+    if isinstance(value, Tokens):
+        return ' '.join(inline(v) for v in value)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return '(' + ' '.join(inline(v) for v in value) + ')'
+    return scalar(value)
+
+
+def value_lines(value, indent):
+    """
+    Lines of a value that needs more than one: a dictionary, a list of
+    non-scalars or a 2D array. The opening bracket goes on its own line at
+    `indent`, the items one level further in.
+    """
+    inner = indent + '    '
+    if isinstance(value, dict):
+        return [indent + '{'] + entries(value, inner) + [indent + '}']
+
+    lines = [indent + '(']
+    if isinstance(value, np.ndarray):
+        if len(value):
+            lines.append(array(value, inner))
+    else:
+        for item in value:
+            lines.extend(item_lines(item, inner))
+    return lines + [indent + ')']
+
+
+def item_lines(item, indent):
+    # An item of a list, or a tokens entry, which may end in a block
+    if is_simple(item):
+        return [indent + inline(item)]
+    if isinstance(item, Tokens):
+        head = [v for v in item if is_simple(v)]
+        tail = [v for v in item if not is_simple(v)]
+        if head and not tail:
+            return [indent + inline(item)]
+        return [indent + inline(Tokens(*head))] + \
+            [line for v in tail for line in value_lines(v, indent)]
+    return value_lines(item, indent)
+
+
+def entries(entries, indent=''):
+    """
+    Lines of `key value;` entries. Keys starting with '#' are directives
+    and get no semicolon, and a value of None leaves just the key.
+    """
+    lines = []
+    for key, value in entries.items():
+        if value is None:
+            lines.append(indent + key)
+        elif key.startswith('#'):
+            lines.append('{}{:<15} {}'.format(indent, key, inline(value)))
+        elif is_simple(value):
+            lines.append('{}{:<15} {};'.format(indent, key, inline(value)))
+        else:
+            # Set blocks apart from their neighbours at the top level
+            if not indent and lines and lines[-1]:
+                lines.append('')
+            lines.append(indent + key)
+            lines.extend(value_lines(value, indent))
+            if not isinstance(value, dict):
+                lines[-1] += ';'
+            if not indent:
+                lines.append('')
+    return lines
+
+
+def header(object, cls='dictionary', location=None):
+    info = [('version', '2.0'), ('format', 'ascii'), ('class', cls)]
+    if location:
+        info.append(('location', '"{}"'.format(location)))
+    info.append(('object', object))
+    return 'FoamFile\n{\n' + ''.join('    {:<11} {};\n'.format(k, v) for k, v in info) + '}\n'
+
+
+def dumps(contents, object=None, cls='dictionary', location=None, banner=True):
+    """
+    Render a whole OpenFOAM file in memory. `contents` is an (ordered)
+    dict of entries; with `object` it gets a FoamFile header, and without
+    `banner` it is bare entries, as for files pulled in with #include.
+    """
+    parts = []
+    if banner:
+        parts.append(BANNER)
+    if object:
+        parts.extend([header(object, cls, location), SEPARATOR])
+    if banner or object:
+        parts.append('\n')
+    parts.append('\n'.join(entries(contents)).rstrip('\n') + '\n')
+    if banner:
+        parts.extend(['\n', FOOTER])
+    return ''.join(parts)
+
+
+def write(path, contents, object=None, **kwds):
+    # Render and write in one go
+    txt = dumps(contents, object, **kwds)
+    with open(path, 'w') as f:
+        f.write(txt)
+    return txt
+
+
+def replace_entries(txt, values):
+    """
+    Set `key value;` entries that already exist in the text of an OpenFOAM
+    file, at whatever depth they are. Keys that don't appear are left out.
+    """
+    for key, value in values.items():
+        txt = re.sub(r'(^\s*' + re.escape(key) + r'\s+)[^;{]*;', lambda m: m.group(1) + inline(value) + ';',
+                     txt, flags=re.M)
+    return txt
+
+
+def update(path, values):
+    # Set entries of an existing file in place
+    with open(path) as f:
+        txt = f.read()
+    with open(path, 'w') as f:
+        f.write(replace_entries(txt, values))
@@ -0,0 +1,230 @@
+from __future__ import division, print_function
+import argparse
+import math
+import os
+import numpy as np
+
+from monitor import read_entry
+
+
+class Tail(object):
+    """
+    Follow a whitespace-separated OpenFOAM function object file such as
+    forceCoeffs.dat or forces.dat, returning only the rows added since the
+    last read. Parentheses around vectors are dropped, so every row comes
+    back as a flat list of floats.
+    """
+
+    def __init__(self, path, chunk=1 << 16):
+        self.path = path
+        self.chunk = chunk
+        self.offset = 0
+        self.partial = ''
+
+    def rows(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            f.seek(self.offset)
+            while True:
+                data = f.read(self.chunk)
+                if not data:
+                    break
+                lines = (self.partial + data).split('\n')
+                self.partial = lines.pop()
+                for line in lines:
+                    if line.strip() and not line.startswith('#'):
+                        yield [float(v) for v in line.replace('(', ' ').replace(')', ' ').split()]
+            self.offset = f.tell()
+
+
+class RunningStats(object):
+    """
+    Mean, spread, drift and oscillation frequency of a time series, updated
+    one sample at a time in constant memory. Samples before `start` are
+    ignored so the initial transient doesn't count.
+    """
+
+    def __init__(self, start=0):
+        self.start = start
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.low, self.high = float('inf'), -float('inf')
+        self.t0 = self.t = None
+        self.st = self.stt = self.stx = 0.0
+        self.above = None
+        self.crossings = 0
+        self.first_crossing = self.last_crossing = None
+
+    def add(self, t, x):
+        if t < self.start:
+            return
+        if self.t0 is None:
+            self.t0 = t
+        self.t = t
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta/self.n
+        self.m2 += delta*(x - self.mean)
+        self.low, self.high = min(self.low, x), max(self.high, x)
+
+        # Sums for a least squares slope, with time measured from the first
+        # sample to keep them well conditioned
+        s = t - self.t0
+        self.st += s
+        self.stt += s*s
+        self.stx += s*delta
+
+        # Count upward crossings of the mean so far
+        above = x >= self.mean
+        if self.above is False and above:
+            self.crossings += 1
+            if self.first_crossing is None:
+                self.first_crossing = t
+            self.last_crossing = t
+        self.above = above
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2/self.n) if self.n else float('nan')
+
+    @property
+    def amplitude(self):
+        return (self.high - self.low)/2 if self.n else float('nan')
+
+    @property
+    def drift(self):
+        """
+        Change in the value over the averaging window from a straight line
+        fit, which stays near zero once the series has converged.
+        """
+        if self.n < 2:
+            return float('nan')
+        var = self.stt - self.st**2/self.n
+        slope = self.stx/var if var > 0 else 0.0
+        return slope*(self.t - self.t0)
+
+    @property
+    def frequency(self):
+        if self.crossings < 2:
+            return float('nan')
+        return (self.crossings - 1)/(self.last_crossing - self.first_crossing)
+
+
+def read_vector(path, key):
+    return np.array([float(v) for v in read_entry(path, key).strip().strip('()').split()])
+
+
+class CaseResults(object):
+    """
+    Streaming summary of one solver stage's force output: mean Cl, Cd and Cm,
+    pressure drag CDp (from forces.dat), Strouhal number and convergence
+    statistics, averaged over the part of the run after `start` (a fraction
+    of `end`, which defaults to endTime but should be the time the solver
+    stopped if it was stopped early). Call `update` as often as wanted while
+    the solver runs.
+    """
+
+    def __init__(self, stage, start=0.5, end=None, chord=1.0):
+        self.stage = stage
+        self.chord = chord
+        self.coeffs = Tail(os.path.join(stage, 'postProcessing', 'forceCoeffs', '0', 'forceCoeffs.dat'))
+        self.forces = Tail(os.path.join(stage, 'postProcessing', 'forces', '0', 'forces.dat'))
+
+        system = os.path.join(stage, 'system')
+        if end is None:
+            end = float(read_entry(os.path.join(system, 'controlDict'), 'endTime'))
+        start *= end
+        self.Cl, self.Cd, self.Cm, self.Fp = [RunningStats(start) for _ in range(4)]
+
+        # Reference values used by forceCoeffs, to scale the pressure drag
+        path = os.path.join(system, 'forceCoeffs')
+        self.dragDir = read_vector(path, 'dragDir')
+        self.magUInf = float(read_entry(path, 'magUInf'))
+        self.q = 0.5*float(read_entry(path, 'rhoInf'))*self.magUInf**2*float(read_entry(path, 'Aref'))
+
+    def update(self):
+        for row in self.coeffs.rows():
+            t, Cm, Cd, Cl = row[:4]
+            self.Cl.add(t, Cl)
+            self.Cd.add(t, Cd)
+            self.Cm.add(t, Cm)
+        for row in self.forces.rows():
+            # Time, then pressure, viscous and porous force vectors
+            self.Fp.add(row[0], np.dot(row[1:4], self.dragDir))
+        return self
+
+    def summary(self):
+        return dict(CL=self.Cl.mean if self.Cl.n else float('nan'),
+                    CD=self.Cd.mean if self.Cd.n else float('nan'),
+                    CDp=self.Fp.mean/self.q if self.Fp.n else float('nan'),
+                    CM=self.Cm.mean if self.Cm.n else float('nan'),
+                    St=self.Cl.frequency*self.chord/self.magUInf,
+                    CL_amp=self.Cl.amplitude,
+                    CL_std=self.Cl.std,
+                    CL_drift=self.Cl.drift,
+                    samples=self.Cl.n,
+                    time=self.Cl.t)
+
+
+# Columns of an XFOIL polar, followed by the extra statistics we have
+columns = ['alpha', 'CL', 'CD', 'CDp', 'CM', 'Top_Xtr', 'Bot_Xtr',
+           'St', 'CL_amp', 'CL_std', 'CL_drift']
+
+
+def append_polar(path, foil, Reynolds, alpha, summary, Mach=0.0):
+    """
+    Add one case to a polar file laid out like an XFOIL PACC file, so it
+    loads with the XFOIL scripts' `load_df`. Transition locations are not
+    known and are written as nan. Cases finish in any order, so the rows
+    are kept sorted by alpha, and a case run again replaces its old row.
+    """
+    if not os.path.exists(path):
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        exponent = int(math.floor(math.log10(Reynolds))) if Reynolds > 0 else 0
+        with open(path, 'w') as f:
+            f.write('\n'.join([
+                ' ',
+                '       OpenFOAM      pimpleFoam',
+                ' ',
+                ' Calculated polar for: NACA ' + foil,
+                ' ',
+                ' 1 1 Reynolds number fixed          Mach number fixed',
+                ' ',
+                ' xtrf =   1.000 (top)        1.000 (bottom)',
+                ' Mach = {:7.3f}     Re = {:9.3f} e {:d}     Ncrit =   9.000'.format(
+                    Mach, Reynolds/10**exponent, exponent),
+                ' ',
+                '  ' + ' '.join('{:>9}'.format(c) for c in columns),
+                '  ' + ' '.join(['-'*9]*len(columns))]) + '\n')
+
+    values = dict(summary, alpha=alpha)
+    row = '  ' + ' '.join('{:9.5f}'.format(float(values.get(c, float('nan'))))
+                          for c in columns) + '\n'
+
+    # Rewrite the file with the row in its place
+    with open(path) as f:
+        lines = f.readlines()
+    start = next(i for i, line in enumerate(lines) if line.strip().startswith('---')) + 1
+    rows = [line for line in lines[start:]
+            if line.strip() and line.split()[0] != row.split()[0]] + [row]
+    rows.sort(key=lambda line: float(line.split()[0]))
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.writelines(lines[:start] + rows)
+    os.rename(tmp, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise the force coefficients of a solver run.")
+    parser.add_argument("stage", nargs='?', default="airfoil_pimpleFoam",
+                        help="Case directory holding postProcessing/forceCoeffs")
+    parser.add_argument("--start", type=float, default=0.5,
+                        help="Part of endTime to skip before averaging.")
+    args = parser.parse_args()
+
+    for key, value in sorted(CaseResults(args.stage, args.start).update().summary().items()):
+        print("{:9} {}".format(key, value))
@@ -0,0 +1,92 @@
+from __future__ import division, print_function
+import numpy as np
+
+
+def digits(foils):
+    """
+    Split NACA 4-digit designations into arrays of max. camber m, its
+    position p and thickness t, all as fractions of the chord.
+    """
+    foils = [foils] if isinstance(foils, str) else list(foils)
+    NACA = np.array([[int(d) for d in foil] for foil in foils], dtype=float)
+    return NACA[:, 0]/100, NACA[:, 1]/10, (NACA[:, 2]*10 + NACA[:, 3])/100
+
+
+def spacing(Ni, c=1):
+    # Cosine-spaced x-coordinates, clustered at the leading and trailing edge
+    beta = np.linspace(0, np.pi, Ni)
+    return c*(0.5*(1 - np.cos(beta)))
+
+
+def thickness(t, x, c=1):
+    # Calculate thickness
+    # The upper expression will give the airfoil a finite thickness at the trailing
+    # edge, witch might cause trouble. The lower expression is corrected to give
+    # zero thickness at the trailing edge, but the foil is strictly speaking no
+    # longer a proper NACA airfoil.
+    #
+    # See http://turbmodels.larc.nasa.gov/naca4412sep_val.html
+    #     http://en.wikipedia.org/wiki/NACA_airfoil
+
+    #z_t = (t*c/0.2) * (0.2969*(x/c)**0.5 - 0.1260*(x/c) - 0.3516*(x/c)**2 + 0.2843*(x/c)**3 - 0.1015*(x/c)**4)
+    return (t*c/0.2)*(0.2969*(x/c)**0.5 - 0.1260*(x/c) - 0.3516*(x/c)**2
+                      + 0.2843*(x/c)**3 - 0.1036*(x/c)**4)
+
+
+def camber(m, p, x, c=1):
+    """
+    Camber line z_c and its slope angle theta. Foils with p = 0 are
+    symmetric and get a flat camber line.
+    """
+    # Any p works for symmetric foils as long as it avoids dividing by zero
+    cambered = p > 0
+    p = np.where(cambered, p, 0.5)
+    front = x < p*c
+
+    z_c = np.where(front,
+                   (m*x/p**2)*(2*p - x/c),
+                   (m*(c - x)/(1 - p)**2)*(1 + x/c - 2*p))
+    theta = np.where(front,
+                     np.arctan((m/p**2)*(2*p - 2*x/c)),
+                     np.arctan((m/(1 - p)**2)*(-2*x/c + 2*p)))
+    return z_c*cambered, theta*cambered
+
+
+def naca4(m, p, t, alpha_deg=0, Ni=400, c=1, dtype=np.float64):
+    """
+    Upper and lower surface coordinates of NACA 4-digit foils rotated to each
+    angle of attack.
+
+    `m`, `p` and `t` are arrays over foils (see `digits`) and `alpha_deg` an
+    array of angles. Returns `upper` and `lower`, each of shape
+    (n_foils, n_alpha, Ni, 2) holding (x, z) from leading to trailing edge.
+    """
+    m, p, t = [np.reshape(np.asarray(v, dtype=float), (-1, 1)) for v in (m, p, t)]
+    alpha = np.deg2rad(np.reshape(np.asarray(alpha_deg, dtype=float), (1, -1, 1)))
+    x = spacing(Ni, c)
+
+    z_t = thickness(t, x, c)
+    z_c, theta = camber(m, p, x, c)
+
+    # Calculate coordinates of upper and lower surface
+    Xu, Zu = x - z_t*np.sin(theta), z_c + z_t*np.cos(theta)
+    Xl, Zl = x + z_t*np.sin(theta), z_c - z_t*np.cos(theta)
+
+    # Rotate foil to specified angle of attack
+    cos, sin = np.cos(alpha), np.sin(alpha)
+
+    def rotate(X, Z):
+        X, Z = X[:, None, :], Z[:, None, :]
+        return np.stack((cos*X + sin*Z, -sin*X + cos*Z), axis=-1).astype(dtype)
+
+    return rotate(Xu, Zu), rotate(Xl, Zl)
+
+
+def outline(upper, lower):
+    """
+    Merge upper and lower surfaces into one closed loop, running from the
+    leading edge along the upper surface and back along the lower one.
+    The trailing and leading edge points are not repeated (NB: assumes a
+    sharp trailing edge, see `thickness`).
+    """
+    return np.concatenate((upper, lower[..., -2:0:-1, :]), axis=-2)
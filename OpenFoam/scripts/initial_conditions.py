@@ -1,23 +1,74 @@
+from collections import OrderedDict
 import argparse
+import re
 import os
+import numpy as np
+from foamfile import Tokens
+import foamfile
 
 
 # Chord length
 c = 1
 
-def set_initial_conditions(U=1, pressure=0, turbulentKE=1e-3, turbulentOmega=1.0):
-    values = {'flowVelocity': '(' + "{:.4e}".format(U) + ' 0 0)',
-              'pressure': str(pressure),
-              'turbulentKE': str(turbulentKE),
-              'turbulentOmega': str(turbulentOmega)}
+# Far-field conditions on the top and bottom of the domain. Slip is fine while
+# the flow runs parallel to them, but once the flow is rotated to set the angle
+# of attack it has to be able to cross them.
+far_field = {False: {'farFieldU': {'type': 'slip'},
+                     'farFieldP': {'type': 'slip'}},
+             True: {'farFieldU': OrderedDict([('type', 'freestream'),
+                                              ('freestreamValue', Tokens('uniform', '$flowVelocity'))]),
+                    'farFieldP': {'type': 'zeroGradient'}}}
 
-    path = os.getcwd() + '/airfoil_simpleFoam/0.org/include/initialConditions'
-    template_path = path + '.template'
+def set_initial_conditions(U=1, pressure=0, turbulentKE=1e-3, turbulentOmega=1.0,
+                           alpha=0):
+    """
+    Write the initial conditions. A nonzero `alpha` (in degrees) turns the
+    flow velocity instead of the foil, so one mesh serves every angle.
+    """
+    a = np.deg2rad(alpha)
+    values = OrderedDict([('flowVelocity', (U*np.cos(a), 0, U*np.sin(a))),
+                          ('pressure', pressure),
+                          ('turbulentKE', turbulentKE),
+                          ('turbulentOmega', turbulentOmega),
+                          ('#inputMode', 'merge')])
+
+    folder = os.getcwd() + '/airfoil_simpleFoam/0.org/include/'
     print("Setting initial conditions.")
-    with open(template_path) as f:
+    foamfile.write(folder + 'initialConditions', values)
+
+    for name, entry in far_field[alpha != 0].items():
+        foamfile.write(folder + name, entry, banner=False)
+
+def set_force_directions(alpha=0):
+    """
+    Point liftDir and dragDir across and along the (rotated) flow.
+    """
+    a = np.deg2rad(alpha)
+    directions = {'liftDir': (-np.sin(a), 0, np.cos(a)),
+                  'dragDir': (np.cos(a), 0, np.sin(a))}
+    if alpha == 0:
+        directions = {'liftDir': (0, 0, 1), 'dragDir': (1, 0, 0)}
+
+    for case in ['airfoil_simpleFoam', 'airfoil_pimpleFoam']:
+        foamfile.update(os.getcwd() + '/' + case + '/system/forceCoeffs', directions)
+
+def restore_inflow():
+    """
+    Put the flow velocity from the initial conditions back on the inlet and
+    far field of `0/U`. mapFields overwrites them along with the internal
+    field, which matters when the source case had its flow at another angle.
+    """
+    case = os.getcwd() + '/airfoil_simpleFoam/'
+    with open(case + '0.org/include/initialConditions') as f:
+        U = re.search(r'flowVelocity\s+(\([^)]*\));', f.read()).group(1)
+
+    with open(case + '0/U') as f:
         txt = f.read()
-    with open(path, "w") as f:
-        f.write(txt.format(**values))
+    for patch, key in [('inlet', 'value'), ('topAndBottom', 'freestreamValue')]:
+        txt = re.sub(r'(\n\s*' + patch + r'\s*\{[^}]*?\b' + key + r'\s+)[^;]*;',
+                     r'\g<1>uniform ' + U + ';', txt)
+    with open(case + '0/U', "w") as f:
+        f.write(txt)
 
 def set_Re(U, Re):
     """
@@ -25,22 +76,29 @@ def set_Re(U, Re):
     the input files.
     """
     path = os.getcwd() + '/airfoil_simpleFoam/constant/transportProperties'
-    template_path = path + '.template'
 
     nu = U*c/Re
     print("Settings:\nReynolds={:.4e}\nVelocity={:.4e}\nnu={:.4e}".format(Re, U, nu))
     nu = "{:.4e}".format(nu)
 
-    with open(template_path) as f:
-        txt = f.read()
-    with open(path, "w") as f:
-        f.write(txt.format(nu=nu))
+    foamfile.write(path, OrderedDict([('transportModel', 'Newtonian'),
+                                      ('nu', Tokens('nu', '[0 2 -1 0 0 0 0]', nu))]),
+                   'transportProperties')
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Set the initial conditions.")
     parser.add_argument("--Reynolds", "-R", type=float, default=6e6)
     parser.add_argument("--U", "-U", type=float, default=1)
+    parser.add_argument("--alpha", "-a", type=float, default=0,
+                        help="Angle of attack set by rotating the flow (deg)")
+    parser.add_argument("--restore-inflow", action="store_true",
+                        help="Only reset the inflow in 0/U after mapping fields into it")
     args = parser.parse_args()
 
-    set_initial_conditions(U=args.U)
+    if args.restore_inflow:
+        restore_inflow()
+        raise SystemExit
+
+    set_initial_conditions(U=args.U, alpha=args.alpha)
+    set_force_directions(args.alpha)
     set_Re(args.U, args.Reynolds)
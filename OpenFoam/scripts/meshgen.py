@@ -1,17 +1,21 @@
 from __future__ import division, print_function
+from collections import OrderedDict
 import argparse
 import numpy as np
-from numpy import linspace, zeros, ones, sin, cos, arctan, pi
+from numpy import zeros, ones, sin, cos, pi
+from geometry import digits, spacing, thickness, camber, naca4
+from foamfile import Tokens
+import foamfile
 
 
-def gen_blockmeshdict(foil="0012", alpha_deg=4):
+def gen_blockmeshdict(foil="0012", alpha_deg=4, path="constant/polyMesh/blockMeshDict", Ni=400):
     """
-    Write a `blockMeshDict` for a NACA foil at specified angle of attack.
+    Write a `blockMeshDict` for a NACA foil at specified angle of attack to
+    `path`, or with `path=None` only return its text.
     """
     # Foil geometry
     c = 1.0              # Geometric chord length
     alpha = np.deg2rad(alpha_deg)  # Angle of attack (in radians)
-    NACA = [int(d) for d in foil]  # NACA 4-digit designation
 
     # Mesh dimensions
     scale = 1            # Scaling factor
@@ -20,7 +24,7 @@ def gen_blockmeshdict(foil="0012", alpha_deg=4):
     D = 16               # Length of downstream section
 
     # Mesh resolution parameters
-    Ni = 400             # Number of interpolation points along the foil
+    Ni = int(Ni)         # Number of interpolation points along the foil
     Nx = 250             # Number of mesh cells along the foil
     ND = 150             # Number of cells in the downstream direction
     NT = 100             # Number of cells the transverse direction
@@ -34,68 +38,21 @@ def gen_blockmeshdict(foil="0012", alpha_deg=4):
     # ------------------------- END OF MESH PARAMETER REGION --------------------- #
 
 
-    # Create a vector with x-coordinates, camber and thickness
-    beta = linspace(0, pi, Ni)
-    x = c*(0.5*(1 - cos(beta)))
-    z_c = zeros(len(x))
-    z_t = zeros(len(x))
-    theta = zeros(len(x))
+    # Calculate coordinates of upper and lower surface, rotated to reach
+    # specified angle of attack
+    m, p, t = digits(foil)
+    upper, lower = naca4(m, p, t, alpha_deg, Ni, c)
+    Xu, Zu = upper[0, 0].T
+    Xl, Zl = lower[0, 0].T
 
-
-    # Values of m, p and t
-    m = NACA[0]/100
-    p = NACA[1]/10
-    t = (NACA[2]*10 + NACA[3])/100
-
-
-    # Calculate thickness
-    # The upper expression will give the airfoil a finite thickness at the trailing
-    # edge, witch might cause trouble. The lower expression is correxted to give
-    # zero thickness at the trailing edge, but the foil is strictly speaking no
-    # longer a proper NACA airfoil.
-    #
-    # See http://turbmodels.larc.nasa.gov/naca4412sep_val.html
-    #     http://en.wikipedia.org/wiki/NACA_airfoil
-
-    #y_t = (t*c/0.2) * (0.2969*(x/c)**0.5 - 0.1260*(x/c) - 0.3516*(x/c)**2 + 0.2843*(x/c)**3 - 0.1015*(x/c)**4)
-    z_t = (t*c/0.2)*(0.2969*(x/c)**0.5 - 0.1260*(x/c) - 0.3516*(x/c)**2 \
-           + 0.2843*(x/c)**3 - 0.1036*(x/c)**4)
-
-    if p > 0:
-        # Calculate camber
-        z_c += (m*x/p**2)*(2*p - x/c)*(x < p*c)
-        z_c += (m*(c-x)/(1 - p)**2)*(1 + x/c - 2*p)*(x >= p*c)
-        # Calculate theta-value
-        theta += arctan((m/p**2) * (2*p - 2*x/c))*(x < p*c)
-        theta += arctan((m/(1 - p)**2) * (-2*x/c + 2*p))*(x >= p*c)
-
-
-    # Calculate coordinates of upper surface
-    Xu = x - z_t*sin(theta)
-    Zu = z_c + z_t*cos(theta)
-
-
-    # Calculate coordinates of lower surface
-    Xl = x + z_t*sin(theta)
-    Zl = z_c - z_t*cos(theta)
-
-
-    # Rotate foil to reach specified angle of attack
-    upper = np.matrix([[cos(alpha), sin(alpha)],
-                       [-sin(alpha), cos(alpha)]])*np.vstack((Xu, Zu))
-    lower = np.matrix([[cos(alpha), sin(alpha)],
-                      [-sin(alpha), cos(alpha)]])*np.vstack((Xl, Zl))
-
-    Xu = upper[0, :].conj().transpose()
-    Zu = upper[1, :].conj().transpose()
-    Xl = lower[0, :].conj().transpose()
-    Zl = lower[1, :].conj().transpose()
-
-    if p > 0:
+    x = spacing(Ni, c)
+    if p[0] > 0:
         # Find index i of max. camber
+        z_c, _ = camber(m[0], p[0], x, c)
         C_max_idx = np.where(z_c == max(z_c))[0][0]
     else:
         # Otherwise use location of max. thickness
+        z_t = thickness(t[0], x, c)
         C_max_idx = np.where(z_t == max(z_t))[0][0]
 
 
@@ -107,7 +64,7 @@ def gen_blockmeshdict(foil="0012", alpha_deg=4):
     # Calculate the location of the vertices on the positive y-axis and put them in a matrix
     vertices = zeros((12, 3))
 
-    vertices[0, :] = [NoseX[0], W, NoseZ[0]]
+    vertices[0, :] = [NoseX, W, NoseZ]
     vertices[1, :] = [Xu[C_max_idx], W, H]
     vertices[2, :] = [Xu[-1], W, H]
     vertices[3, :] = [D, W, H]
@@ -127,33 +84,33 @@ def gen_blockmeshdict(foil="0012", alpha_deg=4):
 
 
     # Edge 4-5 and 16-17
-    pts1 = np.concatenate([Xu[1:C_max_idx], W*ones(np.shape(Xu[1:C_max_idx])),
-                           Zu[1:C_max_idx]], axis=1)
-    pts5 = np.concatenate([pts1[:, 0], -pts1[:, 1], pts1[:, 2]], axis=1)
+    pts1 = np.column_stack([Xu[1:C_max_idx], W*ones(C_max_idx - 1),
+                            Zu[1:C_max_idx]])
+    pts5 = pts1*[1, -1, 1]
 
     # Edge 5-7 and 17-19
-    pts2 = np.concatenate([Xu[C_max_idx + 1:Ni - 1],
-                           W*ones(np.shape(Xu[C_max_idx + 1:Ni - 1])),
-                           Zu[C_max_idx + 1:Ni - 1]], axis=1)
-    pts6 = np.concatenate([pts2[:, 0], -pts2[:, 1], pts2[:, 2]], axis=1)
+    pts2 = np.column_stack([Xu[C_max_idx + 1:Ni - 1],
+                            W*ones(Ni - C_max_idx - 2),
+                            Zu[C_max_idx + 1:Ni - 1]])
+    pts6 = pts2*[1, -1, 1]
 
     # Edge 4-6 and 16-18
-    pts3 = np.concatenate([Xl[1:C_max_idx], W*ones(np.shape(Xl[1:C_max_idx])),
-                           Zl[1:C_max_idx]], axis=1)
-    pts7 = np.concatenate([pts3[:, 0], -pts3[:, 1], pts3[:, 2]], axis=1)
+    pts3 = np.column_stack([Xl[1:C_max_idx], W*ones(C_max_idx - 1),
+                            Zl[1:C_max_idx]])
+    pts7 = pts3*[1, -1, 1]
 
     # Edge 6-7 and 18-19
-    pts4 = np.concatenate([Xl[C_max_idx + 1:Ni - 1],
-                          W*ones(np.shape(Xl[C_max_idx + 1:Ni - 1])),
-                          Zl[C_max_idx + 1:Ni - 1]], axis=1)
-    pts8 = np.concatenate([pts4[:, 0], -pts4[:, 1], pts4[:, 2]], axis=1)
+    pts4 = np.column_stack([Xl[C_max_idx + 1:Ni - 1],
+                            W*ones(Ni - C_max_idx - 2),
+                            Zl[C_max_idx + 1:Ni - 1]])
+    pts8 = pts4*[1, -1, 1]
 
     # Edge 0-1 and 12-13
-    pts9 = np.array([-H*cos(pi/4) + Xu[C_max_idx, 0], W, H*sin(pi/4)])
+    pts9 = np.array([-H*cos(pi/4) + Xu[C_max_idx], W, H*sin(pi/4)])
     pts11 = np.array([pts9[0], -pts9[1], pts9[2]])
 
     # Edge 0-9 and 12-21
-    pts10 = np.array([-H*cos(pi/4) + Xu[C_max_idx, 0], W, -H*sin(pi/4)])
+    pts10 = np.array([-H*cos(pi/4) + Xu[C_max_idx], W, -H*sin(pi/4)])
     pts12 = np.array([pts10[0], -pts10[1], pts10[2]])
 
     # Calculate number of mesh points along 4-5 and 4-6
@@ -163,163 +120,46 @@ def gen_blockmeshdict(foil="0012", alpha_deg=4):
     # Calculate number of mesh points along 5-7 and 6-7
     Ntrailing = Nx - Nleading
 
-    # Open file
-    f = open("constant/polyMesh/blockMeshDict", "w")
-
-
-    # Write file
-    f.write("/*--------------------------------*- C++ -*----------------------------------*\\ \n")
-    f.write("| =========                 |                                                 | \n")
-    f.write("| \\\\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox           | \n")
-    f.write("|  \\\\    /   O peration     | Version:  2.1.0                                 | \n")
-    f.write("|   \\\\  /    A nd           | Web:      www.OpenFOAM.com                      | \n")
-    f.write("|    \\\\/     M anipulation  |                                                 | \n")
-    f.write("\\*---------------------------------------------------------------------------*/ \n")
-    f.write("FoamFile                                                                        \n")
-    f.write("{                                                                               \n")
-    f.write("    version     2.0;                                                            \n")
-    f.write("    format      ascii;                                                          \n")
-    f.write("    class       dictionary;                                                     \n")
-    f.write("    object      blockMeshDict;                                                  \n")
-    f.write("}                                                                               \n")
-    f.write("// * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * // \n")
-    f.write("\n")
-    f.write("convertToMeters %f; \n" % scale)
-    f.write("\n")
-    f.write("vertices \n")
-    f.write("( \n")
-    for vertex in vertices:
-        f.write("    (%f %f %f)\n" % tuple(vertex))
-    f.write("); \n")
-    f.write("\n")
-    f.write("blocks \n")
-    f.write("( \n")
-    f.write("    hex (4 5 1 0 16 17 13 12)     (%i %i %i) edgeGrading (1 %f %f 1 %f %f %f %f 1 1 1 1) \n" % (Nleading, NT, NW, 1/ExpArc, 1/ExpArc, ExpT, ExpT, ExpT, ExpT))
-    f.write("    hex (5 7 2 1 17 19 14 13)     (%i %i %i) simpleGrading (1 %f 1) \n" % (Ntrailing, NT, NW, ExpT))
-    f.write("    hex (7 8 3 2 19 20 15 14)     (%i %i %i) simpleGrading (%f %f 1) \n" % (ND, NT, NW, ExpD, ExpT))
-    f.write("    hex (16 18 21 12 4 6 9 0)     (%i %i %i) edgeGrading (1 %f %f 1 %f %f %f %f 1 1 1 1) \n" % (Nleading, NT, NW, 1/ExpArc, 1/ExpArc, ExpT, ExpT, ExpT, ExpT))
-    f.write("    hex (18 19 22 21 6 7 10 9)    (%i %i %i) simpleGrading (1 %f 1) \n" % (Ntrailing, NT, NW, ExpT))
-    f.write("    hex (19 20 23 22 7 8 11 10)   (%i %i %i) simpleGrading (%f %f 1) \n" % (ND, NT, NW, ExpD, ExpT))
-
-    f.write("); \n")
-    f.write("\n")
-    f.write("edges \n")
-    f.write("( \n")
-
-    f.write("    spline 4 5 \n")
-    f.write("        ( \n")
-    for pt in np.array(pts1):
-        f.write("            (%f %f %f) \n" % tuple(pt))
-    f.write("        ) \n")
-
-    f.write("    spline 5 7 \n")
-    f.write("        ( \n")
-    for pt in np.array(pts2):
-        f.write("            (%f %f %f)\n" % tuple(pt))
-    f.write("        ) \n")
-
-    f.write("    spline 4 6 \n")
-    f.write("        ( \n")
-    for pt in np.array(pts3):
-        f.write("            (%f %f %f)\n" % tuple(pt))
-    f.write("        ) \n")
-
-    f.write("    spline 6 7 \n")
-    f.write("        ( \n")
-    for pt in np.array(pts4):
-        f.write("            (%f %f %f)\n" % tuple(pt))
-    f.write("        ) \n")
-
-    f.write("    spline 16 17 \n")
-    f.write("        ( \n")
-    for pt in np.array(pts5):
-        f.write("            (%f %f %f)\n" % tuple(pt))
-    f.write("        ) \n")
-
-    f.write("    spline 17 19 \n")
-    f.write("        ( \n")
-    for pt in np.array(pts6):
-        f.write("            (%f %f %f)\n" % tuple(pt))
-    f.write("        ) \n")
-
-    f.write("    spline 16 18 \n")
-    f.write("        ( \n")
-    for pt in np.array(pts7):
-        f.write("            (%f %f %f)\n" % tuple(pt))
-    f.write("        ) \n")
-
-    f.write("    spline 18 19 \n")
-    f.write("        ( \n")
-    for pt in np.array(pts8):
-        f.write("            (%f %f %f)\n" % tuple(pt))
-    f.write("        ) \n")
-
-    f.write("    arc 0 1 (%f %f %f) \n" % tuple(pts9))
-    f.write("    arc 0 9 (%f %f %f) \n" % tuple(pts10))
-    f.write("    arc 12 13 (%f %f %f) \n" % tuple(pts11))
-    f.write("    arc 12 21 (%f %f %f) \n" % tuple(pts12))
-
-    f.write("); \n")
-    f.write("\n")
-    f.write("boundary \n")
-    f.write("( \n")
-
-    f.write("    inlet \n")
-    f.write("    { \n")
-    f.write("        type patch; \n")
-    f.write("        faces \n")
-    f.write("        ( \n")
-    f.write("            (1 0 12 13) \n")
-    f.write("            (0 9 21 12) \n")
-    f.write("        ); \n")
-    f.write("    } \n")
-    f.write("\n")
-
-    f.write("    outlet \n")
-    f.write("    { \n")
-    f.write("        type patch; \n")
-    f.write("        faces \n")
-    f.write("        ( \n")
-    f.write("            (11 8 20 23) \n")
-    f.write("            (8 3 15 20) \n")
-    f.write("        ); \n")
-    f.write("    } \n")
-    f.write("\n")
-
-    f.write("    topAndBottom \n")
-    f.write("    { \n")
-    f.write("        type patch; \n")
-    f.write("        faces \n")
-    f.write("        ( \n")
-    f.write("            (3 2 14 15) \n")
-    f.write("            (2 1 13 14) \n")
-    f.write("            (9 10 22 21) \n")
-    f.write("            (10 11 23 22) \n")
-    f.write("        ); \n")
-    f.write("    } \n")
-    f.write("\n")
-
-    f.write("    airfoil \n")
-    f.write("    { \n")
-    f.write("        type wall; \n")
-    f.write("        faces \n")
-    f.write("        ( \n")
-    f.write("            (5 4 16 17) \n")
-    f.write("            (7 5 17 19) \n")
-    f.write("            (4 6 18 16) \n")
-    f.write("            (6 7 19 18) \n")
-    f.write("        ); \n")
-    f.write("    } \n")
-    f.write("); \n")
-    f.write(" \n")
-    f.write("mergePatchPairs \n")
-    f.write("( \n")
-    f.write("); \n")
-    f.write(" \n")
-    f.write("// ************************************************************************* // \n")
-
-    # Close file
-    f.close()
+    grading = (1, 1/ExpArc, 1/ExpArc, 1, ExpT, ExpT, ExpT, ExpT, 1, 1, 1, 1)
+    blocks = [
+        Tokens('hex', (4, 5, 1, 0, 16, 17, 13, 12), (Nleading, NT, NW), 'edgeGrading', grading),
+        Tokens('hex', (5, 7, 2, 1, 17, 19, 14, 13), (Ntrailing, NT, NW), 'simpleGrading', (1, ExpT, 1)),
+        Tokens('hex', (7, 8, 3, 2, 19, 20, 15, 14), (ND, NT, NW), 'simpleGrading', (ExpD, ExpT, 1)),
+        Tokens('hex', (16, 18, 21, 12, 4, 6, 9, 0), (Nleading, NT, NW), 'edgeGrading', grading),
+        Tokens('hex', (18, 19, 22, 21, 6, 7, 10, 9), (Ntrailing, NT, NW), 'simpleGrading', (1, ExpT, 1)),
+        Tokens('hex', (19, 20, 23, 22, 7, 8, 11, 10), (ND, NT, NW), 'simpleGrading', (ExpD, ExpT, 1))]
+
+    edges = [Tokens('spline', 4, 5, pts1), Tokens('spline', 5, 7, pts2),
+             Tokens('spline', 4, 6, pts3), Tokens('spline', 6, 7, pts4),
+             Tokens('spline', 16, 17, pts5), Tokens('spline', 17, 19, pts6),
+             Tokens('spline', 16, 18, pts7), Tokens('spline', 18, 19, pts8),
+             Tokens('arc', 0, 1, pts9), Tokens('arc', 0, 9, pts10),
+             Tokens('arc', 12, 13, pts11), Tokens('arc', 12, 21, pts12)]
+
+    def patch(name, type, faces):
+        return Tokens(name, OrderedDict([('type', type), ('faces', faces)]))
+
+    boundary = [
+        patch('inlet', 'patch', [(1, 0, 12, 13), (0, 9, 21, 12)]),
+        patch('outlet', 'patch', [(11, 8, 20, 23), (8, 3, 15, 20)]),
+        patch('topAndBottom', 'patch', [(3, 2, 14, 15), (2, 1, 13, 14),
+                                        (9, 10, 22, 21), (10, 11, 23, 22)]),
+        patch('airfoil', 'wall', [(5, 4, 16, 17), (7, 5, 17, 19),
+                                  (4, 6, 18, 16), (6, 7, 19, 18)])]
+
+    contents = OrderedDict([('convertToMeters', scale),
+                            ('vertices', vertices),
+                            ('blocks', blocks),
+                            ('edges', edges),
+                            ('boundary', boundary),
+                            ('mergePatchPairs', [])])
+
+    # Render the whole file at once, and only write it out when asked to
+    txt = foamfile.dumps(contents, 'blockMeshDict', location='constant/polyMesh')
+    if path:
+        with open(path, "w") as f:
+            f.write(txt)
+    return txt
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Plotting results")
@@ -0,0 +1,140 @@
+from __future__ import division, print_function
+from collections import deque
+import threading
+import re
+import os
+import numpy as np
+import foamfile
+
+
+# Solvers run by Allrun, in order, each writing its own forceCoeffs.dat
+STAGES = ['airfoil_simpleFoam', 'airfoil_pimpleFoam']
+
+
+def read_new_rows(f):
+    """
+    Numeric rows appended to an open forceCoeffs.dat since the last call,
+    leaving any partly written last line for next time.
+    """
+    rows = []
+    while True:
+        pos = f.tell()
+        line = f.readline()
+        if not line.endswith('\n'):
+            f.seek(pos)
+            return rows
+        if line.strip() and not line.startswith('#'):
+            rows.append([float(v) for v in line.split()])
+
+
+def check_convergence(t, Cl, Cd, tolerance):
+    """
+    Decide whether the lift and drag over a window of samples have settled,
+    either to a steady value or to a periodic state where every full cycle
+    in the window has the same mean and amplitude. Returns the statistics
+    when converged, else None.
+    """
+    scale = max(abs(Cl.mean()), 0.1)
+    if np.ptp(Cl) <= tolerance*scale and np.ptp(Cd) <= tolerance*max(abs(Cd.mean()), 0.01):
+        return dict(state='steady', Cl=Cl.mean(), Cd=Cd.mean(), amplitude=np.ptp(Cl)/2)
+
+    # Periodic: split into cycles at upward crossings of the mean, and need at
+    # least two full ones to compare
+    x = Cl - Cl.mean()
+    rising = np.where((x[:-1] < 0) & (x[1:] >= 0))[0] + 1
+    if len(rising) < 3:
+        return None
+    cycles = [slice(a, b) for a, b in zip(rising[:-1], rising[1:])]
+    means = np.array([Cl[c].mean() for c in cycles])
+    amplitudes = np.array([np.ptp(Cl[c])/2 for c in cycles])
+    periods = np.diff(t[rising])
+    if (np.ptp(means) <= tolerance*scale and
+            np.ptp(amplitudes) <= tolerance*max(amplitudes.mean(), 0.01) and
+            np.ptp(periods) <= 0.05*periods.mean()):
+        whole = slice(rising[0], rising[-1])
+        return dict(state='periodic', Cl=Cl[whole].mean(), Cd=Cd[whole].mean(),
+                    amplitude=amplitudes.mean(), frequency=1/periods.mean())
+    return None
+
+
+def read_entry(path, key):
+    with open(path) as f:
+        return re.search(r'^\s*' + key + r'\s+([^;]+);', f.read(), re.M).group(1)
+
+
+class ConvergenceMonitor(threading.Thread):
+    """
+    Tail each solver's forceCoeffs.dat while Allrun is running in `case`.
+    Once the last `window` (a fraction of endTime) of lift and drag has
+    converged to within `tolerance`, ask the solver to write and stop by
+    setting `stopAt writeNow` in its controlDict (runTimeModifiable picks
+    this up). The controlDicts are put back as they were by `stop`.
+    """
+
+    def __init__(self, case='.', tolerance=1e-3, window=0.2, interval=1.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.case = case
+        self.tolerance = tolerance
+        self.window = window
+        self.interval = interval
+        self.results = {}
+        self.originals = {}
+        self.finished = threading.Event()
+
+    def path(self, stage, *names):
+        return os.path.join(self.case, stage, *names)
+
+    def forces(self, stage):
+        return self.path(stage, 'postProcessing', 'forceCoeffs', '0', 'forceCoeffs.dat')
+
+    def run(self):
+        for i, stage in enumerate(STAGES):
+            later = [self.forces(s) for s in STAGES[i + 1:]]
+            self.watch(stage, later)
+
+    def watch(self, stage, later):
+        # Follow one stage until it converges, a later stage starts or the run ends
+        window = self.window*float(read_entry(self.path(stage, 'system', 'controlDict'), 'endTime'))
+        samples = deque()
+        f = None
+        try:
+            while not self.finished.is_set() and not any(os.path.exists(p) for p in later):
+                if f is None and os.path.exists(self.forces(stage)):
+                    f = open(self.forces(stage))
+                if f is not None:
+                    samples.extend(read_new_rows(f))
+                    while samples and samples[-1][0] - samples[0][0] > window:
+                        samples.popleft()
+                    if samples and samples[-1][0] >= window and \
+                            samples[-1][0] - samples[0][0] >= 0.95*window:
+                        t, _, Cd, Cl = np.array(samples)[:, :4].T
+                        result = check_convergence(t, Cl, Cd, self.tolerance)
+                        if result:
+                            result['time'] = t[-1]
+                            self.results[stage] = result
+                            self.stop_solver(stage)
+                            print("{} converged ({state}) at t = {time:g}: Cl = {Cl:.4f}, "
+                                  "Cd = {Cd:.4f}.".format(stage, **result))
+                            return
+                self.finished.wait(self.interval)
+        finally:
+            if f is not None:
+                f.close()
+
+    def stop_solver(self, stage):
+        path = self.path(stage, 'system', 'controlDict')
+        with open(path) as f:
+            txt = f.read()
+        self.originals[path] = txt
+        with open(path, 'w') as f:
+            f.write(foamfile.replace_entries(txt, {'stopAt': 'writeNow'}))
+
+    def stop(self):
+        # Stop watching and restore any controlDict we changed
+        self.finished.set()
+        self.join()
+        for path, txt in self.originals.items():
+            with open(path, 'w') as f:
+                f.write(txt)
+        return self.results
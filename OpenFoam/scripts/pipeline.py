@@ -0,0 +1,361 @@
+from __future__ import division, print_function
+from collections import OrderedDict
+import multiprocessing
+import subprocess
+import argparse
+import resource
+import shutil
+import glob
+import json
+import time
+import os
+import re
+import numpy as np
+import decompose
+
+
+# Stages that leave a new mesh behind, whose cells are counted afterwards
+MESH_STAGES = ['blockMesh', 'snappyHexMesh', 'extrudeMesh', 'reuseMesh']
+
+
+class Stage(object):
+    """
+    One step of the workflow in Allrun: a program run in one of the cases
+    with its output sent to `log`, or with `action` a Python function doing
+    the file shuffling in between. Optional stages (the gnuplot plots) don't
+    stop the pipeline when they fail.
+    """
+
+    def __init__(self, name, folder, command=None, log=None, action=None, optional=False):
+        self.name = name
+        self.folder = folder
+        self.command = command
+        self.log = log
+        self.action = action
+        self.optional = optional
+
+
+def exit_status(status):
+    # Exit status from a wait() status, negative for a signal like Popen's
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def run_command(command, cwd, log, env=None):
+    """
+    Run a command to completion with its output in `log`, and return its exit
+    status and resource usage. The usage covers the process and whatever it
+    waited for (e.g. the ranks under mpirun): CPU time is their total and
+    peak RSS that of the largest.
+    """
+    with open(log, 'w') as f:
+        try:
+            p = subprocess.Popen(command, cwd=cwd, stdout=f, stderr=subprocess.STDOUT, env=env)
+        except OSError as e:
+            f.write('{}\n'.format(e))
+            return 127, None
+        _, status, usage = os.wait4(p.pid, 0)
+        p.returncode = exit_status(status)
+    return p.returncode, usage
+
+
+def read_cells(log, folder, name):
+    """
+    Mesh size reported in the log of a mesh stage: the last cell count
+    printed, and for decomposePar the cells of each processor. The polyMesh
+    header is the fallback for mesh stages that don't report one.
+    """
+    info = {}
+    try:
+        with open(log) as f:
+            txt = f.read()
+    except (IOError, TypeError):
+        txt = ''
+    if name == 'decomposePar':
+        counts = [int(n) for n in re.findall(r'Number of cells\s*=\s*(\d+)', txt)]
+        if counts:
+            info['cells'], info['cells_per_proc'] = sum(counts), counts
+            return info
+    counts = re.findall(r'\bn?[Cc]ells\s*[:=]\s*(\d+)', txt)
+    if counts:
+        info['cells'] = int(counts[-1])
+    elif name in MESH_STAGES:
+        cells = mesh_cells(folder)
+        if cells is not None:
+            info['cells'] = cells
+    return info
+
+
+def mesh_cells(folder):
+    # Cell count from the note OpenFOAM writes in the header of polyMesh/owner
+    try:
+        with open(os.path.join(folder, 'constant', 'polyMesh', 'owner')) as f:
+            match = re.search(r'nCells:\s*(\d+)', f.read(4096))
+    except IOError:
+        return None
+    return int(match.group(1)) if match else None
+
+
+def reset_fields(folder, source):
+    # Start a case from the initial fields in `source`
+    for path in glob.glob(os.path.join(folder, '0', '*')):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(folder, '0', name))
+        else:
+            shutil.copy2(path, os.path.join(folder, '0'))
+
+
+def copy_tree(source, dest):
+    # Copy the contents of one folder into another, like `cp -r source/* dest/`
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isdir(path):
+            if os.path.isdir(os.path.join(dest, name)):
+                shutil.rmtree(os.path.join(dest, name))
+            shutil.copytree(path, os.path.join(dest, name))
+        else:
+            shutil.copy2(path, dest)
+
+
+def save_mesh(folder, mesh):
+    # Keep the mesh for later runs of this foil, unless another run got there first
+    if not os.path.isdir(os.path.dirname(mesh)):
+        os.makedirs(os.path.dirname(mesh))
+    tmp = '{}.{}'.format(mesh, os.getpid())
+    shutil.copytree(os.path.join(folder, 'constant', 'polyMesh'), tmp)
+    try:
+        os.rename(tmp, mesh)
+    except OSError:
+        pass
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+class Pipeline(object):
+    """
+    Runs the stages of Allrun for the case in `case` from Python, timing
+    each. `procs`, `mesh` and `warm` have the meanings of Allrun's NP, MESH
+    and WARM. Every stage gives a record of its wall and CPU time, peak RSS,
+    exit status and, where the log says, mesh cell count, written as a line
+    of JSON to `case`/stages.jsonl as it finishes. The run stops at the first
+    stage to fail.
+
+    With `procs` None, the ranks and decomposition for pimpleFoam are picked
+    from the size of the mesh and the `cores` the case may use (see
+    `decompose.choose`, which gets the settings in the `decompose` dict),
+    and kept in `decomposition`.
+    """
+
+    def __init__(self, case='.', procs=4, mesh=None, warm=None, env=None, tags=None,
+                 cores=None, decompose=None):
+        self.case = case
+        self.procs = procs
+        self.mesh = os.path.abspath(mesh) if mesh else None
+        self.warm = os.path.abspath(warm) if warm else None
+        self.env = env
+        self.tags = tags or {}
+        self.cores = cores or multiprocessing.cpu_count()
+        self.decompose = decompose or {}
+        self.decomposition = None
+        self.records = []
+
+    def stages(self):
+        """
+        The stages to run, generated as they are reached, so later ones can
+        depend on what earlier ones found.
+        """
+        snappy, simple, pimple = 'airfoil_snappyHexMesh', 'airfoil_simpleFoam', 'airfoil_pimpleFoam'
+        path = lambda *names: os.path.join(self.case, *names)
+
+        # Reuse the mesh saved by an earlier run for this foil, or make it by
+        # extruding a patch of a 3D slab of cells
+        if self.mesh and os.path.isdir(self.mesh):
+            yield Stage('reuseMesh', simple, action=lambda: copy_tree(
+                self.mesh, path(simple, 'constant', 'polyMesh')))
+        else:
+            yield Stage('blockMesh', snappy, ['blockMesh'], '1-blockMesh.log')
+            yield Stage('surfaceFeatureExtract', snappy, ['surfaceFeatureExtract'],
+                        '2-surfaceFeatureExtract.log')
+            yield Stage('snappyHexMesh', snappy, ['snappyHexMesh', '-overwrite'],
+                        '3-snappyHexMesh.log')
+            yield Stage('cleanSlab', snappy, action=lambda: [
+                os.remove(p) for p in glob.glob(path(snappy, '0', '*')) if os.path.isfile(p)])
+            yield Stage('extrudeMesh', simple, ['extrudeMesh'], '1-extrudeMesh.log')
+            if self.mesh:
+                yield Stage('saveMesh', simple, action=lambda: save_mesh(path(simple), self.mesh))
+
+        # Solve to steady state, starting from the fields of $WARM when given
+        yield Stage('resetFields', simple, action=lambda: reset_fields(
+            path(simple), path(simple, '0.org')))
+        if self.warm:
+            yield Stage('warmStart', simple, ['mapFields', self.warm, '-sourceTime', 'latestTime',
+                                              '-consistent'], '1-warmStart.log')
+            yield Stage('restoreInflow', '.', ['python', 'scripts/initial_conditions.py',
+                                               '--restore-inflow'], None)
+        yield Stage('simpleFoam', simple, ['simpleFoam'], '2-simpleFoam.log')
+        yield Stage('plotSteady', simple, ['./liftDrag.plot'], None, optional=True)
+
+        # Map the steady solution onto the transient case and solve, in
+        # parallel if it has more than one rank
+        yield Stage('copyCase', pimple, action=lambda: self.copy_steady(path(simple), path(pimple)))
+        yield Stage('mapFields', pimple, ['mapFields', '../' + simple, '-sourceTime', 'latestTime',
+                                          '-consistent'], '1-mapFields.log')
+        procs = self.procs
+        if procs is None:
+            yield Stage('decompose', pimple, action=lambda: self.choose(path(pimple)))
+            procs = self.decomposition['procs']
+        if procs > 1:
+            yield Stage('decomposePar', pimple, ['decomposePar'], '2-decomposePar.log')
+            yield Stage('pimpleFoam', pimple, ['mpirun', '-np', str(procs), 'pimpleFoam',
+                                               '-parallel'], '3-pimpleFoam.log')
+        else:
+            yield Stage('pimpleFoam', pimple, ['pimpleFoam'], '3-pimpleFoam.log')
+        yield Stage('plotTransient', pimple, ['./liftDrag.plot'], None, optional=True)
+        if procs > 1:
+            yield Stage('reconstructPar', pimple, ['reconstructPar'], '4-reconstructPar.log')
+            yield Stage('cleanProcessors', pimple, action=lambda: [
+                shutil.rmtree(p) for p in glob.glob(path(pimple, 'processor*'))])
+
+    def choose(self, folder):
+        # Size the decomposition to the mesh the transient case got
+        self.decomposition = decompose.choose(mesh_cells(folder), self.cores, **self.decompose)
+        if self.decomposition['procs'] > 1:
+            decompose.write(folder, self.decomposition)
+        return dict(self.decomposition)
+
+    @staticmethod
+    def copy_steady(simple, pimple):
+        # The transient case runs on the steady one's mesh and settings
+        copy_tree(os.path.join(simple, 'constant', 'polyMesh'),
+                  os.path.join(pimple, 'constant', 'polyMesh'))
+        reset_fields(pimple, os.path.join(simple, '0.org'))
+        shutil.copy2(os.path.join(simple, 'constant', 'transportProperties'),
+                     os.path.join(pimple, 'constant', 'transportProperties'))
+
+    def run_stage(self, stage):
+        folder = os.path.join(self.case, stage.folder)
+        record = OrderedDict(self.tags)
+        record.update([('case', self.case), ('stage', stage.name), ('start', time.time())])
+        if stage.action is not None:
+            before = resource.getrusage(resource.RUSAGE_SELF)
+            try:
+                result = stage.action()
+                if isinstance(result, dict):
+                    record.update(result)
+                status = 0
+            except (IOError, OSError) as e:
+                print('{} failed: {}'.format(stage.name, e))
+                status = 1
+            after = resource.getrusage(resource.RUSAGE_SELF)
+            usage = dict(user=after.ru_utime - before.ru_utime,
+                         sys=after.ru_stime - before.ru_stime, maxrss_kb=None)
+        else:
+            log = os.path.join(folder, 'output', stage.log) if stage.log else os.devnull
+            record['command'] = ' '.join(stage.command)
+            status, ru = run_command(stage.command, folder, log, self.env)
+            usage = dict(user=ru.ru_utime, sys=ru.ru_stime, maxrss_kb=ru.ru_maxrss) if ru else \
+                dict(user=0.0, sys=0.0, maxrss_kb=None)
+            if stage.log:
+                record['log'] = log
+        if stage.name in MESH_STAGES + ['decomposePar']:
+            record.update(read_cells(record.get('log'), folder, stage.name))
+        record['wall'] = time.time() - record['start']
+        record.update(usage, status=status, optional=stage.optional)
+        return record
+
+    def run(self):
+        """
+        Run every stage in turn. Returns the exit status of the first stage
+        to fail, or 0.
+        """
+        log = open(os.path.join(self.case, 'stages.jsonl'), 'w')
+        try:
+            for stage in self.stages():
+                record = self.run_stage(stage)
+                self.records.append(record)
+                log.write(json.dumps(record) + '\n')
+                log.flush()
+                if record['status'] != 0 and not stage.optional:
+                    return record['status']
+        finally:
+            log.close()
+        return 0
+
+
+def read_records(paths):
+    records = []
+    for path in paths:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def append_records(path, records):
+    # Add a case's stage records to the ones of a whole sweep
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def summarize(records):
+    """
+    Statistics of each stage over the records of many cases, in the order
+    the stages ran: runs, failures, wall time (mean, median, max, total and
+    share of all stages), CPU time per wall second, peak RSS and cells.
+    """
+    stages = OrderedDict()
+    for record in records:
+        stages.setdefault(record['stage'], []).append(record)
+    total = sum(record['wall'] for record in records) or 1.0
+
+    summary = OrderedDict()
+    for name, runs in stages.items():
+        wall = np.array([r['wall'] for r in runs])
+        cpu = np.array([r['user'] + r['sys'] for r in runs])
+        rss = [r['maxrss_kb'] for r in runs if r.get('maxrss_kb') is not None]
+        cells = [r['cells'] for r in runs if 'cells' in r]
+        summary[name] = OrderedDict([
+            ('runs', len(runs)),
+            ('failures', sum(1 for r in runs if r['status'] != 0)),
+            ('wall_mean', wall.mean()), ('wall_median', np.median(wall)),
+            ('wall_max', wall.max()), ('wall_total', wall.sum()),
+            ('share', wall.sum() / total),
+            ('cpu_per_wall', cpu.sum() / wall.sum() if wall.sum() else 0.0),
+            ('maxrss_kb', max(rss) if rss else None),
+            ('cells', int(np.median(cells)) if cells else None)])
+    return summary
+
+
+def report(records):
+    # Table of `summarize` for printing
+    lines = ['{:<22} {:>5} {:>5} {:>10} {:>10} {:>10} {:>6} {:>6} {:>10} {:>9}'.format(
+        'stage', 'runs', 'fail', 'mean [s]', 'max [s]', 'total [s]', 'share', 'cpu/s',
+        'RSS [MB]', 'cells')]
+    for name, s in summarize(records).items():
+        lines.append('{:<22} {:>5} {:>5} {:>10.2f} {:>10.2f} {:>10.2f} {:>5.1f}% {:>6.2f} {:>10} {:>9}'.format(
+            name, s['runs'], s['failures'], s['wall_mean'], s['wall_max'], s['wall_total'],
+            100 * s['share'], s['cpu_per_wall'],
+            '-' if s['maxrss_kb'] is None else '{:.0f}'.format(s['maxrss_kb'] / 1024),
+            '-' if s['cells'] is None else s['cells']))
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise where the time of a sweep went, stage by stage.")
+    parser.add_argument("records", nargs='+', help="stages.jsonl files of cases or sweeps")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    records = read_records(args.records)
+    if args.json:
+        print(json.dumps(summarize(records), indent=2))
+    else:
+        print(report(records))
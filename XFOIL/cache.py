@@ -0,0 +1,117 @@
+import threading
+import hashlib
+import sqlite3
+import time
+import os
+
+import numpy as np
+
+
+def coordinates_key(coordinates):
+    # Hash foil coordinates so the same shape maps to the same key
+    coordinates = np.round(np.asarray(coordinates, dtype=float), 7)
+    return 'sha1:' + hashlib.sha1(coordinates.tobytes()).hexdigest()
+
+
+def foil_key(foil):
+    # NACA digits are their own key, coordinate files are hashed by content
+    if os.path.isfile(foil):
+        return coordinates_key(np.loadtxt(foil, skiprows=1))
+    return 'NACA ' + foil
+
+
+class PolarCache(object):
+    """
+    On-disk cache of polar points keyed by foil, Reynolds number, Ncrit and
+    angle of attack. Once it holds more than `max_points` points the least
+    recently used ones are evicted.
+    """
+
+    columns = ['CL', 'CD', 'CDp', 'CM', 'Top_Xtr', 'Bot_Xtr']
+
+    def __init__(self, path='cache/polars.sqlite', max_points=1000000):
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        self.max_points = max_points
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS points ('
+                        'foil TEXT, Re REAL, Ncrit REAL, alpha REAL, ' +
+                        ', '.join(c + ' REAL' for c in self.columns) +
+                        ', used REAL, PRIMARY KEY (foil, Re, Ncrit, alpha))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS lru ON points (used)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS counters ('
+                        'name TEXT PRIMARY KEY, value INTEGER)')
+        self.db.executemany('INSERT OR IGNORE INTO counters VALUES (?, 0)',
+                            [('hits',), ('misses',)])
+        self.db.commit()
+
+    def lookup(self, foil, Reynolds, Ncrit, alphas):
+        """
+        Return the cached points for `alphas` as {alpha: [CL, CD, ...]},
+        with each alpha rounded to 4 decimals.
+        """
+        alphas = sorted(set(round(float(alpha), 4) for alpha in alphas))
+        with self.lock, self.db:
+            found = {}
+            for alpha in alphas:
+                row = self.db.execute(
+                    'SELECT ' + ', '.join(self.columns) + ' FROM points '
+                    'WHERE foil = ? AND Re = ? AND Ncrit = ? AND alpha = ?',
+                    (foil, float(Reynolds), float(Ncrit), alpha)).fetchone()
+                if row is not None:
+                    found[alpha] = list(row)
+
+            self.db.executemany(
+                'UPDATE points SET used = ? '
+                'WHERE foil = ? AND Re = ? AND Ncrit = ? AND alpha = ?',
+                [(time.time(), foil, float(Reynolds), float(Ncrit), alpha)
+                 for alpha in found])
+            self._count('hits', len(found))
+            self._count('misses', len(alphas) - len(found))
+        return found
+
+    def store(self, foil, Reynolds, Ncrit, columns, rows):
+        # Add solved points, given as rows of a polar with the named columns
+        if len(rows) == 0:
+            return
+        order = [columns.index(c) for c in ['alpha'] + self.columns]
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO points VALUES (' +
+                ', '.join(['?'] * (len(self.columns) + 5)) + ')',
+                [(foil, float(Reynolds), float(Ncrit), round(row[0], 4)) +
+                 tuple(row[1:]) + (now,) for row in rows[:, order].tolist()])
+            self._evict()
+
+    def _evict(self):
+        # Drop the least recently used points beyond the size limit
+        extra = self._size() - self.max_points
+        if extra > 0:
+            self.db.execute('DELETE FROM points WHERE rowid IN (SELECT rowid '
+                            'FROM points ORDER BY used LIMIT ?)', (extra,))
+
+    def _count(self, name, n):
+        self.db.execute('UPDATE counters SET value = value + ? WHERE name = ?',
+                        (n, name))
+
+    def _size(self):
+        return self.db.execute('SELECT COUNT(*) FROM points').fetchone()[0]
+
+    def stats(self):
+        # Hit and miss totals for this cache file, plus its current size
+        with self.lock:
+            stats = dict(self.db.execute('SELECT name, value FROM counters'))
+            stats['points'] = self._size()
+        return stats
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM points')
+            self.db.execute('UPDATE counters SET value = 0')
+
+    def close(self):
+        self.db.close()
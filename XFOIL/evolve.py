@@ -1,24 +1,39 @@
-import pandas as pd
+import multiprocessing
+import argparse
+import glob
+import json
+import os
+
 import numpy as np
 
+from session import SessionError, SessionPool
+from xfoil import NCRIT, read_foil, write_foil
+
 
-def wiggle_foil(foil, w=1E-4):
-    # Load data
-    df = pd.read_csv(foil, skiprows=1, header=None, delim_whitespace=True).as_matrix()
+def wiggle(shape, w=1E-4, rng=None):
+    # Uniform noise in [-w, w) for an array of the given shape
+    rng = np.random.default_rng() if rng is None else rng
+    return w * (2 * rng.random(shape) - 1)
 
+
+def wiggle_coordinates(df, w=1E-4, rng=None):
     # Foil is symmetric, and we're going to leave x alone, grab first half of y
-    # coordinates.
-    pos = d[:len(df)/2][:, 1]
+    # coordinates. With an odd number of points the middle one is the leading
+    # edge, which stays put.
+    half = len(df) // 2
+    pos = df[:half, 1]
 
     # Add some small wiggle
-    wiggle = w * (2 * np.random.random(len(df)/2) - 1)
-    result = pos + wiggle
+    result = pos + wiggle(half, w, rng)
 
     # Create full list of ys by mirroring the positive half
-    full = np.concatenate((result, -result[::-1]))
+    full = np.concatenate((result, df[half:len(df) - half, 1], -result[::-1]))
+    return np.column_stack((df[:, 0], full))
+
 
-    # Build the new dataframe
-    output = pd.DataFrame([df[:, 0], full]).T
+def wiggle_foil(foil, w=1E-4, rng=None):
+    # Wiggle a foil file, saving the result as the next version of it
+    output = wiggle_coordinates(read_foil(foil)[1], w, rng)
 
     # Increment the version number
     try:
@@ -29,6 +44,215 @@ def wiggle_foil(foil, w=1E-4):
 
     # Save the new foil
     name = foil.split('.foil')[0].split('_')[0] + version
-    with open(name + '.foil', 'w') as f:
-        f.write(name.split('/')[-1] + '\n')
-        output.to_csv(f, float_format='%.7e', sep=' ', header=False, index=False)
+    write_foil(name + '.foil', name.split('/')[-1], output)
+    return name + '.foil'
+
+
+def bumps(x, n=8):
+    """
+    Hicks-Henne bump functions sin(pi x^(ln 0.5 / ln x_peak))^3 with peaks
+    spread along the chord, shape (n, len(x)). They vanish at the leading
+    and trailing edge, so perturbing with them keeps the foil smooth and
+    closed.
+    """
+    peaks = np.linspace(0.05, 0.95, n)[:, None]
+    x = np.clip(np.asarray(x, dtype=float), 0, 1)[None, :]
+    return np.sin(np.pi * x**(np.log(0.5) / np.log(peaks)))**3
+
+
+def mutate(population, rng, w=2E-3, n=8):
+    """
+    Perturb every foil of a population, shape (size, points, 2), at once
+    with random Hicks-Henne bumps of amplitude up to `w`. The upper and
+    lower surfaces (either side of the leading edge) get separate bumps.
+    """
+    x = population[0, :, 0]
+    le = np.argmin(x)
+    basis = bumps(x, n)
+    upper = np.arange(len(x)) <= le
+    amplitudes = wiggle((len(population), 2, n), w, rng)
+    dy = np.where(upper, amplitudes[:, 0] @ basis, amplitudes[:, 1] @ basis)
+    child = population.copy()
+    child[:, :, 1] += dy
+    return child
+
+
+def crossover(a, b, rng):
+    # Blend the y coordinates of pairs of parents by a random weight each
+    t = rng.random((len(a), 1))
+    child = a.copy()
+    child[:, :, 1] = t * a[:, :, 1] + (1 - t) * b[:, :, 1]
+    return child
+
+
+def tournament(scores, n, rng, size=3):
+    # Indices of n parents, each the best of `size` picked at random
+    picks = rng.integers(len(scores), size=(n, size))
+    return picks[np.arange(n), np.argmax(scores[picks], axis=1)]
+
+
+def objective(columns, rows, cl=None):
+    """
+    Score of a polar, larger being better: L/D at the target `cl` if one was
+    given (the polar then holds that point), else the best L/D of the polar.
+    Polars with no converged points score -inf.
+    """
+    if not len(rows):
+        return -np.inf
+    CL, CD = rows[:, columns.index('CL')], rows[:, columns.index('CD')]
+    if cl is not None:
+        near = np.argmin(np.abs(CL - cl))
+        if abs(CL[near] - cl) > 0.01:
+            return -np.inf
+        return CL[near] / CD[near]
+    return np.max(CL / CD)
+
+
+def evaluate(session, job):
+    # Run one candidate through a warm xfoil session
+    name, coordinates, Reynolds, cl, alphas = job
+    try:
+        session.load_coordinates(coordinates, name)
+        if cl is not None:
+            columns, rows, _ = session.polar([cl], Reynolds, command='CL')
+        else:
+            columns, rows, _ = session.polar(alphas, Reynolds)
+    except SessionError:
+        return -np.inf
+    return objective(columns, rows, cl)
+
+
+class Evolution(object):
+    """
+    Evolve a population of foils from a starting shape, scoring each
+    generation with xfoil across a pool of warm sessions (one per core by
+    default). Every generation keeps the `elite` best, and fills the rest
+    with mutated crossovers of tournament winners. The state is saved to
+    `folder` after each generation, with the random generator, so a run can
+    be resumed and a seeded run repeated exactly.
+    """
+
+    def __init__(self, coordinates, Reynolds, cl=None, alphas=None, size=32, elite=2,
+                 w=2E-3, seed=None, folder='evolve', workers=None, timeout=30):
+        self.Reynolds = Reynolds
+        self.cl = cl
+        self.alphas = alphas if alphas is not None else np.arange(0, 11)
+        self.size = size
+        self.elite = elite
+        self.w = w
+        self.folder = folder
+        self.workers = workers or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.rng = np.random.default_rng(seed)
+
+        # Start from the base foil and mutations of it
+        base = np.asarray(coordinates, dtype=float)[None]
+        self.population = np.concatenate([base, mutate(np.repeat(base, size - 1, axis=0),
+                                                       self.rng, w)])
+        self.scores = None
+        self.generation = 0
+        self.history = []
+
+    def checkpoint(self):
+        # Save the population, its scores and the generator state
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        path = os.path.join(self.folder, 'gen_{:04d}.npz'.format(self.generation))
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, population=self.population, scores=self.scores,
+                 generation=self.generation, history=np.array(self.history),
+                 rng=json.dumps(self.rng.bit_generator.state))
+        os.replace(tmp, path)
+        best = np.argmax(self.scores)
+        write_foil(os.path.join(self.folder, 'best.foil'),
+                   'gen{} L/D {:.2f}'.format(self.generation, self.scores[best]),
+                   self.population[best])
+        return path
+
+    def resume(self):
+        # Carry on from the latest checkpoint in the folder, if any
+        files = sorted(glob.glob(os.path.join(self.folder, 'gen_[0-9][0-9][0-9][0-9].npz')))
+        if not files:
+            return False
+        with np.load(files[-1]) as data:
+            self.population = data['population']
+            self.scores = data['scores']
+            self.generation = int(data['generation'])
+            self.history = data['history'].tolist()
+            self.rng.bit_generator.state = json.loads(str(data['rng']))
+        return True
+
+    def evaluate(self, sessions, population):
+        jobs = [('candidate {}'.format(i), foil, self.Reynolds, self.cl, self.alphas)
+                for i, foil in enumerate(population)]
+        return np.array(sessions.map(evaluate, jobs))
+
+    def breed(self):
+        # The next population from the current one and its scores
+        order = np.argsort(self.scores)[::-1]
+        n = self.size - self.elite
+        a = self.population[tournament(self.scores, n, self.rng)]
+        b = self.population[tournament(self.scores, n, self.rng)]
+        children = mutate(crossover(a, b, self.rng), self.rng, self.w)
+        return np.concatenate([self.population[order[:self.elite]], children]), \
+            self.scores[order[:self.elite]]
+
+    def run(self, generations):
+        with SessionPool(self.workers, ncrit=NCRIT, timeout=self.timeout) as sessions:
+            if self.scores is None:
+                self.scores = self.evaluate(sessions, self.population)
+                self.record()
+            while self.generation < generations:
+                # The elite were scored already
+                population, elite = self.breed()
+                scores = self.evaluate(sessions, population[self.elite:])
+                self.population = population
+                self.scores = np.concatenate([elite, scores])
+                self.generation += 1
+                self.record()
+        return self.population[np.argmax(self.scores)], np.max(self.scores)
+
+    def record(self):
+        finite = self.scores[np.isfinite(self.scores)]
+        self.history.append([self.generation, np.max(self.scores),
+                             finite.mean() if len(finite) else -np.inf,
+                             len(finite)])
+        self.checkpoint()
+        print('Generation {}: best {:.3f}, mean {:.3f}, {} of {} converged'.format(
+            *self.history[-1][:3], int(self.history[-1][3]), len(self.scores)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evolve a foil shape with xfoil.')
+    parser.add_argument('foil', help='NACA XXXX foil, or coordinate file, to start from')
+    parser.add_argument('--Reynolds', '-R', type=float, default=6e6, help='Reynolds number')
+    parser.add_argument('--cl', type=float, default=None,
+                        help='Maximise L/D at this lift coefficient (default: best L/D over --alpha).')
+    parser.add_argument('--alpha', type=float, nargs=3, default=[0, 10, 1],
+                        metavar=('START', 'STOP', 'STEP'), help='Angles to find the best L/D over.')
+    parser.add_argument('--generations', '-g', type=int, default=20)
+    parser.add_argument('--size', '-n', type=int, default=32, help='Population size')
+    parser.add_argument('--elite', type=int, default=2, help='Best foils kept unchanged each generation')
+    parser.add_argument('--wiggle', '-w', type=float, default=2E-3, help='Largest bump added by a mutation')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed')
+    parser.add_argument('--workers', '-j', type=int, default=None,
+                        help='Number of xfoil sessions (default: one per core).')
+    parser.add_argument('--folder', default='evolve', help='Where to save each generation')
+    parser.add_argument('--resume', action='store_true', help='Carry on from the last saved generation')
+    args = parser.parse_args()
+
+    start, stop, step = args.alpha
+    if os.path.isfile(args.foil):
+        coordinates = read_foil(args.foil)[1]
+    else:
+        from session import Session
+        with Session() as session:
+            coordinates = session.naca_coordinates(args.foil)
+    evolution = Evolution(coordinates, args.Reynolds, cl=args.cl,
+                          alphas=np.arange(start, stop + step / 2, step), size=args.size,
+                          elite=args.elite, w=args.wiggle, seed=args.seed,
+                          folder=args.folder, workers=args.workers)
+    if args.resume and evolution.resume():
+        print('Resuming from generation {}'.format(evolution.generation))
+    foil, score = evolution.run(args.generations)
+    print('Best L/D {:.3f}, saved to {}'.format(score, os.path.join(args.folder, 'best.foil')))
@@ -0,0 +1,211 @@
+import argparse
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'OpenFoam', 'scripts'))
+from geometry import digits, naca4
+
+
+def naca_coordinates(foils, n=81):
+    """
+    Coordinates of NACA 4-digit foils in xfoil's order (trailing edge, upper
+    surface, leading edge, lower surface, trailing edge), shape
+    (len(foils), 2n - 1, 2), with `n` cosine-spaced points a side.
+    """
+    upper, lower = naca4(*digits(foils), alpha_deg=0, Ni=n)
+    return np.concatenate((upper[:, 0, ::-1], lower[:, 0, 1:]), axis=1)
+
+
+def panels(coordinates):
+    """
+    Panel end points of foils given in xfoil's order, turned round to run
+    clockwise from the trailing edge along the lower surface, and closed at
+    the trailing edge if they aren't. Returns points (F, N+1, 2), panel
+    angles (F, N) and lengths (F, N).
+    """
+    points = np.asarray(coordinates, dtype=float)[..., ::-1, :]
+    if points.ndim == 2:
+        points = points[None]
+    if not np.allclose(points[:, 0], points[:, -1]):
+        te = (points[:, :1] + points[:, -1:]) / 2
+        points = np.concatenate((te, points[:, 1:-1], te), axis=1)
+    d = np.diff(points, axis=1)
+    return points, np.arctan2(d[..., 1], d[..., 0]), np.hypot(d[..., 0], d[..., 1])
+
+
+def influence(points, theta, length):
+    """
+    Normal and tangential velocity at each panel's midpoint induced by unit
+    vorticity at each node, for vorticity varying linearly along every
+    panel (Katz & Plotkin, Low-Speed Aerodynamics, 11.4). Both have shape
+    (F, N, N+1), with the nodes at the trailing edge counted separately.
+    """
+    mid = (points[:, 1:] + points[:, :-1]) / 2
+    cos, sin = np.cos(theta), np.sin(theta)
+
+    # Each midpoint i in the frame of each panel j, which runs from 0 to S_j
+    dx = mid[:, :, None, 0] - points[:, None, :-1, 0]
+    dy = mid[:, :, None, 1] - points[:, None, :-1, 1]
+    x = dx * cos[:, None, :] + dy * sin[:, None, :]
+    y = -dx * sin[:, None, :] + dy * cos[:, None, :]
+    S = length[:, None, :]
+
+    # On its own panel, a midpoint sees the panel end on from both sides
+    n = theta.shape[1]
+    dtheta = np.arctan2(y, x - S) - np.arctan2(y, x)
+    dtheta[:, np.arange(n), np.arange(n)] = np.pi
+    y[:, np.arange(n), np.arange(n)] = 0
+    log = 0.5 * np.log(((x - S)**2 + y**2) / (x**2 + y**2))
+
+    # Velocities from the start (1) and end (2) node of the panel, in its frame
+    u1 = -(y * log + x * dtheta - S * dtheta) / (2 * np.pi * S)
+    u2 = (y * log + x * dtheta) / (2 * np.pi * S)
+    w1 = -((S - y * dtheta) + x * log - S * log) / (2 * np.pi * S)
+    w2 = ((S - y * dtheta) + x * log) / (2 * np.pi * S)
+
+    # Back to the global frame, then normal and tangential to panel i
+    c, s = cos[:, None, :], sin[:, None, :]
+    U1, W1 = u1 * c - w1 * s, u1 * s + w1 * c
+    U2, W2 = u2 * c - w2 * s, u2 * s + w2 * c
+    ci, si = cos[:, :, None], sin[:, :, None]
+    normal1, normal2 = -U1 * si + W1 * ci, -U2 * si + W2 * ci
+    tangent1, tangent2 = U1 * ci + W1 * si, U2 * ci + W2 * si
+
+    # Node j gets the end of panel j-1 and the start of panel j
+    A = np.zeros(mid.shape[:2] + (n + 1,))
+    B = np.zeros_like(A)
+    A[..., :-1] += normal1
+    A[..., 1:] += normal2
+    B[..., :-1] += tangent1
+    B[..., 1:] += tangent2
+    return A, B
+
+
+def factor(coordinates):
+    """
+    Vorticity of foils in the free streams along x and along y, which any
+    angle of attack is a sum of. `coordinates` are (n, 2) or (F, n, 2) in
+    xfoil's order, all foils with the same number of points. Returns what
+    `evaluate` needs.
+    """
+    points, theta, length = panels(coordinates)
+    A, B = influence(points, theta, length)
+    F, N = theta.shape
+
+    # Flow tangency at every midpoint and the Kutta condition
+    M = np.concatenate((A, np.zeros((F, 1, N + 1))), axis=1)
+    M[:, -1, 0] = M[:, -1, -1] = 1
+    rhs = np.zeros((F, N + 1, 2))
+    rhs[:, :-1, 0] = np.sin(theta)
+    rhs[:, :-1, 1] = -np.cos(theta)
+    gamma = np.linalg.solve(M, rhs)
+    return dict(points=points, theta=theta, length=length, B=B, gamma=gamma)
+
+
+def evaluate(flow, alphas):
+    """
+    Lift, moment and pressures of factored foils at angles `alphas` in
+    degrees, the same for every foil or (F, A) with a row per foil. Returns
+    a dict of CL and CM (about the quarter chord), both (F, A), and the
+    pressure coefficient Cp (F, A, N) at the panel midpoints x, y (F, N).
+    """
+    points, theta, length = flow['points'], flow['theta'], flow['length']
+    alpha = np.deg2rad(np.asarray(alphas, dtype=float))
+    if alpha.ndim < 2:
+        alpha = np.broadcast_to(np.atleast_1d(alpha), (len(theta), alpha.size))
+    cos, sin = np.cos(alpha)[:, None, :], np.sin(alpha)[:, None, :]
+
+    # Surface speed and pressure
+    gamma = flow['gamma'][..., :1] * cos + flow['gamma'][..., 1:] * sin
+    Vt = np.cos(theta[..., None] - alpha[:, None, :]) + flow['B'] @ gamma
+    Cp = 1 - Vt**2
+
+    # Pressure force on each panel, along its outward normal (-sin, cos)
+    dFx = Cp * (length * np.sin(theta))[..., None]
+    dFy = -Cp * (length * np.cos(theta))[..., None]
+    le = points[:, :, 0].min(axis=1)[:, None]
+    chord = points[:, :, 0].max(axis=1)[:, None] - le
+    CL = (dFy.sum(axis=1) * np.cos(alpha) - dFx.sum(axis=1) * np.sin(alpha)) / chord
+
+    # Moment about the quarter chord, nose up positive
+    mid = (points[:, 1:] + points[:, :-1]) / 2
+    xr = (mid[..., 0] - le - chord / 4)[..., None]
+    yr = mid[..., 1][..., None]
+    CM = -(xr * dFy - yr * dFx).sum(axis=1) / chord**2
+
+    return dict(CL=CL, CM=CM, Cp=np.swapaxes(Cp, 1, 2), x=mid[..., 0], y=mid[..., 1])
+
+
+def solve(coordinates, alphas):
+    """
+    Inviscid flow round foils by a linear-vorticity panel method, for every
+    foil and angle at once; `factor` and `evaluate` in one go.
+    """
+    return evaluate(factor(coordinates), alphas)
+
+
+def expand(foils):
+    """
+    NACA designations from a list of foils and ranges: 'MPXX-MPXX' stands
+    for every foil with each digit between those of its ends, e.g.
+    '2410-4412' for 2410, 2411, 2412, 2510, ... 4412. Foils with no camber
+    only come with P = 0.
+    """
+    names = []
+    for foil in foils:
+        if '-' not in foil:
+            names.append(foil)
+            continue
+        a, b = foil.split('-')
+        for M in range(int(a[0]), int(b[0]) + 1):
+            for P in range(int(a[1]), int(b[1]) + 1):
+                if (M == 0) != (P == 0):
+                    continue
+                names += ['{}{}{:02d}'.format(M, P, XX) for XX in range(int(a[2:]), int(b[2:]) + 1)]
+    return names
+
+
+def prescreen(foils, cl=0.5, keep=0.1, n=81, chunk=64):
+    """
+    Rank NACA 4-digit foils without xfoil, by how gently each carries the
+    target lift coefficient `cl`: the inviscid suction peak (lowest Cp) at
+    the angle giving `cl`, a milder peak meaning a gentler pressure
+    recovery for the boundary layer, so less drag and a later stall. Foils
+    are solved `chunk` at a time. Returns a DataFrame of every foil's lift
+    slope, zero-lift angle, angle for `cl`, CM and suction peak there, best
+    first, with the top `keep` fraction marked.
+    """
+    foils = list(foils)
+    rows = []
+    for i in range(0, len(foils), chunk):
+        part = foils[i:i + chunk]
+        coords = naca_coordinates(part, n)
+
+        # Inviscid lift is close to linear in alpha, so two angles give the
+        # one for cl
+        flow = factor(coords)
+        result = evaluate(flow, [0, 5])
+        slope = (result['CL'][:, 1] - result['CL'][:, 0]) / 5
+        alpha = (cl - result['CL'][:, 0]) / slope
+        design = evaluate(flow, alpha[:, None])
+        rows.append(pd.DataFrame(dict(
+            Airfoil=part, CL_alpha=slope, alpha_0=-result['CL'][:, 0] / slope, alpha=alpha,
+            CM=design['CM'][:, 0], Cp_min=design['Cp'][:, 0].min(axis=1))))
+    df = pd.concat(rows, ignore_index=True).sort_values('Cp_min', ascending=False)
+    df['keep'] = np.arange(len(df)) < max(1, int(np.ceil(keep * len(df))))
+    return df.reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rank NACA foils with an inviscid panel method.')
+    parser.add_argument('foils', nargs='+', help='NACA XXXX foils, or MPXX-MPXX ranges')
+    parser.add_argument('--cl', type=float, default=0.5, help='Lift coefficient to rank the foils at')
+    parser.add_argument('--keep', type=float, default=0.1, help='Fraction of foils to keep')
+    parser.add_argument('--points', '-n', type=int, default=81, help='Points per surface')
+    args = parser.parse_args()
+
+    print(prescreen(expand(args.foils), args.cl, args.keep, args.points).to_string(index=False))
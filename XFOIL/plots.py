@@ -0,0 +1,194 @@
+import multiprocessing
+import argparse
+import os
+
+import numpy as np
+import seaborn as sns
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+# The plots made of every foil, as (file suffix, x, y, x label, y label)
+PLOTS = [('CL_vs_CD', 'CL', 'CD', '$C_L$', '$C_D$'),
+         ('alpha_vs_CL', 'alpha', 'CL', '$\\alpha$ (degrees)', '$C_L$')]
+
+# The panels of an overlay of several foils, as (x, y, x label, y label)
+OVERLAY = [('CD', 'CL', '$C_D$', '$C_L$'),
+           ('alpha', 'CL', '$\\alpha$ (degrees)', '$C_L$'),
+           ('alpha', 'L/D', '$\\alpha$ (degrees)', '$L/D$')]
+
+# Columns a foil's polars are handed to the renderers in
+COLUMNS = ['alpha', 'CL', 'CD']
+
+# Light PNG compression; the default spends as long squeezing each plot as
+# drawing it
+PNG = dict(pil_kwargs=dict(compress_level=1))
+
+
+def style():
+    sns.set(style='ticks', context='notebook', font_scale=1.5)
+
+
+def group(df, foils=None):
+    """
+    Split a polar table into a list of (foil, polars) in one pass, polars
+    being a list of (Re, table) for each Reynolds number with table a dict
+    of alpha, CL and CD arrays in order of alpha. Only `foils` are kept if
+    given.
+    """
+    if len(df) == 0:
+        return []
+    if foils is not None:
+        df = df[df.Airfoil.isin(foils)]
+    df = df.sort_values(['Airfoil', 'Re', 'alpha'])
+
+    airfoils, Reynolds = df.Airfoil.values, df.Re.fillna(0).values
+    values = {column: df[column].values.astype(float) for column in COLUMNS}
+    starts = np.flatnonzero((airfoils[1:] != airfoils[:-1]) | (Reynolds[1:] != Reynolds[:-1])) + 1
+    bounds = zip(np.r_[0, starts], np.r_[starts, len(df)])
+
+    groups = []
+    for start, stop in bounds:
+        table = {column: values[column][start:stop] for column in COLUMNS}
+        if not groups or groups[-1][0] != airfoils[start]:
+            groups.append((airfoils[start], []))
+        groups[-1][1].append((Reynolds[start], table))
+    return groups
+
+
+class Renderer(object):
+    """
+    The per-foil plots, drawn on figures made once and reused for every foil:
+    only the data of their lines, the limits and the title change between
+    foils. Figures draw straight to Agg, without pyplot.
+    """
+    def __init__(self, folder='imgs'):
+        style()
+        self.folder = folder
+        self.figures = []
+        for suffix, x, y, xlabel, ylabel in PLOTS:
+            fig = Figure(figsize=(5, 5))
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot(111)
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ylabel)
+            fig.subplots_adjust(left=0.24, right=0.95, bottom=0.15, top=0.9)
+            self.figures.append((fig, ax, [], suffix, x, y))
+
+    def lines(self, ax, lines, n):
+        # n lines on the axes, adding to the ones there and hiding the rest
+        while len(lines) < n:
+            lines.append(ax.plot([], [])[0])
+        for i, line in enumerate(lines):
+            line.set_visible(i < n)
+        return lines[:n]
+
+    def render(self, foil, polars):
+        # Plot a foil's polars, a line per Reynolds number. If we just ran
+        # a single data point, don't plot.
+        if sum(len(table['alpha']) for _, table in polars) < 2:
+            return []
+
+        files = []
+        for fig, ax, lines, suffix, x, y in self.figures:
+            for line, (Re, table) in zip(self.lines(ax, lines, len(polars)), polars):
+                line.set_data(table[x], table[y])
+                line.set_label('Re = {:.3g}'.format(Re))
+            if len(polars) > 1:
+                ax.legend(loc='best', fontsize='x-small')
+            elif ax.get_legend():
+                ax.get_legend().remove()
+            ax.relim(visible_only=True)
+            ax.autoscale_view()
+            ax.set_title('NACA ' + foil)
+            files.append(os.path.join(self.folder, 'NACA ' + foil + '_' + suffix + '.png'))
+            fig.savefig(files[-1], **PNG)
+        return files
+
+
+# The renderer of each worker process
+_renderer = None
+
+
+def _start(folder):
+    global _renderer
+    _renderer = Renderer(folder)
+
+
+def _render(item):
+    return _renderer.render(*item)
+
+
+def render(df, foils=None, folder='imgs', workers=None, chunksize=8):
+    """
+    Plot every foil in a polar table, or just `foils`, into `folder`. The
+    table is grouped once and the foils are shared out between `workers`
+    processes (all the cores by default), each drawing on its own reused
+    figures. Returns the files written.
+    """
+    groups = group(df, foils)
+    os.makedirs(folder, exist_ok=True)
+    workers = min(workers or multiprocessing.cpu_count(), len(groups))
+    if workers <= 1:
+        renderer = Renderer(folder)
+        return [file for item in groups for file in renderer.render(*item)]
+
+    with multiprocessing.Pool(workers, initializer=_start, initargs=(folder,)) as pool:
+        files = pool.imap_unordered(_render, groups, chunksize=chunksize)
+        return [file for written in files for file in written]
+
+
+def plot(foil, df):
+    # Plot a single foil
+    return render(df, [foil], workers=1)
+
+
+def overlay(df, foils, name=None, folder='imgs'):
+    """
+    Compare foils on one figure: CL against CD, CL against alpha and L/D
+    against alpha, a line per foil and Reynolds number. Saved as
+    `name`.png in `folder`, by default named after the foils.
+    """
+    style()
+    fig = Figure(figsize=(15, 5))
+    FigureCanvasAgg(fig)
+    axes = [fig.add_subplot(1, len(OVERLAY), i + 1) for i in range(len(OVERLAY))]
+
+    groups = group(df, foils)
+    several = any(len(polars) > 1 for _, polars in groups)
+    for foil, polars in groups:
+        for Re, table in polars:
+            table = dict(table, **{'L/D': table['CL'] / table['CD']})
+            label = 'NACA ' + foil + (' Re = {:.3g}'.format(Re) if several else '')
+            for ax, (x, y, xlabel, ylabel) in zip(axes, OVERLAY):
+                ax.plot(table[x], table[y], label=label)
+
+    for ax, (x, y, xlabel, ylabel) in zip(axes, OVERLAY):
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+    axes[-1].legend(loc='best', fontsize='x-small')
+    fig.tight_layout()
+
+    os.makedirs(folder, exist_ok=True)
+    file = os.path.join(folder, (name or 'NACA ' + ' vs '.join(foils)) + '.png')
+    fig.savefig(file, **PNG)
+    return file
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plot the polars in data/.')
+    parser.add_argument('--foil', '-f', nargs='+', default=None,
+                        help='NACA XXXX foils to plot (default: all)')
+    parser.add_argument('--workers', '-j', type=int, default=None,
+                        help='Processes to render with (default: all cores)')
+    parser.add_argument('--compare', '-c', nargs='+', action='append', default=[],
+                        metavar='FOIL', help='Foils to overlay on one figure; repeat for more sets')
+    parser.add_argument('--folder', '-o', default='imgs', help='Folder to save the plots in')
+    args = parser.parse_args()
+
+    from xfoil import load_data
+    df = load_data()
+    if not args.compare or args.foil:
+        print('Plotted {} files'.format(len(render(df, args.foil, args.folder, args.workers))))
+    for foils in args.compare:
+        print('Plotted', overlay(df, foils, folder=args.folder))
@@ -0,0 +1,287 @@
+import multiprocessing.pool
+import contextlib
+import subprocess
+import tempfile
+import select
+import shutil
+import queue
+import os
+import re
+
+import numpy as np
+
+from xfoil import XFOIL, read_polar
+
+
+# XFOIL ends every prompt with a type letter and '>', e.g. ' .OPERv   c>  '
+# for commands or 's>' when asking for a string such as a file name
+_prompt = re.compile(rb'[a-z]>\s*$')
+
+
+class SessionError(RuntimeError):
+    pass
+
+
+def memory_dir():
+    # RAM-backed folder for the files xfoil has to read and write, if there is one
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+def format_coordinates(name, coordinates):
+    # Text of a labelled coordinate file, formatted in one go
+    coordinates = np.asarray(coordinates, dtype=float)
+    return name + '\n' + (' %.7f %.7f\n' * len(coordinates)) % tuple(coordinates.ravel())
+
+
+class Session(object):
+    """
+    A long-lived xfoil process driven interactively over its stdin/stdout.
+
+    The foil, Reynolds number and Ncrit can be changed between polars without
+    restarting xfoil, and each command waits for xfoil's prompt rather than
+    relying on a fixed script. The files xfoil reads and writes live in a
+    scratch folder in memory (/dev/shm) where available.
+    """
+
+    def __init__(self, ncrit=9, timeout=60):
+        self.ncrit = ncrit
+        self.timeout = timeout
+        self.scratch = tempfile.mkdtemp(prefix='xfoil_session_', dir=memory_dir())
+        self.p = None
+        self.start()
+
+    def start(self):
+        # (Re)start xfoil with graphics disabled
+        self.close(keep_scratch=True)
+        self.p = subprocess.Popen(XFOIL,
+                                  stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.STDOUT,
+                                  cwd=self.scratch)
+        self.mode = 'top'
+        self.foil = None
+        self.Reynolds = None
+        self.count = 0
+        self.failures = 0
+        self._read()
+        for line in ['PLOP', 'G', '']:
+            self.command(line)
+
+    def _read(self, timeout=None):
+        # Read xfoil's output until it prompts for the next input
+        timeout = self.timeout if timeout is None else timeout
+        fd = self.p.stdout.fileno()
+        output = b''
+        while not _prompt.search(output[-16:]):
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if not ready:
+                self.p.kill()
+                self.p.wait()
+                raise SessionError('xfoil did not respond within {} s'.format(timeout))
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise SessionError('xfoil exited unexpectedly')
+            output += chunk
+        return output.decode('UTF-8', 'replace')
+
+    def command(self, line, timeout=None):
+        """
+        Send a single line to xfoil and return everything it printed before
+        the next prompt.
+        """
+        try:
+            self.p.stdin.write(bytes(line + '\n', 'UTF-8'))
+            self.p.stdin.flush()
+        except OSError:
+            # The pipe is broken once xfoil has died
+            raise SessionError('xfoil exited unexpectedly')
+        return self._read(timeout)
+
+    def alive(self):
+        return self.p is not None and self.p.poll() is None
+
+    def top(self):
+        # Back out of OPER to the top-level menu
+        if self.mode == 'oper':
+            self.command('')
+            self.mode = 'top'
+
+    def oper(self):
+        # Enter the OPER menu
+        if self.mode == 'top':
+            self.command('OPER')
+            self.mode = 'oper'
+
+    def load_naca(self, foil):
+        # Load a NACA 4-digit foil
+        if self.foil == 'NACA ' + foil:
+            return
+        self.top()
+        self.command('NACA ' + foil)
+        self.foil = 'NACA ' + foil
+        self.reinit()
+
+    def load(self, path):
+        # Load a coordinate file
+        self.top()
+        self.command('LOAD ' + os.path.abspath(path))
+        self.foil = path
+        self.reinit()
+
+    def load_coordinates(self, coordinates, name='foil', panel=True):
+        """
+        Load a foil from an (n, 2) array of coordinates, running from the
+        trailing edge over the upper surface and back along the lower one.
+        With `panel`, xfoil repanels it (PANE) as it would a NACA foil.
+        """
+        path = os.path.join(self.scratch, 'coordinates.dat')
+        with open(path, 'w') as f:
+            f.write(format_coordinates(name, coordinates))
+        self.top()
+        self.command('LOAD ' + path)
+        if panel:
+            self.command('PANE')
+        self.foil = None
+        self.reinit()
+
+    def naca_coordinates(self, foil):
+        # Coordinates xfoil generates for a NACA 4-digit foil, as an array
+        self.load_naca(foil)
+        self.top()
+        path = os.path.join(self.scratch, 'naca.dat')
+        if os.path.exists(path):
+            os.remove(path)
+        self.command('SAVE')
+        self.command(path)
+        try:
+            return np.loadtxt(path, skiprows=1, ndmin=2)
+        finally:
+            os.remove(path)
+
+    def reinit(self):
+        # Restart the boundary layer solution, e.g. after a new foil or a
+        # string of convergence failures
+        self.oper()
+        if self.Reynolds is not None:
+            self.command('INIT')
+
+    def reynolds(self, Reynolds):
+        # Set the Reynolds number, switching to a viscous solution if needed
+        self.oper()
+        if self.Reynolds is None:
+            self.command('VPAR')
+            self.command('N {}'.format(self.ncrit))
+            self.command('')
+            self.command('VISC {}'.format(Reynolds))
+        elif Reynolds != self.Reynolds:
+            self.command('RE {}'.format(Reynolds))
+        self.Reynolds = Reynolds
+
+    def polar(self, alphas, Reynolds=None, save=None, command='ALFA'):
+        """
+        Solve the loaded foil at each angle in `alphas` and return the polar
+        as in `read_polar`. With `save` the polar file is also kept there.
+        With `command='CL'` the values are target lift coefficients instead.
+        """
+        if Reynolds is not None:
+            self.reynolds(Reynolds)
+        self.oper()
+
+        self.count += 1
+        file = os.path.join(self.scratch, 'polar{}.dat'.format(self.count))
+        if save is not None:
+            file = os.path.abspath(save)
+            if os.path.exists(file):
+                os.remove(file)
+
+        self.command('PACC')
+        self.command(file)
+        self.command('')
+        try:
+            for alpha in alphas:
+                # A failed point leaves a bad boundary layer behind, so start
+                # the next one afresh rather than from it
+                if 'Convergence failed' in self.command('{} {}'.format(command, alpha)):
+                    self.failures += 1
+                    self.reinit()
+        finally:
+            # Close the polar file, unless xfoil has died and with it the
+            # reason we're here
+            if self.alive():
+                self.command('PACC')
+
+        result = read_polar(file)
+        if save is None:
+            os.remove(file)
+        return result
+
+    def close(self, keep_scratch=False):
+        if self.alive():
+            try:
+                self.p.stdin.write(b'\n\nQUIT\n')
+                self.p.stdin.close()
+                self.p.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.p.kill()
+        if not keep_scratch:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionPool(object):
+    """
+    A fixed number of warm xfoil sessions handed out to threads. Sessions that
+    hang or die are restarted before they are handed out again.
+    """
+
+    def __init__(self, size=None, **kwds):
+        self.size = size or multiprocessing.cpu_count()
+        self.sessions = queue.Queue()
+        for _ in range(self.size):
+            self.sessions.put(Session(**kwds))
+
+    @contextlib.contextmanager
+    def session(self):
+        s = self.sessions.get()
+        try:
+            if not s.alive():
+                s.start()
+            yield s
+        except SessionError:
+            s.start()
+            raise
+        finally:
+            self.sessions.put(s)
+
+    def map(self, func, items):
+        """
+        Call `func(session, item)` for every item, running up to `size` at once.
+        """
+        def run(item):
+            with self.session() as s:
+                return func(s, item)
+
+        pool = multiprocessing.pool.ThreadPool(self.size)
+        try:
+            return pool.map(run, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def close(self):
+        while not self.sessions.empty():
+            self.sessions.get().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
@@ -0,0 +1,228 @@
+import contextlib
+import fcntl
+import glob
+import json
+import os
+
+import numpy as np
+
+from xfoil import read_polar, foil_name
+
+
+# One fixed-width record per polar point. alpha is kept in full so range
+# queries with bounds like 0.1 match exactly what the polar file said.
+dtype = np.dtype([('foil', 'i4'), ('M', 'i1'), ('P', 'i1'), ('XX', 'i1'),
+                  ('Re', 'f8'), ('alpha', 'f8'), ('CL', 'f4'), ('CD', 'f4'),
+                  ('CDp', 'f4'), ('CM', 'f4'), ('Top_Xtr', 'f4'),
+                  ('Bot_Xtr', 'f4')])
+
+# Layout of the records, saved with the index. A store written with another
+# layout is started afresh and filled again from the polar files.
+layout = str(dtype.descr)
+
+# Fraction of the rows file that may be rows of changed or deleted polars
+# before sync rewrites it without them
+GARBAGE = 0.5
+
+# Zone map with one entry per ingested polar file, used to skip whole files
+# when querying
+chunk_dtype = np.dtype([('start', 'i8'), ('stop', 'i8'), ('foil', 'i4'),
+                        ('Re', 'f8'), ('alpha_min', 'f8'), ('alpha_max', 'f8'),
+                        ('mtime', 'f8'), ('size', 'i8'), ('live', '?')])
+
+
+class PolarStore(object):
+    """
+    Append-only store of polar points kept as a memory-mapped array of
+    fixed-width records. Each PACC file is parsed once when it is ingested,
+    and queries by foil, Reynolds number or alpha range only read the files'
+    worth of rows that can match.
+    """
+
+    def __init__(self, path='data/store'):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.rows_path = os.path.join(path, 'rows.bin')
+        self.chunks_path = os.path.join(path, 'chunks.npy')
+        self.index_path = os.path.join(path, 'index.json')
+        self._load()
+
+    def _load(self):
+        self.chunks = np.zeros(0, chunk_dtype)
+        self.foils, self.files = [], []
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get('layout') != layout:
+                for path in [self.rows_path, self.chunks_path, self.index_path]:
+                    if os.path.exists(path):
+                        os.remove(path)
+                return
+            self.foils, self.files = index['foils'], index['files']
+            self.chunks = np.load(self.chunks_path)
+
+    def _save(self):
+        np.save(self.chunks_path, self.chunks)
+        with open(self.index_path, 'w') as f:
+            json.dump(dict(layout=layout, foils=self.foils, files=self.files), f)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # Serialise writers, and pick up anything they added before we write
+        with open(os.path.join(self.path, 'lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._load()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return int((self.chunks['stop'] - self.chunks['start'])[self.chunks['live']].sum())
+
+    def garbage(self):
+        # Rows of polar files that have changed or gone since they were ingested
+        return int((self.chunks['stop'] - self.chunks['start'])[~self.chunks['live']].sum())
+
+    def _ingest(self, file):
+        stat = os.stat(file)
+        name = os.path.abspath(file)
+        live = [i for i, f in enumerate(self.files)
+                if f == name and self.chunks['live'][i]]
+        for i in live:
+            if (self.chunks['mtime'][i] == stat.st_mtime and
+                    self.chunks['size'][i] == stat.st_size):
+                return 0
+            # The file changed since it was ingested, so its old rows are stale
+            self.chunks['live'][i] = False
+
+        columns, points, info = read_polar(file)
+        airfoil = foil_name(file)
+        if airfoil not in self.foils:
+            self.foils.append(airfoil)
+
+        rows = np.zeros(len(points), dtype)
+        rows['foil'] = self.foils.index(airfoil)
+        digits = [int(d) for d in airfoil] if airfoil.isdigit() else [-1] * 4
+        rows['M'], rows['P'] = digits[0], digits[1]
+        rows['XX'] = digits[2] * 10 + digits[3] if digits[0] >= 0 else -1
+        rows['Re'] = info.get('Re', np.nan)
+        for i, column in enumerate(columns):
+            if column in dtype.names:
+                rows[column] = points[:, i]
+
+        start = os.path.getsize(self.rows_path) // dtype.itemsize \
+            if os.path.exists(self.rows_path) else 0
+        with open(self.rows_path, 'ab') as f:
+            rows.tofile(f)
+
+        chunk = np.zeros(1, chunk_dtype)
+        chunk['start'], chunk['stop'] = start, start + len(rows)
+        chunk['foil'] = self.foils.index(airfoil)
+        chunk['Re'] = info.get('Re', np.nan)
+        if len(rows):
+            chunk['alpha_min'] = rows['alpha'].min()
+            chunk['alpha_max'] = rows['alpha'].max()
+        chunk['mtime'], chunk['size'], chunk['live'] = stat.st_mtime, stat.st_size, True
+        self.chunks = np.concatenate([self.chunks, chunk])
+        self.files.append(name)
+        return len(rows)
+
+    def ingest(self, files):
+        """
+        Append the points from each new or changed polar file. Returns the
+        number of rows added.
+        """
+        with self._locked():
+            added = sum(self._ingest(file) for file in files)
+            self._save()
+        return added
+
+    def sync(self, pattern='data/*.dat'):
+        """
+        Ingest new or changed files matching `pattern` and forget rows from
+        matching files that have since been deleted. The rows file is
+        compacted once more than `GARBAGE` of it is forgotten rows.
+        """
+        files = glob.glob(pattern)
+        present = set(os.path.abspath(file) for file in files)
+        folder = os.path.abspath(os.path.dirname(pattern))
+        with self._locked():
+            added = sum(self._ingest(file) for file in files)
+            for i, name in enumerate(self.files):
+                if os.path.dirname(name) == folder and name not in present:
+                    self.chunks['live'][i] = False
+            if self.garbage() > GARBAGE * (len(self) + self.garbage()):
+                self._compact()
+            else:
+                self._save()
+        return added
+
+    def query(self, foil=None, Re=None, alpha=None):
+        """
+        Return the matching rows as a record array. `foil` is a name or list
+        of names, `Re` a value or (low, high) range and `alpha` a (low, high)
+        range.
+        """
+        chunks = self.chunks
+        keep = chunks['live'].copy()
+        if foil is not None:
+            names = [foil] if isinstance(foil, str) else foil
+            ids = [self.foils.index(f) for f in names if f in self.foils]
+            keep &= np.isin(chunks['foil'], ids)
+        if Re is not None:
+            low, high = Re if np.ndim(Re) else (Re, Re)
+            keep &= (chunks['Re'] >= low) & (chunks['Re'] <= high)
+        if alpha is not None:
+            keep &= (chunks['alpha_max'] >= alpha[0]) & (chunks['alpha_min'] <= alpha[1])
+
+        chunks = chunks[keep]
+        lengths = chunks['stop'] - chunks['start']
+        if not lengths.sum():
+            return np.zeros(0, dtype)
+
+        # Row numbers of every selected chunk, without a Python loop
+        offsets = np.repeat(chunks['start'] - np.cumsum(lengths) + lengths, lengths)
+        rows = np.memmap(self.rows_path, dtype, 'r')[offsets + np.arange(lengths.sum())]
+
+        # Zone maps only bound the range, so filter the rows themselves
+        if alpha is not None:
+            rows = rows[(rows['alpha'] >= alpha[0]) & (rows['alpha'] <= alpha[1])]
+        return rows
+
+    def frame(self, **query):
+        # Matching rows as a DataFrame laid out like load_df's output
+        import pandas as pd
+
+        rows = self.query(**query)
+        df = pd.DataFrame({name: rows[name] for name in dtype.names[5:]})
+        for name in ['M', 'P', 'XX', 'Re']:
+            df[name] = rows[name]
+        df['Airfoil'] = np.array(self.foils, dtype=object)[rows['foil']] \
+            if len(rows) else []
+        return df
+
+    def compact(self):
+        # Rewrite the store with only the live rows
+        with self._locked():
+            self._compact()
+
+    def _compact(self):
+        rows = np.fromfile(self.rows_path, dtype) \
+            if os.path.exists(self.rows_path) else np.zeros(0, dtype)
+        live = self.chunks['live']
+        parts = [rows[c['start']:c['stop']] for c in self.chunks[live]]
+        files = [f for f, keep in zip(self.files, live) if keep]
+
+        chunks = self.chunks[live].copy()
+        lengths = chunks['stop'] - chunks['start']
+        chunks['start'] = np.cumsum(lengths) - lengths
+        chunks['stop'] = np.cumsum(lengths)
+
+        # A new file, so readers part way through a query keep the old one
+        tmp = self.rows_path + '.tmp'
+        np.concatenate(parts or [np.zeros(0, dtype)]).tofile(tmp)
+        os.rename(tmp, self.rows_path)
+        self.chunks, self.files = chunks, files
+        self._save()
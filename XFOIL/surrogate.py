@@ -0,0 +1,218 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from xfoil import NCRIT, alpha_range, load_data
+
+
+# Inputs of the model, and the distance in each over which polars change
+# appreciably. Inputs are divided by these before measuring distances.
+FEATURES = ['M', 'P', 'XX', 'logRe', 'alpha']
+SCALES = dict(M=1.0, P=2.0, XX=2.0, logRe=0.3, alpha=1.5)
+
+
+def features(M, P, XX, Re, alpha):
+    # Stack the model inputs for a set of points as an (n, 5) array
+    M, P, XX, Re, alpha = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in
+                                                (M, P, XX, Re, alpha)])
+    return np.column_stack([M.ravel(), P.ravel(), XX.ravel(),
+                            np.log10(Re.ravel()), alpha.ravel()])
+
+
+def foil_name(M, P, XX):
+    return '{:d}{:d}{:02d}'.format(int(M), int(P), int(XX))
+
+
+class PolarSurrogate(object):
+    """
+    Predicts CL and CD from the polars we already have, with an uncertainty.
+
+    Each query is answered by a Gaussian process fitted to its `k` nearest
+    polar points (a squared exponential kernel over the scaled inputs in
+    `SCALES`), all queries in a batch at once. CD is modelled as log(CD) so
+    it stays positive. As nothing is fitted globally, adding points only
+    means rebuilding the neighbour search tree.
+    """
+
+    targets = ['CL', 'CD']
+
+    def __init__(self, df=None, k=24, scales=SCALES, nugget=1e-4):
+        self.k = k
+        self.scales = np.array([scales[f] for f in FEATURES])
+        self.nugget = nugget
+        self.X = np.empty((0, len(FEATURES)))
+        self.Y = np.empty((0, len(self.targets)))
+        self.tree = None
+        if df is not None:
+            self.add(df)
+
+    @classmethod
+    def from_store(cls, **query):
+        # Fit to everything in data/, or the part of it picked by `query`
+        return cls(load_data(**query))
+
+    def add(self, df):
+        """
+        Add polar points, a DataFrame with the M, P, XX, Re, alpha, CL and CD
+        columns of `load_data`.
+        """
+        df = df.dropna(subset=['CL', 'CD'])
+        df = df[df['CD'] > 0]
+        if not len(df):
+            return self
+        X = features(df['M'], df['P'], df['XX'], df['Re'], df['alpha'])
+        Y = np.column_stack([df['CL'], np.log(df['CD'])])
+        self.X = np.vstack([self.X, X / self.scales])
+        self.Y = np.vstack([self.Y, Y])
+        self.tree = cKDTree(self.X)
+        return self
+
+    def __len__(self):
+        return len(self.X)
+
+    def predict(self, M, P, XX, Re, alpha):
+        """
+        Mean and standard deviation of CL and CD at each point, each an array
+        of shape (n, 2) with columns CL, CD.
+        """
+        Xq = features(M, P, XX, Re, alpha) / self.scales
+        k = min(self.k, len(self.X))
+        _, idx = self.tree.query(Xq, k=k)
+        idx = idx.reshape(len(Xq), k)
+        Xn, Yn = self.X[idx], self.Y[idx]
+
+        # Kernel between the neighbours, and between them and the query
+        K = np.exp(-0.5 * ((Xn[:, :, None, :] - Xn[:, None, :, :])**2).sum(-1))
+        K += self.nugget * np.eye(k)
+        kq = np.exp(-0.5 * ((Xn - Xq[:, None, :])**2).sum(-1))
+        w = np.linalg.solve(K, kq[..., None])[..., 0]
+
+        # Around the local mean, with the local spread as the prior variance
+        mean = Yn.mean(axis=1)
+        prior = np.maximum(Yn.var(axis=1), 1e-6)
+        mu = mean + np.einsum('nk,nkt->nt', w, Yn - mean[:, None, :])
+        var = prior * np.clip(1 - (w * kq).sum(-1), 0, 1)[:, None] + self.nugget * prior
+        sigma = np.sqrt(var)
+
+        # Back from log(CD)
+        CD = np.exp(mu[:, 1])
+        return np.column_stack([mu[:, 0], CD]), np.column_stack([sigma[:, 0], CD * sigma[:, 1]])
+
+
+class Predictor(object):
+    """
+    Answers polar queries from a `PolarSurrogate`, and runs xfoil for the
+    points it isn't sure enough about: where the standard deviation of CL
+    is over `max_std`, or that of CD over `max_std` times CD. The xfoil
+    results are added to the model (and to the polar `cache` if given) so
+    the same region is cheap from then on.
+    """
+
+    def __init__(self, model=None, max_std=0.02, cache=None, timeout=60):
+        self.model = model if model is not None else PolarSurrogate.from_store()
+        self.max_std = max_std
+        self.cache = cache
+        self.timeout = timeout
+        self.session = None
+        self.xfoil_points = 0
+
+    def query(self, M, P, XX, Re, alpha):
+        """
+        Predict CL and CD at every combination of the inputs broadcast
+        together. Returns a DataFrame of the inputs, the predictions, their
+        standard deviations and whether each came from the model or xfoil.
+        """
+        # The inputs as given, so Re goes on to xfoil and the cache exactly
+        # as the caller wrote it rather than rebuilt from log(Re)
+        inputs = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in (M, P, XX, Re, alpha)])
+        df = pd.DataFrame(dict(zip(['M', 'P', 'XX', 'Re', 'alpha'], [v.ravel() for v in inputs])))
+        df['source'] = 'model'
+
+        mean, std = np.full((len(df), 2), np.nan), np.full((len(df), 2), np.inf)
+        if len(self.model):
+            mean, std = self.model.predict(df.M, df.P, df.XX, df.Re, df.alpha)
+        unsure = ~((std[:, 0] <= self.max_std) & (std[:, 1] <= self.max_std * mean[:, 1]))
+
+        if unsure.any():
+            solved = self.run_xfoil(df[unsure])
+            if len(solved):
+                self.model.add(solved)
+                key = ['M', 'P', 'XX', 'Re', 'alpha']
+                # Polar files give alpha to 3 decimals
+                merged = df[key].assign(alpha=df.alpha.round(3)).reset_index().merge(
+                    solved.assign(alpha=solved.alpha.round(3))[key + ['CL', 'CD']],
+                    on=key, how='inner')
+                mean[merged['index'].values] = merged[['CL', 'CD']].values
+                std[merged['index'].values] = 0
+                df.loc[merged['index'].values, 'source'] = 'xfoil'
+
+        df['CL'], df['CD'] = mean[:, 0], mean[:, 1]
+        df['CL_std'], df['CD_std'] = std[:, 0], std[:, 1]
+        return df
+
+    def run_xfoil(self, df):
+        # Solve the given points, one polar per foil and Reynolds number
+        from session import Session
+
+        if self.session is None:
+            self.session = Session(ncrit=NCRIT, timeout=self.timeout)
+        solved = []
+        for (M, P, XX, Re), group in df.groupby(['M', 'P', 'XX', 'Re']):
+            foil = foil_name(M, P, XX)
+            alphas = np.sort(group.alpha.round(4).unique())
+            self.session.load_naca(foil)
+            columns, rows, _ = self.session.polar(alphas, Re)
+            self.xfoil_points += len(alphas)
+            if not len(rows):
+                continue
+            points = pd.DataFrame(rows, columns=columns)
+            if self.cache is not None:
+                self.cache.store('NACA ' + foil, Re, NCRIT, columns, rows)
+            solved.append(points.assign(M=M, P=P, XX=XX, Re=Re, Airfoil=foil))
+        return pd.concat(solved, ignore_index=True) if solved else pd.DataFrame()
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Predict polars from the XFOIL results in data/.')
+    parser.add_argument('start', type=float, help='Start angle of sweep.')
+    parser.add_argument('stop', nargs='?', type=float, default=None,
+                        help='End angle of sweep. The sweep includes this value.')
+    parser.add_argument('step', nargs='?', type=float, default=1,
+                        help='Spacing between values.')
+    parser.add_argument('--foil', '-f', nargs='+', default=['0012'],
+                        help='NACA XXXX foil(s)')
+    parser.add_argument('--Reynolds', '-R', nargs='+', type=float, default=[6e6],
+                        help='Reynolds number(s)')
+    parser.add_argument('--max-std', type=float, default=0.02,
+                        help='Run xfoil where the CL standard deviation (or relative CD one) is larger.')
+    parser.add_argument('--cache', '-c', default=None,
+                        help='Polar cache database to keep the xfoil results in.')
+    args = parser.parse_args()
+    if args.stop is None:
+        args.stop = args.start
+
+    cache = None
+    if args.cache:
+        from cache import PolarCache
+        cache = PolarCache(args.cache)
+
+    digits = np.array([[int(foil[0]), int(foil[1]), int(foil[2:])] for foil in args.foil])
+    alphas = alpha_range(args.start, args.stop, args.step)
+    M, Re, alpha = np.meshgrid(np.arange(len(digits)), args.Reynolds, alphas, indexing='ij')
+    with Predictor(max_std=args.max_std, cache=cache) as predictor:
+        df = predictor.query(digits[M, 0], digits[M, 1], digits[M, 2], Re, alpha)
+        print(df.to_string(index=False))
+        print('{} of {} points from xfoil'.format(predictor.xfoil_points, len(df)))
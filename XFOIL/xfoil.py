@@ -1,13 +1,25 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-import pandas as pd
+import numpy as np
+import multiprocessing
+import re
 import subprocess
+import tempfile
+import shutil
 import glob
 import os
 import argparse
 
 
+# Name of the xfoil executable, overridable to point at a specific build
+XFOIL = os.environ.get('XFOIL', 'xfoil')
+
+# Critical amplification factor used for all viscous runs
+NCRIT = 9
+
+# Matches the "Mach = ... Re = ... Ncrit = ..." line of a polar file
+_header = re.compile(r'Mach\s*=\s*([-\d.]+)\s+Re\s*=\s*([-\d.]+)\s*e\s*(\d+)'
+                     r'\s+Ncrit\s*=\s*([-\d.]+)')
+
+
 def clean(foil):
     # Make folder or delete files that exist
     for folder in ['logs', 'data', 'imgs']:
@@ -19,84 +31,552 @@ def clean(foil):
                 os.remove(f)
 
 
-def main(foil, **kwds):
-    # If data from this foil already exists, delete it
+def run_xfoil(commands, log, cwd=None, timeout=None):
+    # Feed a command script to xfoil, killing it if it hangs past the timeout
+    with open(log, 'w') as stdout:
+        p = subprocess.Popen(XFOIL,
+                             stdin=subprocess.PIPE,
+                             stdout=stdout,
+                             stderr=subprocess.STDOUT,
+                             cwd=cwd)
+        try:
+            p.communicate(bytes(commands, 'UTF-8'), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            p.kill()
+            p.communicate()
+            raise
+    return p.returncode
+
+
+def commands(name, Reynolds, start=None, stop=None, step=None, alphas=None,
+             Ncrit=NCRIT, save_foil=False):
+    # Fill in the command template with an ASEQ sweep or a list of ALFA points,
+    # saving the foil coordinates to data/ only when asked
+    if alphas is None:
+        sweep = 'ASEQ {} {} {}'.format(start, stop, step)
+    else:
+        sweep = '\n'.join('ALFA {}'.format(alpha) for alpha in alphas)
+    save = 'SAVE\ndata/{}.foil\n'.format(name) if save_foil else ''
+    return cmd_template.format(NACA_NAME=name, Reynolds=Reynolds, Ncrit=Ncrit,
+                               sweep=sweep, save=save)
+
+
+def alpha_range(start, stop, step):
+    # Angles of an ASEQ sweep, which includes the stop value
+    if step == 0 or start == stop:
+        return np.array([start], dtype=float)
+    return np.arange(start, stop + step / 2., step)
+
+
+def branches(alphas):
+    # Angles marching outwards from zero: positive ones up, negative ones down
+    alphas = np.asarray(sorted(alphas), dtype=float)
+    return [alphas[alphas >= 0], alphas[alphas < 0][::-1]]
+
+
+def refine(solve, alphas, tolerance=0.05, min_step=0.1, budget=100):
+    """
+    Adaptive sweep. Solve the coarse `alphas`, then keep bisecting the
+    intervals where the slope dCL/dalpha changes by more than `tolerance`
+    (in CL over the interval) or where only one end converged, until no
+    interval needs it, intervals reach `min_step` or `budget` calls are used.
+
+    `solve(alphas)` solves a list of angles marching from the first and
+    returns a dict of {alpha: CL} for those that converged. New angles are
+    approached from the nearest converged angle on the side of zero, so
+    xfoil has a good boundary layer to start from.
+
+    Returns the converged angles and the number of calls made.
+    """
+    converged, tried, calls = {}, set(), 0
+
+    def run(new):
+        # Solve new angles branch by branch, stepping to each one from the
+        # nearest converged angle when the last one solved is further away
+        new = [round(alpha, 4) for alpha in new]
+        done = 0
+        for branch in branches(new):
+            sequence = []
+            for alpha in branch:
+                inner = [a for a in converged if 0 <= np.sign(alpha)*a < abs(alpha)] \
+                    if alpha else []
+                if inner:
+                    lead = min(inner, key=lambda a: abs(alpha - a))
+                    if not sequence or abs(sequence[-1] - alpha) > abs(lead - alpha):
+                        sequence.append(lead)
+                sequence.append(alpha)
+            if sequence:
+                converged.update(solve(sequence))
+                done += len(sequence)
+        tried.update(new)
+        return done
+
+    calls += run(list(alphas)[:budget])
+    while calls < budget:
+        points = sorted(tried)
+        candidates = []
+        for i, (a, b) in enumerate(zip(points[:-1], points[1:])):
+            if b - a < 2*min_step:
+                continue
+            ok = a in converged, b in converged
+            if ok[0] != ok[1]:
+                # Convergence boundary, e.g. stall: always worth narrowing
+                candidates.append((np.inf, a, b))
+                continue
+            if not all(ok):
+                continue
+            slope = (converged[b] - converged[a])/(b - a)
+            change = 0
+            for c, d in [(points[i - 1] if i else None, a),
+                         (b, points[i + 2] if i + 2 < len(points) else None)]:
+                if c in converged and d in converged:
+                    change = max(change, abs((converged[d] - converged[c])/(d - c) - slope)*(b - a))
+            if change > tolerance:
+                candidates.append((change, a, b))
+        if not candidates:
+            break
+
+        # Spend what is left of the budget on the worst intervals first
+        candidates.sort(key=lambda c: (-c[0], c[1]))
+        new = [(a + b)/2 for _, a, b in candidates[:max(1, (budget - calls)//2)]]
+        calls += run(new)
+    return sorted(converged), calls
+
+
+def adaptive_polar(session, foil, Reynolds, start, stop, step, cache=None, **kwds):
+    """
+    Solve `foil` on an xfoil `session` with an adaptive sweep (see `refine`),
+    starting from a coarse ASEQ-like sweep. Points in the polar `cache`, if
+    given, are taken from there. Returns the polar as in `read_polar`.
+    """
+    name = 'NACA ' + foil
+    columns = ['alpha', 'CL', 'CD', 'CDp', 'CM', 'Top_Xtr', 'Bot_Xtr']
+    points = {}
+
+    def solve(alphas):
+        found = {}
+        if cache is not None:
+            found = cache.lookup(name, Reynolds, NCRIT, alphas)
+            alphas = [alpha for alpha in alphas if round(alpha, 4) not in found]
+        if len(alphas):
+            session.load_naca(foil)
+            cols, rows, _ = session.polar(alphas, Reynolds)
+            if len(rows):
+                rows = rows[:, [cols.index(c) for c in columns]]
+                if cache is not None:
+                    cache.store(name, Reynolds, NCRIT, columns, rows)
+                found.update((round(row[0], 4), list(row[1:])) for row in rows)
+        points.update(found)
+        return dict((alpha, values[0]) for alpha, values in found.items())
+
+    alphas, calls = refine(solve, alpha_range(start, stop, step), **kwds)
+    print('{} Re={:.3g}: {} points from {} solves'.format(name, Reynolds, len(alphas), calls))
+    rows = np.array([[alpha] + list(points[alpha]) for alpha in alphas]).reshape(-1, len(columns))
+    return columns, rows, dict(Mach=0, Re=Reynolds, Ncrit=NCRIT)
+
+
+def grid_polar(session, foil, Reynolds, alphas):
+    """
+    Solve `foil` at every combination of the Reynolds numbers and angles on
+    one xfoil `session`. Each Reynolds number is swept outwards from the
+    angle nearest zero, up and then down, so every point starts from the
+    converged one next to it. The Reynolds numbers are taken from the
+    highest down, both branches of each sweep starting from the solution
+    at that angle for the previous Reynolds number. Each polar is also
+    saved to data/.
+
+    Returns a tidy DataFrame with a row per point of the grid, and
+    `converged` False (and NaN results) where xfoil didn't converge.
+    """
+    import pandas as pd
+
+    alphas = np.unique(np.round(np.asarray(alphas, dtype=float), 4))
+    origin = alphas[np.argmin(np.abs(alphas))]
+    up, down = list(alphas[alphas > origin]), list(alphas[alphas < origin][::-1])
+    Reynolds = sorted(Reynolds, reverse=True)
+    name = 'NACA ' + foil
+
+    session.load_naca(foil)
+    tables = []
+    for i, Re in enumerate(Reynolds):
+        solved = {}
+        for k, branch in enumerate([up, down]):
+            if k and not branch:
+                continue
+            if k:
+                # Back to the start of the sweep, from the previous Reynolds
+                # number's converged solution there (or afresh for the first)
+                session.reinit()
+                if i:
+                    session.polar([origin], Reynolds[i - 1])
+            columns, rows, info = session.polar([origin] + branch, Re)
+            for row in rows:
+                solved.setdefault(round(row[0], 4), row)
+
+        # Leave a converged solution at the origin for the next Reynolds number
+        if i + 1 < len(Reynolds) and (up or down):
+            session.reinit()
+            session.polar([origin], Re)
+
+        rows = np.array([solved[alpha] for alpha in sorted(solved)]).reshape(-1, len(columns))
+        write_polar('data/{} Re{:.0f}.dat'.format(name, Re), name, columns, rows,
+                    dict(Mach=0, Re=Re, Ncrit=NCRIT))
+        tables.append(pd.DataFrame(rows, columns=columns).assign(Re=Re))
+
+    # One row per point of the grid, whether it converged or not
+    grid = pd.DataFrame([(Re, alpha) for Re in Reynolds for alpha in alphas],
+                        columns=['Re', 'alpha'])
+    solved = pd.concat(tables, ignore_index=True).assign(converged=True)
+    solved['alpha'] = solved['alpha'].round(4)
+    df = grid.merge(solved, on=['Re', 'alpha'], how='left')
+    df['converged'] = df['converged'].eq(True)
+    df.insert(0, 'Airfoil', foil)
+    df.insert(1, 'M', int(foil[0]))
+    df.insert(2, 'P', int(foil[1]))
+    df.insert(3, 'XX', int(foil[2:4]))
+    print('{}: {} of {} points converged'.format(name, df.converged.sum(), len(df)))
+    return df.sort_values(['Re', 'alpha']).reset_index(drop=True)
+
+
+def grid(foils, Reynolds, alphas, workers=None, timeout=None):
+    """
+    Solve every foil over the grid of Reynolds numbers and angles, one warm
+    xfoil session per foil at a time (see `grid_polar`). Returns one tidy
+    table of them all.
+    """
+    import pandas as pd
+    from session import SessionError, SessionPool
+
+    for folder in ['logs', 'data', 'imgs']:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    def run(session, foil):
+        try:
+            return grid_polar(session, foil, Reynolds, alphas)
+        except SessionError as e:
+            print('NACA {}: {}'.format(foil, e))
+            return pd.DataFrame()
+
+    workers = min(workers or multiprocessing.cpu_count(), len(foils))
+    with SessionPool(workers, timeout=timeout or 60) as sessions:
+        tables = sessions.map(run, foils)
+    return pd.concat(tables, ignore_index=True)
+
+
+def main(foil, cache=None, adaptive=None, load=True, **kwds):
+    # If data from this foil already exists, delete it. Returns all our data
+    # afterwards, unless `load` is False.
     clean(foil)
+    name = 'NACA ' + foil
+    print(foil)
+
+    # Refine the sweep around stall on a warm session
+    if adaptive is not None:
+        from session import Session
+        save = kwds.pop('save_foil', False)
+        with Session() as session:
+            if save:
+                write_foil('data/' + name + '.foil', name, session.naca_coordinates(foil))
+            columns, rows, info = adaptive_polar(session, foil, cache=cache,
+                                                 **dict(kwds, **adaptive))
+        write_polar('data/' + name + '.dat', name, columns, rows, info)
+        if cache is not None:
+            print('Cache: {hits} hits, {misses} misses, {points} points'.format(
+                **cache.stats()))
+        return load_data() if load else None
+
+    # Only ask xfoil for the angles the cache doesn't already have
+    alphas, cached = None, {}
+    if cache is not None:
+        requested = alpha_range(kwds['start'], kwds['stop'], kwds['step'])
+        cached = cache.lookup(name, kwds['Reynolds'], NCRIT, requested)
+        alphas = [alpha for alpha in requested if round(alpha, 4) not in cached]
 
     # Run each foil and output log file
-    with open('logs/NACA ' + foil + '.log', 'w') as stdout:
-        p = subprocess.Popen('xfoil',
-                             stdin=subprocess.PIPE,
-                             stdout=stdout)
+    if alphas is None or len(alphas):
+        run_xfoil(commands(name, alphas=alphas, **kwds), 'logs/' + name + '.log')
+
+    if cache is not None:
+        merge_cached(cache, name, kwds['Reynolds'], cached)
+        print('Cache: {hits} hits, {misses} misses, {points} points'.format(
+            **cache.stats()))
+
+    return load_data() if load else None
 
-        print(foil)
-        commands = cmd_template.format(NACA_NAME='NACA ' + foil, **kwds)
-        p.stdin.write(bytes(commands, 'UTF-8'))
-        p.communicate()[0]
-        p.stdin.close()
 
-    return load_data()
+def merge_cached(cache, name, Reynolds, cached):
+    """
+    Store the points xfoil just solved in the cache and rewrite the polar file
+    with those and the cached points together.
+    """
+    file = 'data/' + name + '.dat'
+    columns, rows, info = ['alpha'] + cache.columns, np.empty((0, 7)), {}
+    if os.path.exists(file) and read_polar(file)[0]:
+        columns, rows, info = read_polar(file)
+    cache.store(name, Reynolds, NCRIT, columns, rows)
+
+    solved = set(np.round(rows[:, columns.index('alpha')], 4))
+    extra = [[alpha] + point for alpha, point in cached.items()
+             if alpha not in solved]
+    order = [columns.index(c) for c in ['alpha'] + cache.columns]
+    rows = np.vstack([rows[:, order], np.array(extra).reshape(-1, len(order))])
+    rows = rows[np.argsort(rows[:, 0])]
+
+    info = dict(dict(Mach=0, Re=Reynolds, Ncrit=NCRIT), **info)
+    write_polar(file, name, ['alpha'] + cache.columns, rows, info)
+
+
+def run_job(job):
+    """
+    Run one (foil, Reynolds) job in its own scratch directory and move the
+    results into the shared `data/` and `logs/` folders once it finishes.
+    """
+    foil, Reynolds, kwds, timeout, retries = job
+    name = 'NACA ' + foil
+    tag = '{} Re{:.0f}'.format(name, Reynolds)
+    script = commands(name, Reynolds, **kwds)
+
+    scratch = tempfile.mkdtemp(prefix='xfoil_')
+    polar = os.path.join(scratch, 'data', name + '.dat')
+    log = os.path.join(scratch, name + '.log')
+    status, attempts = 'failed', 0
+    try:
+        os.makedirs(os.path.join(scratch, 'data'))
+        while attempts <= retries:
+            attempts += 1
+            # XFOIL would ask to append to a partial polar, so start fresh
+            if os.path.exists(polar):
+                os.remove(polar)
+            try:
+                run_xfoil(script, log, cwd=scratch, timeout=timeout)
+                status = 'ok'
+                break
+            except subprocess.TimeoutExpired:
+                status = 'timeout'
+
+        # Keep whatever was produced, even for runs that timed out
+        for src, dst in [(polar, 'data/' + tag + '.dat'),
+                         (polar[:-4] + '.foil', 'data/' + name + '.foil'),
+                         (log, 'logs/' + tag + '.log')]:
+            if os.path.exists(src):
+                shutil.move(src, dst)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    path = 'data/' + tag + '.dat'
+    if status == 'ok' and not (os.path.exists(path) and len(read_polar(path)[1])):
+        status = 'empty'
+
+    print('{} Re={:.3g}: {} ({} attempt{})'.format(
+        name, Reynolds, status, attempts, 's' if attempts > 1 else ''))
+    return dict(Airfoil=foil, Re=Reynolds, status=status, attempts=attempts), path
+
+
+def run_warm(session, job):
+    """
+    Run one (foil, Reynolds) job on an already running xfoil session.
+    """
+    from session import SessionError
+
+    foil, Reynolds, kwds, timeout, retries = job
+    tag = 'NACA {} Re{:.0f}'.format(foil, Reynolds)
+    kwds = dict(kwds)
+    adaptive = kwds.pop('adaptive', None)
+    save = kwds.pop('save_foil', False)
+    alphas = alpha_range(kwds['start'], kwds['stop'], kwds['step'])
+
+    status, attempts = 'failed', 0
+    while attempts <= retries:
+        attempts += 1
+        try:
+            if save:
+                write_foil('data/NACA ' + foil + '.foil', 'NACA ' + foil,
+                           session.naca_coordinates(foil))
+            session.load_naca(foil)
+            if adaptive is None:
+                session.polar(alphas, Reynolds, save='data/' + tag + '.dat')
+            else:
+                columns, rows, info = adaptive_polar(session, foil, Reynolds,
+                                                     **dict(kwds, **adaptive))
+                write_polar('data/' + tag + '.dat', 'NACA ' + foil, columns, rows, info)
+            status = 'ok'
+            break
+        except SessionError:
+            status = 'timeout'
+            try:
+                session.start()
+            except (SessionError, OSError) as e:
+                # Give up on this job, not the rest of the batch
+                print('NACA {} Re={:.3g}: could not restart xfoil: {}'.format(foil, Reynolds, e))
+                status = 'failed'
+                break
+
+    path = 'data/' + tag + '.dat'
+    if status == 'ok' and not len(read_polar(path)[1]):
+        status = 'empty'
+
+    print('NACA {} Re={:.3g}: {} ({} attempt{})'.format(
+        foil, Reynolds, status, attempts, 's' if attempts > 1 else ''))
+    return dict(Airfoil=foil, Re=Reynolds, status=status, attempts=attempts), path
+
+
+def batch(foils, Reynolds, workers=None, timeout=None, retries=1, warm=False,
+          adaptive=None, load=True, **kwds):
+    """
+    Run every combination of `foils` and `Reynolds` across a pool of worker
+    processes, or across a pool of warm xfoil sessions with `warm`. An
+    `adaptive` sweep (a dict of `refine` settings) always uses warm sessions.
+    Returns the combined polar DataFrame and a per-job summary, or with
+    `load` False None and the summary as a list of dicts, leaving pandas
+    unloaded.
+    """
+    for folder in ['logs', 'data', 'imgs']:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    if adaptive is not None:
+        warm = True
+        kwds = dict(kwds, adaptive=adaptive)
+    jobs = [(foil, Re, kwds, timeout, retries)
+            for foil in foils for Re in Reynolds]
+    workers = max(1, min(workers or multiprocessing.cpu_count(), len(jobs)))
+
+    if warm:
+        from session import SessionPool
+        with SessionPool(workers, timeout=timeout or 60) as sessions:
+            results = sessions.map(run_warm, jobs)
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = list(pool.imap_unordered(run_job, jobs))
+        finally:
+            pool.close()
+            pool.join()
+
+    summary = [status for status, _ in results]
+    with open('logs/batch.csv', 'w') as f:
+        f.write('Airfoil,Re,status,attempts\n')
+        f.writelines('{Airfoil},{Re},{status},{attempts}\n'.format(**job) for job in summary)
+    if not load:
+        return None, summary
+
+    import pandas as pd
+    data = [load_df(path) for status, path in results if status['status'] == 'ok']
+    df = pd.concat(data).reset_index(drop=True) if data else pd.DataFrame()
+    return df, pd.DataFrame(summary)
+
+
+def read_polar(file):
+    """
+    Parse an XFOIL PACC polar file into its column names, an array of the
+    converged points and the Mach, Reynolds and Ncrit from the header.
+    """
+    with open(file) as f:
+        lines = f.readlines()
+
+    info = {}
+    columns = []
+    rows = []
+    for i, line in enumerate(lines):
+        match = _header.search(line)
+        if match:
+            mach, reynolds, exponent, ncrit = match.groups()
+            info = dict(Mach=float(mach), Re=float(reynolds) * 10**int(exponent),
+                        Ncrit=float(ncrit))
+        elif line.split()[:1] == ['alpha']:
+            columns = line.split()
+            rows = [row.split() for row in lines[i + 2:] if row.strip()]
+            break
+
+    if not columns:
+        return columns, np.empty((0, 0)), info
+    rows = np.array(rows, dtype=float).reshape(-1, len(columns))
+    return columns, rows, info
+
+
+def write_polar(file, name, columns, rows, info):
+    # Write points back out in the same layout as an XFOIL PACC file
+    exponent = int(np.floor(np.log10(info['Re']))) if info['Re'] > 0 else 0
+    header = [' ',
+              '       XFOIL         Version 6.97',
+              ' ',
+              ' Calculated polar for: ' + name,
+              ' ',
+              ' 1 1 Reynolds number fixed          Mach number fixed',
+              ' ',
+              ' xtrf =   1.000 (top)        1.000 (bottom)',
+              ' Mach = {:7.3f}     Re = {:9.3f} e {:d}     Ncrit = {:7.3f}'.format(
+                  info['Mach'], info['Re'] / 10**exponent, exponent, info['Ncrit']),
+              ' ',
+              '  ' + ' '.join('{:>8}'.format(c) for c in columns),
+              '  ' + ' '.join(['-' * 8] * len(columns))]
+    with open(file, 'w') as f:
+        f.write('\n'.join(header) + '\n')
+        np.savetxt(f, rows, fmt='%9.5f')
+
+
+def read_foil(file):
+    # Name and (x, y) coordinates of a foil file as saved by xfoil
+    with open(file) as f:
+        name = f.readline().strip()
+    return name, np.loadtxt(file, skiprows=1, ndmin=2)
+
+
+def write_foil(file, name, coordinates):
+    # Persist a design as a labelled coordinate file xfoil can LOAD
+    with open(file, 'w') as f:
+        f.write(name + '\n')
+        np.savetxt(f, coordinates, fmt='%.7e', delimiter=' ')
+
+
+def foil_name(file):
+    # Polar files are named 'NACA XXXX.dat', optionally with a suffix
+    return os.path.basename(file).split(' ')[1].split('.dat')[0]
 
 
 def load_df(file):
     # If no data was logged, return an empty DataFrame
-    with open(file) as f:
-        if len(f.readlines()) < 13:
-            return pd.DataFrame()
+    import pandas as pd
+
+    columns, rows, info = read_polar(file)
+    if len(rows) == 0:
+        return pd.DataFrame()
 
-    df = pd.read_csv(file, header=10, delim_whitespace=True)[1:]
-    airfoil = file.split(' ')[1].split('.dat')[0]
+    df = pd.DataFrame(rows, columns=columns)
+    airfoil = foil_name(file)
     max_camber = airfoil[0]
     max_camber_position = airfoil[1]
     thickness = airfoil[2:4]
 
-    df['M'] = max_camber
-    df['P'] = max_camber_position
-    df['XX'] = thickness
-
-    df = df.convert_objects(convert_numeric=True)
+    df['M'] = int(max_camber)
+    df['P'] = int(max_camber_position)
+    df['XX'] = int(thickness)
+    df['Re'] = info.get('Re', np.nan)
     df['Airfoil'] = airfoil
     return df
 
 
-def load_data():
-    # Load our data
-    files = glob.glob('data/*.dat')
-    data = [load_df(file) for file in files]
-    df = pd.concat(data).reset_index(drop=True)#.convert_objects(convert_numeric=True)
-    return df
-
-
-def plot(foil, df):
-    # Load data, plot airfoil
-    sns.set(style='ticks', context='notebook', font_scale=1.5)
+def load_data(**query):
+    """
+    Load our data from the polar store, ingesting any new or changed files in
+    `data/` first. Keyword arguments are passed to `PolarStore.query` to load
+    only part of it.
+    """
+    from store import PolarStore
 
-    # Just plot a single foil
-    d = df.query('Airfoil == @foil')
+    store = PolarStore('data/store')
+    store.sync('data/*.dat')
+    return store.frame(**query)
 
-    # If we just ran a single data point, don't plot
-    if len(d) == 1:
-        return
 
-    f, ax = plt.subplots(figsize=(5, 5))
-    d.plot(kind='line', x='CL', y='CD', legend=False)
-    plt.title('NACA ' + foil)
-    plt.xlabel('$C_L$')
-    plt.ylabel('$C_D$')
-    plt.tight_layout()
-    plt.savefig('imgs/NACA ' + foil + '_CL_vs_CD.png')
-    plt.close('all')
-    plt.clf()
-
-    f, ax = plt.subplots(figsize=(5, 5))
-    d.plot(kind='line', x='alpha', y='CL', legend=False)
-    plt.title('NACA ' + foil)
-    plt.ylabel('$C_L$')
-    plt.xlabel('$\\alpha$ (degrees)')
-    plt.tight_layout()
-    plt.savefig('imgs/NACA ' + foil + '_alpha_vs_CL.png')
-    plt.close('all')
-    plt.clf()
+def __getattr__(name):
+    # Plotting lives in plots.py, so matplotlib and seaborn are only loaded
+    # by those that plot
+    if name == 'plot':
+        from plots import plot
+        return plot
+    raise AttributeError("module 'xfoil' has no attribute '{}'".format(name))
 
 
 # XFOIL commands to run
@@ -105,41 +585,102 @@ cmd_template = '''
 PLOP
 G
 
-SAVE
-data/{NACA_NAME}.foil
-OPER
+{save}OPER
 VPAR
-N 9
+N {Ncrit}
 
 VISC {Reynolds}
 PACC
 data/{NACA_NAME}.dat
 
-ASEQ {start} {stop} {step}
+{sweep}
 
 QUIT
 '''
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Set the foil angle of attack and log results.')
-    parser.add_argument('start', type=int, help='Start angle of sweep.')
-    parser.add_argument('stop', nargs='?', type=int, default=None,
-                        help='End angle of sweep. The sweep does not include this value.')
-    parser.add_argument('step', nargs='?', type=int, default=1,
-                        help='Spacing between values.')
-    parser.add_argument('--foil', '-f', default='0012', help='NACA XXXX foil')
-    parser.add_argument('--Reynolds', '-R', type=float, default=6e6,
-                        help='Reynolds number')
+    parser.add_argument('start', type=float, help='Start angle of sweep.')
+    parser.add_argument('stop', nargs='?', type=float, default=None,
+                        help='End angle of sweep. The sweep includes this value.')
+    parser.add_argument('step', nargs='?', type=float, default=1,
+                        help='Spacing between values (of the coarse pass with --adaptive).')
+    parser.add_argument('--foil', '-f', nargs='+', default=['0012'],
+                        help='NACA XXXX foil(s), or MPXX-MPXX ranges of them')
+    parser.add_argument('--Reynolds', '-R', nargs='+', type=float, default=[6e6],
+                        help='Reynolds number(s)')
+    parser.add_argument('--workers', '-j', type=int, default=None,
+                        help='Number of xfoil processes to run at once (batch mode).')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Seconds before a hung xfoil run is killed (batch mode).')
+    parser.add_argument('--retries', type=int, default=1,
+                        help='Times to retry a run that timed out (batch mode).')
+    parser.add_argument('--warm', '-w', action='store_true', default=False,
+                        help='Reuse long-lived xfoil sessions (batch mode).')
+    parser.add_argument('--cache', '-c', default=None,
+                        help='Polar cache database; only uncached angles are run '
+                             '(single foil and Reynolds number only).')
+    parser.add_argument('--cache-size', type=int, default=1000000,
+                        help='Maximum number of polar points kept in the cache.')
+    parser.add_argument('--adaptive', '-a', action='store_true', default=False,
+                        help='Add angles where the lift curve bends or xfoil fails to converge.')
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help='Change in CL slope over an interval that gets it refined (adaptive).')
+    parser.add_argument('--min-step', type=float, default=0.1,
+                        help='Smallest angle spacing to refine to (adaptive).')
+    parser.add_argument('--budget', type=int, default=100,
+                        help='Most xfoil points to solve per polar (adaptive).')
+    parser.add_argument('--grid', '-g', default=None, metavar='CSV',
+                        help='Solve the whole Reynolds number by angle grid of each foil in one '
+                             'session, and save it as one table to CSV.')
+    parser.add_argument('--save-foil', action='store_true', default=False,
+                        help='Also save the foil coordinates to data/.')
+    parser.add_argument('--prescreen', type=float, default=None, metavar='KEEP',
+                        help='Only run the best KEEP fraction of the foils, ranked by a panel method.')
+    parser.add_argument('--cl', type=float, default=0.5,
+                        help='Lift coefficient to rank the foils at (prescreen).')
     parser.add_argument('--plot', '-p', action='store_true',
                         default=False, help='Plot time results')
     args = parser.parse_args()
     if args.stop is None:
         args.stop = args.start
 
-    # Run main script and optional plot
-    df = main(args.foil,
-              Reynolds=args.Reynolds,
-              start=args.start, stop=args.stop, step=args.step)
+    # Expand foil ranges, and keep only the most promising foils
+    if args.prescreen is not None or any('-' in foil for foil in args.foil):
+        from panel import expand, prescreen
+        args.foil = expand(args.foil)
+        if args.prescreen is not None:
+            ranked = prescreen(args.foil, cl=args.cl, keep=args.prescreen)
+            args.foil = list(ranked.Airfoil[ranked.keep])
+            print('Prescreen kept {} of {} foils: {}'.format(len(args.foil), len(ranked),
+                                                              ' '.join(args.foil)))
+
+    # Run main script, or the worker pool for more than one foil/Reynolds number
+    sweep = dict(start=args.start, stop=args.stop, step=args.step, save_foil=args.save_foil)
+    adaptive = None
+    if args.adaptive:
+        adaptive = dict(tolerance=args.tolerance, min_step=args.min_step, budget=args.budget)
+    single = len(args.foil) == 1 and len(args.Reynolds) == 1
+    if args.cache and (args.grid or not single or args.workers is not None or args.warm):
+        # The cache is one sqlite connection, not shared between workers
+        parser.error('--cache only works for a single foil and Reynolds number, '
+                     'without --grid, --workers or --warm')
+    if args.grid:
+        df = grid(args.foil, args.Reynolds, alpha_range(args.start, args.stop, args.step),
+                  workers=args.workers, timeout=args.timeout)
+        df.to_csv(args.grid, index=False)
+    elif single and args.workers is None and not args.warm:
+        cache = None
+        if args.cache:
+            from cache import PolarCache
+            cache = PolarCache(args.cache, max_points=args.cache_size)
+        df = main(args.foil[0], cache=cache, adaptive=adaptive, load=args.plot,
+                  Reynolds=args.Reynolds[0], **sweep)
+    else:
+        df, summary = batch(args.foil, args.Reynolds, workers=args.workers,
+                            timeout=args.timeout, retries=args.retries,
+                            warm=args.warm, adaptive=adaptive, load=args.plot, **sweep)
 
     if args.plot:
-        plot(args.foil, df)
+        from plots import render
+        render(df, args.foil, workers=args.workers)
@@ -0,0 +1,335 @@
+"""
+Benchmarks for foil geometry, OpenFOAM file generation, polar loading and
+the start-up time of the XFOIL CLI, plus the end-to-end XFOIL and OpenFOAM
+drivers run against the stand-in executables in XFOIL/stubs and
+OpenFoam/stubs, so they need neither program.
+
+Each benchmark runs over a grid of parameters (foil counts, Ni resolutions,
+polar database sizes, ...) and reports the best, median and mean time of a
+number of repeats, and the peak memory allocated by one more run. Results
+are saved as JSON under benchmarks/results so runs can be compared:
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --filter load_ --repeat 10
+    python benchmarks/bench.py --compare benchmarks/results/old.json
+"""
+import contextlib
+import itertools
+import subprocess
+import statistics
+import tracemalloc
+import platform
+import argparse
+import tempfile
+import shutil
+import time
+import json
+import sys
+import os
+import re
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+XFOIL_DIR = os.path.join(ROOT, 'XFOIL')
+FOAM_DIR = os.path.join(ROOT, 'OpenFoam')
+
+# Run everything against the stubs
+os.environ['XFOIL'] = os.path.join(XFOIL_DIR, 'stubs', 'xfoil')
+os.environ['PATH'] = os.path.join(FOAM_DIR, 'stubs') + os.pathsep + os.environ['PATH']
+os.environ.setdefault('MPLBACKEND', 'Agg')
+sys.path[:0] = [XFOIL_DIR, FOAM_DIR, os.path.join(FOAM_DIR, 'scripts')]
+
+import numpy as np
+
+
+# Registered benchmarks as (name, function, parameter grid)
+BENCHMARKS = []
+
+
+def benchmark(**grid):
+    """
+    Register a benchmark run for every combination of the keyword parameter
+    lists. The function gets one combination as keyword arguments, is called
+    in an empty scratch directory to do any setup, and returns the callable
+    to time.
+    """
+    def register(func):
+        BENCHMARKS.append((func.__name__, func, grid))
+        return func
+    return register
+
+
+def combinations(grid):
+    keys = sorted(grid)
+    for values in itertools.product(*[grid[key] for key in keys]):
+        yield dict(zip(keys, values))
+
+
+@contextlib.contextmanager
+def working_dir(folder):
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        yield folder
+    finally:
+        os.chdir(cwd)
+
+
+@contextlib.contextmanager
+def scratch():
+    # Run in a fresh temporary directory
+    folder = tempfile.mkdtemp(prefix='bench-')
+    try:
+        with working_dir(folder):
+            yield folder
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def quiet():
+    # Silence the benchmarks and any programs they run, down to the file descriptors
+    sys.stdout.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(os.devnull, 'w') as null:
+        os.dup2(null.fileno(), 1)
+        os.dup2(null.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+
+
+def write_polars(n_files, n_rows, Reynolds=6e6):
+    # n_files made-up polar files in data/, of n_rows points each
+    from xfoil import write_polar
+
+    os.makedirs('data', exist_ok=True)
+    columns = ['alpha', 'CL', 'CD', 'CDp', 'CM', 'Top_Xtr', 'Bot_Xtr']
+    alpha = np.linspace(-10, 20, n_rows)
+    for i in range(n_files):
+        name = 'NACA {}{}{:02d}'.format(i % 7, i // 7 % 7, 6 + i // 49 % 20)
+        rows = np.column_stack([alpha, 0.11 * alpha, 0.005 + 2e-4 * alpha**2, 1e-3 + 0 * alpha,
+                                -0.01 + 0 * alpha, 0.5 + 0 * alpha, 0.6 + 0 * alpha])
+        write_polar('data/{} Re{:.0f}.dat'.format(name, Reynolds), name, columns, rows,
+                    dict(Mach=0, Re=Reynolds, Ncrit=9))
+
+
+# ------------------------------------------------------------------- geometry
+
+@benchmark(foils=[1, 10, 100], Ni=[400])
+def naca4(foils, Ni):
+    from geometry import digits, naca4
+
+    m, p, t = digits(['{:04d}'.format(2412 + i) for i in range(foils)])
+    return lambda: naca4(m, p, t, [0, 4, 8], Ni)
+
+
+@benchmark(Ni=[250, 1000, 4000], binary=[False, True])
+def gen_stl(Ni, binary):
+    from NACA2STL import gen_stl
+
+    os.makedirs('airfoil_snappyHexMesh/constant/triSurface')
+    return lambda: gen_stl('2412', 4, binary, Ni=Ni)
+
+
+@benchmark(Ni=[100, 400, 1600])
+def gen_blockmeshdict(Ni):
+    from meshgen import gen_blockmeshdict
+
+    return lambda: gen_blockmeshdict('2412', 4, path=None, Ni=Ni)
+
+
+@benchmark(foils=[1, 10, 100], points=[81, 161])
+def wiggle_foil(foils, points):
+    from evolve import wiggle_foil
+    from xfoil import write_foil
+
+    x = 0.5 * (1 + np.cos(np.linspace(0, 2 * np.pi, points)))
+    y = 0.06 * np.sqrt(x) * (1 - x) * np.sign(np.linspace(1, -1, points))
+    files = []
+    for i in range(foils):
+        files.append('foil{}.foil'.format(i))
+        write_foil(files[-1], 'foil', np.column_stack([x, y]))
+    rng = np.random.default_rng(0)
+    return lambda: [wiggle_foil(file, 1e-4, rng) for file in files]
+
+
+@benchmark(size=[32, 256], points=[161])
+def mutate(size, points):
+    from evolve import mutate
+
+    x = 0.5 * (1 + np.cos(np.linspace(0, 2 * np.pi, points)))
+    y = 0.06 * np.sqrt(x) * (1 - x) * np.sign(np.linspace(1, -1, points))
+    population = np.repeat(np.column_stack([x, y])[None], size, axis=0)
+    rng = np.random.default_rng(0)
+    return lambda: mutate(population, rng)
+
+
+@benchmark(foils=[1, 16, 128], points=[41, 81])
+def panel_solve(foils, points):
+    from panel import naca_coordinates, solve
+
+    coordinates = naca_coordinates(['{:04d}'.format(2408 + i % 12) for i in range(foils)], points)
+    return lambda: solve(coordinates, np.arange(-5, 11))
+
+
+# -------------------------------------------------------------- polar loading
+
+@benchmark(rows=[50, 500, 5000])
+def load_df(rows):
+    from xfoil import load_df
+
+    write_polars(1, rows)
+    file = os.listdir('data')[0]
+    return lambda: load_df('data/' + file)
+
+
+@benchmark(files=[10, 100, 500], store=['cold', 'warm'])
+def load_data(files, store):
+    from xfoil import load_data
+
+    write_polars(files, 31)
+    if store == 'warm':
+        load_data()
+        return load_data
+
+    def cold():
+        shutil.rmtree('data/store', ignore_errors=True)
+        return load_data()
+    return cold
+
+
+@benchmark(foils=[10, 50], workers=[1, 4])
+def render(foils, workers):
+    # Per-foil plots of a sweep, on reused figures across a pool of processes
+    from xfoil import load_data
+    from plots import render
+
+    write_polars(foils, 31)
+    df = load_data()
+    return lambda: render(df, workers=workers)
+
+
+# -------------------------------------------------------------------- startup
+
+@benchmark(command=['import', 'help'])
+def startup(command):
+    # A fresh interpreter importing xfoil, or printing the CLI's help. Neither
+    # should pull in pandas or matplotlib, which take seconds to load.
+    check = ('import sys, xfoil; '
+             'assert not {"pandas", "matplotlib"} & set(sys.modules), "slow import"')
+    args = {'import': ['-c', check], 'help': ['xfoil.py', '--help']}[command]
+    return lambda: subprocess.check_call([sys.executable] + args, cwd=XFOIL_DIR,
+                                         stdout=subprocess.DEVNULL)
+
+
+# ------------------------------------------------------------------ end to end
+
+@benchmark(alphas=[11, 41])
+def xfoil_main(alphas):
+    from xfoil import main
+
+    return lambda: main('2412', Reynolds=6e6, start=0, stop=alphas - 1, step=1)
+
+
+@benchmark(steps=[20, 200])
+def run_case(steps):
+    # One case farm job: clone the templates and run them through Allrun
+    from run import clone_case, run_case
+
+    os.environ['FOAM_STUB_STEPS'] = str(steps)
+    case = os.path.abspath('case')
+
+    def run():
+        with working_dir(FOAM_DIR):
+            clone_case(case, procs=1)
+        status, info = run_case('2412', 4, 1e6, 10, case=case, procs=1, archive=False)
+        assert status == 0, 'Allrun failed'
+    return run
+
+
+# ------------------------------------------------------------------ reporting
+
+def measure(func, repeat):
+    # Times of `repeat` calls, then the peak memory allocated by one more
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(repeat=repeat, min=min(times), median=statistics.median(times),
+                mean=statistics.mean(times), peak_kb=peak / 1024)
+
+
+def machine():
+    # What a set of results was measured on, to tell runs apart
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import pandas
+    return dict(time=time.strftime('%Y-%m-%dT%H:%M:%S'), commit=commit,
+                python=platform.python_version(), numpy=np.__version__,
+                pandas=pandas.__version__, platform=platform.platform(),
+                processor=platform.processor(), cpus=os.cpu_count())
+
+
+def key(result):
+    return result['name'] + ' ' + ' '.join('{}={}'.format(k, v)
+                                           for k, v in sorted(result['params'].items()))
+
+
+def run(pattern=None, repeat=5):
+    results = []
+    for name, func, grid in BENCHMARKS:
+        if pattern and not re.search(pattern, name):
+            continue
+        for params in combinations(grid):
+            with scratch(), quiet():
+                result = dict(name=name, params=params, **measure(func(**params), repeat))
+            results.append(result)
+            print('{:<45} {:>10.3f} ms {:>12.0f} kB'.format(key(result), result['min'] * 1e3,
+                                                             result['peak_kb']))
+    return results
+
+
+def compare(results, old):
+    # Ratio of the best time of each benchmark to the old run's
+    before = {key(result): result for result in old['results']}
+    print('\nCompared with {} ({}):'.format(old['machine']['time'], old['machine']['commit']))
+    for result in results:
+        if key(result) in before:
+            ratio = result['min'] / before[key(result)]['min']
+            print('{:<45} {:>8.2f}x {}'.format(key(result), ratio,
+                                               'slower' if ratio > 1 else 'faster'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time geometry, mesh file generation and polar loading.')
+    parser.add_argument('--filter', '-k', default=None, help='Only run benchmarks matching this regex')
+    parser.add_argument('--repeat', '-r', type=int, default=5, help='Timed runs of each benchmark')
+    parser.add_argument('--output', '-o', default=None,
+                        help='Results file (default: benchmarks/results/<time>.json)')
+    parser.add_argument('--compare', '-c', default=None, help='Earlier results file to compare with')
+    args = parser.parse_args()
+
+    results = run(args.filter, args.repeat)
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(dict(machine=machine(), results=results), f, indent=2)
+    print('Saved to', output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
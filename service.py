@@ -0,0 +1,409 @@
+"""
+A local job service for XFOIL and OpenFOAM sweeps, so that everyone on a
+machine shares one queue instead of calling xfoil.py and run.py at once.
+
+Sweeps are submitted over a unix socket (or a TCP port on localhost) as a
+line of JSON, and the results are streamed back a line of JSON per point as
+they finish. Every point is keyed by its solver, foil, Reynolds number (and
+speed) and angle: a point already being solved for another client is waited
+on rather than solved again, and a point solved since the service started is
+answered straight away. XFOIL points run on a fixed number of warm xfoil
+sessions and OpenFOAM points on a fixed number of case farm slots, each fed
+from a bounded queue, so submitting more than fits makes clients wait rather
+than piling up processes.
+
+    python service.py serve --xfoil-workers 4 --foam-slots 1
+    python service.py submit xfoil -5 15 1 --foil 2412 0012 --Reynolds 1e6 3e6
+    python service.py submit openfoam 0 10 2 --foil 2412 --Reynolds 1e6 --U 10
+    python service.py stats
+
+With --stubs the solvers are the stand-in executables in XFOIL/stubs and
+OpenFoam/stubs, to try the service without xfoil or OpenFOAM.
+"""
+import concurrent.futures
+import multiprocessing
+import collections
+import argparse
+import tempfile
+import asyncio
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+XFOIL_DIR = os.path.join(ROOT, 'XFOIL')
+FOAM_DIR = os.path.join(ROOT, 'OpenFoam')
+sys.path[:0] = [XFOIL_DIR, FOAM_DIR, os.path.join(FOAM_DIR, 'scripts')]
+
+SOCKET = os.path.join(tempfile.gettempdir(), 'airfoil-service.sock')
+
+# xfoil writes angles to 3 decimal places, so angles closer than that are
+# the same point
+ALPHA_DIGITS = 3
+
+
+def use_stubs():
+    # Run the stand-in solvers, in this process and the ones it starts
+    os.environ['XFOIL'] = os.path.join(XFOIL_DIR, 'stubs', 'xfoil')
+    os.environ['PATH'] = os.path.join(FOAM_DIR, 'stubs') + os.pathsep + os.environ['PATH']
+
+
+def xfoil_polar(session, foil, Reynolds, alphas):
+    """
+    Solve a NACA foil at `alphas` on a warm session, marching out from zero
+    as the xfoil.py sweeps do. Returns a result for every angle, with
+    converged False where xfoil gave up.
+    """
+    from xfoil import branches
+
+    if not session.alive():
+        session.start()
+    session.load_naca(foil)
+    solved = {}
+    for branch in branches(alphas):
+        if not len(branch):
+            continue
+        session.reinit()
+        columns, rows, info = session.polar(branch, Reynolds)
+        for row in rows:
+            solved[round(float(row[0]), ALPHA_DIGITS)] = dict(zip(columns, map(float, row)))
+    return {alpha: dict(solved.get(alpha, {}), converged=alpha in solved) for alpha in alphas}
+
+
+def foam_case(job):
+    # Run one OpenFOAM case in its own clone of the templates (in a worker)
+    from run import farm_job
+
+    foil, alpha, Reynolds, U, case, cores = job
+    start = time.time()
+    foil, alpha, status, info = farm_job((foil, alpha, Reynolds, U, case, None, cores, None,
+                                          None, None, False, None, None))
+    return dict(status=status, case=case, forces=info.get('forces'),
+                wall=time.time() - start)
+
+
+def to_json(value):
+    # numpy numbers and arrays in results
+    return value.tolist() if hasattr(value, 'tolist') else str(value)
+
+
+class Service(object):
+    """
+    Queues, worker pools and the table of points in flight. `xfoil_workers`
+    warm sessions and `foam_slots` case farm slots run at once, and up to
+    `backlog` jobs wait for each; cases run under `root`.
+    """
+
+    def __init__(self, xfoil_workers=None, foam_slots=1, backlog=64, root='service',
+                 timeout=60):
+        self.xfoil_workers = xfoil_workers or multiprocessing.cpu_count()
+        self.foam_slots = foam_slots
+        self.backlog = backlog
+        self.root = os.path.abspath(root)
+        self.timeout = timeout
+
+        # Points being solved, and those solved already, by key
+        self.inflight = {}
+        self.results = {}
+
+        self.counts = collections.Counter()
+        self.busy = collections.Counter()
+        self.busy_time = collections.Counter()
+        self.started = time.time()
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queues = dict(xfoil=asyncio.Queue(self.backlog),
+                           openfoam=asyncio.Queue(self.backlog))
+
+        # Blocking session calls run on a thread each, cases on processes
+        # started fresh in the OpenFOAM folder
+        self.threads = concurrent.futures.ThreadPoolExecutor(self.xfoil_workers)
+        self.processes = concurrent.futures.ProcessPoolExecutor(
+            self.foam_slots, mp_context=multiprocessing.get_context('spawn'),
+            initializer=os.chdir, initargs=(FOAM_DIR,))
+
+        from session import Session
+        sessions = await asyncio.gather(*[
+            self.loop.run_in_executor(self.threads, lambda: Session(timeout=self.timeout))
+            for _ in range(self.xfoil_workers)])
+        self.sessions = sessions
+        self.workers = [asyncio.ensure_future(self.xfoil_worker(s)) for s in sessions]
+        self.workers += [asyncio.ensure_future(self.foam_worker())
+                         for _ in range(self.foam_slots)]
+
+    def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        for session in self.sessions:
+            session.close()
+        self.threads.shutdown(wait=False)
+        self.processes.shutdown(wait=False, cancel_futures=True)
+
+    # ------------------------------------------------------------- submissions
+
+    def key(self, request, foil, Reynolds, alpha):
+        if request['solver'] == 'openfoam':
+            return ('openfoam', foil, float(Reynolds), float(request['U']), alpha)
+        return ('xfoil', foil, float(Reynolds), alpha)
+
+    async def submit(self, request):
+        """
+        Futures of every point of a sweep, sharing those in flight or done
+        already, with a count of each. The jobs for the new points are put
+        on the solver's queue, waiting for room if it is full.
+        """
+        solver = request.get('solver')
+        if solver not in self.queues:
+            raise ValueError('Unknown solver {!r}'.format(solver))
+        foils = [str(foil) for foil in request['foils']]
+        if not all(len(foil) == 4 and foil.isdigit() for foil in foils):
+            raise ValueError('Foils must be NACA 4-digit designations')
+        Reynolds = [float(Re) for Re in request['Reynolds']]
+        alphas = [round(float(alpha), ALPHA_DIGITS) for alpha in request['alphas']]
+        if solver == 'openfoam':
+            float(request['U'])
+
+        futures, jobs = [], collections.OrderedDict()
+        counts = collections.Counter()
+        for foil in foils:
+            for Re in Reynolds:
+                for alpha in alphas:
+                    key = self.key(request, foil, Re, alpha)
+                    if key in self.results:
+                        future = self.loop.create_future()
+                        future.set_result(self.results[key])
+                        counts['cached'] += 1
+                    elif key in self.inflight:
+                        future = self.inflight[key]
+                        counts['coalesced'] += 1
+                    else:
+                        future = self.inflight[key] = self.loop.create_future()
+                        jobs.setdefault(key[:-1], []).append(alpha)
+                        counts['new'] += 1
+                    futures.append(future)
+
+        self.counts.update(points=len(futures), **counts)
+        for point, alphas in jobs.items():
+            if solver == 'openfoam':
+                for alpha in alphas:
+                    await self.queues[solver].put(point + (alpha,))
+            else:
+                await self.queues[solver].put(point + (alphas,))
+        return futures, counts
+
+    def finish(self, key, result):
+        # Hand a point's result to everyone waiting on it
+        result = dict(result, solver=key[0], foil=key[1], Reynolds=key[2], alpha=key[-1])
+        if key[0] == 'openfoam':
+            result['U'] = key[3]
+        future = self.inflight.pop(key)
+        # Failed cases are tried again by the next client to ask for them
+        if result.get('error') is None and result.get('status', 0) == 0:
+            self.results[key] = result
+        future.set_result(result)
+
+    # ----------------------------------------------------------------- workers
+
+    async def work(self, solver, executor, func, *args):
+        # Run a blocking call on a pool, counting the time it keeps a worker busy
+        self.busy[solver] += 1
+        start = time.time()
+        try:
+            return await self.loop.run_in_executor(executor, func, *args)
+        finally:
+            self.busy[solver] -= 1
+            self.busy_time[solver] += time.time() - start
+
+    async def xfoil_worker(self, session):
+        queue = self.queues['xfoil']
+        while True:
+            solver, foil, Reynolds, alphas = await queue.get()
+            results, error = {}, 'Service stopped'
+            try:
+                results = await self.work('xfoil', self.threads, xfoil_polar, session,
+                                          foil, Reynolds, alphas)
+                self.counts['xfoil_jobs'] += 1
+            except Exception as e:
+                # A hung or dead xfoil fails its points and is restarted. If
+                # it won't start, the next job tries again.
+                error = str(e) or type(e).__name__
+                try:
+                    await self.loop.run_in_executor(self.threads, session.start)
+                except Exception as e:
+                    print('Could not restart xfoil: {}'.format(e), flush=True)
+            finally:
+                # Everyone waiting on these points hears back, whatever happened
+                for alpha in alphas:
+                    self.finish((solver, foil, Reynolds, alpha),
+                                results.get(alpha, dict(error=error)))
+                queue.task_done()
+
+    async def foam_worker(self):
+        from run import case_path
+
+        queue = self.queues['openfoam']
+        cores = max(1, multiprocessing.cpu_count() // self.foam_slots)
+        while True:
+            key = await queue.get()
+            solver, foil, Reynolds, U, alpha = key
+            case = case_path(self.root, foil, alpha, Reynolds, U)
+            result = dict(error='Service stopped')
+            try:
+                result = await self.work('openfoam', self.processes, foam_case,
+                                         (foil, alpha, Reynolds, U, case, cores))
+                self.counts['openfoam_jobs'] += 1
+            except Exception as e:
+                result = dict(error=str(e) or type(e).__name__)
+            finally:
+                self.finish(key, result)
+                queue.task_done()
+
+    def stats(self):
+        # What the service has done, and how busy it has kept its workers
+        uptime = time.time() - self.started
+        workers = dict(xfoil=self.xfoil_workers, openfoam=self.foam_slots)
+        return dict(uptime=uptime, inflight=len(self.inflight), solved=len(self.results),
+                    counts=dict(self.counts),
+                    queued={solver: queue.qsize() for solver, queue in self.queues.items()},
+                    busy=dict(self.busy),
+                    utilization={solver: self.busy_time[solver] / (n * uptime)
+                                 for solver, n in workers.items() if n})
+
+    # ------------------------------------------------------------------ server
+
+    async def handle(self, reader, writer):
+        """
+        One client: a line of JSON in, a line of JSON out per event. A
+        submission gets an 'accepted' event with how many of its points are
+        new, shared with another client or solved already, a 'result' for
+        each point as it finishes and then 'done'. {"op": "stats"} gets the
+        service's statistics.
+        """
+        def send(event, **data):
+            writer.write((json.dumps(dict(data, event=event), default=to_json) + '\n').encode())
+            return writer.drain()
+
+        try:
+            request = json.loads((await reader.readline()).decode())
+            if request.get('op') == 'stats':
+                await send('stats', **self.stats())
+                return
+
+            start = time.time()
+            futures, counts = await self.submit(request)
+            await send('accepted', points=len(futures), **counts)
+            for future in asyncio.as_completed(futures):
+                await send('result', **(await future))
+            await send('done', points=len(futures), seconds=time.time() - start)
+        except (ValueError, KeyError, TypeError) as e:
+            await send('error', message='Bad request: {}'.format(e))
+        except ConnectionError:
+            # The client went away; its points still finish for everyone else
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, port=None):
+        await self.start()
+        if port is not None:
+            server = await asyncio.start_server(self.handle, '127.0.0.1', port)
+            where = '127.0.0.1:{}'.format(port)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            server = await asyncio.start_unix_server(self.handle, path)
+            where = path
+        print('Serving on {} with {} xfoil sessions and {} OpenFOAM slots'.format(
+            where, self.xfoil_workers, self.foam_slots), flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+            if port is None and os.path.exists(path):
+                os.remove(path)
+
+
+# ---------------------------------------------------------------------- client
+
+async def request(message, path=None, port=None):
+    """
+    Send a request to the service and yield each event it streams back.
+    """
+    if port is not None:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    else:
+        reader, writer = await asyncio.open_unix_connection(path)
+    writer.write((json.dumps(message) + '\n').encode())
+    await writer.drain()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            yield json.loads(line.decode())
+    finally:
+        writer.close()
+
+
+async def client(message, path=None, port=None):
+    # Print the events of a request as they arrive
+    async for event in request(message, path, port):
+        print(json.dumps(event), flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local job service for XFOIL and OpenFOAM sweeps.')
+    parser.add_argument('--socket', '-s', default=SOCKET, help='Unix socket to serve or connect on')
+    parser.add_argument('--port', '-p', type=int, default=None,
+                        help='Use this TCP port on localhost instead of the socket')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    serve = commands.add_parser('serve', help='Run the service')
+    serve.add_argument('--xfoil-workers', '-j', type=int, default=None,
+                       help='Warm xfoil sessions to run (default: all cores)')
+    serve.add_argument('--foam-slots', type=int, default=1,
+                       help='OpenFOAM cases to run at once, sharing the cores')
+    serve.add_argument('--backlog', type=int, default=64,
+                       help='Jobs each solver queues before submissions wait')
+    serve.add_argument('--root', default='service', help='Folder to run OpenFOAM cases in')
+    serve.add_argument('--timeout', type=float, default=60,
+                       help='Seconds to wait on xfoil before restarting it')
+    serve.add_argument('--stubs', action='store_true',
+                       help='Run the stand-in solvers in XFOIL/stubs and OpenFoam/stubs')
+
+    submit = commands.add_parser('submit', help='Submit a sweep and print its results')
+    submit.add_argument('solver', choices=['xfoil', 'openfoam'])
+    submit.add_argument('start', type=float, help='Start angle of sweep.')
+    submit.add_argument('stop', nargs='?', type=float, default=None,
+                        help='End angle of sweep, included.')
+    submit.add_argument('step', nargs='?', type=float, default=1,
+                        help='Spacing between values.')
+    submit.add_argument('--foil', '-f', nargs='+', default=['0012'], help='NACA XXXX foils')
+    submit.add_argument('--Reynolds', '-R', nargs='+', type=float, default=[6e6],
+                        help='Reynolds numbers')
+    submit.add_argument('--U', type=float, default=10, help='Free stream speed (OpenFOAM)')
+
+    commands.add_parser('stats', help='Print the statistics of the running service')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        if args.stubs:
+            use_stubs()
+        service = Service(args.xfoil_workers, args.foam_slots, args.backlog, args.root,
+                          args.timeout)
+        try:
+            asyncio.run(service.serve(args.socket, args.port))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'stats':
+        asyncio.run(client(dict(op='stats'), args.socket, args.port))
+    else:
+        from xfoil import alpha_range
+        stop = args.start if args.stop is None else args.stop
+        message = dict(solver=args.solver, foils=args.foil, Reynolds=args.Reynolds,
+                       alphas=alpha_range(args.start, stop, args.step).tolist(), U=args.U)
+        asyncio.run(client(message, args.socket, args.port))
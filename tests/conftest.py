@@ -0,0 +1,18 @@
+"""
+Tests for the parts of the scripts that don't need xfoil or OpenFOAM, and
+for the drivers run against the stand-in executables in XFOIL/stubs and
+OpenFoam/stubs, which every test uses in place of the real programs.
+
+    python -m pytest tests
+"""
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+XFOIL_DIR = os.path.join(ROOT, 'XFOIL')
+FOAM_DIR = os.path.join(ROOT, 'OpenFoam')
+
+os.environ['XFOIL'] = os.path.join(XFOIL_DIR, 'stubs', 'xfoil')
+os.environ['PATH'] = os.path.join(FOAM_DIR, 'stubs') + os.pathsep + os.environ['PATH']
+os.environ['FOAM_STUB_STEPS'] = '20'
+sys.path[:0] = [ROOT, XFOIL_DIR, FOAM_DIR, os.path.join(FOAM_DIR, 'scripts')]
@@ -0,0 +1,57 @@
+import itertools
+
+import numpy as np
+
+import cache
+from cache import PolarCache, coordinates_key, foil_key
+
+COLUMNS = ['alpha', 'CL', 'CD', 'CDp', 'CM', 'Top_Xtr', 'Bot_Xtr']
+
+
+def rows(alphas):
+    alphas = np.asarray(alphas, dtype=float)
+    return np.column_stack([alphas, 0.11 * alphas] + [0.01 + 0 * alphas] * 5)
+
+
+def test_lookup_by_foil_reynolds_and_ncrit(tmp_path):
+    c = PolarCache(str(tmp_path / 'polars.sqlite'))
+    c.store('NACA 2412', 1e6, 9, COLUMNS, rows([0, 1, 2]))
+
+    found = c.lookup('NACA 2412', 1e6, 9, [0, 1.001, 2, 3])
+    assert sorted(found) == [0, 2]
+    assert np.allclose(found[2], [0.22] + [0.01] * 5)
+    assert c.lookup('NACA 2412', 3e6, 9, [0]) == {}
+    assert c.lookup('NACA 2412', 1e6, 5, [0]) == {}
+    assert c.lookup('NACA 0012', 1e6, 9, [0]) == {}
+    assert c.stats() == dict(hits=2, misses=5, points=3)
+
+    # Kept on disk
+    c.close()
+    assert sorted(PolarCache(str(tmp_path / 'polars.sqlite')).lookup(
+        'NACA 2412', 1e6, 9, [0, 1])) == [0, 1]
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(cache.time, 'time', lambda: next(clock))
+    c = PolarCache(str(tmp_path / 'polars.sqlite'), max_points=4)
+    c.store('NACA 2412', 1e6, 9, COLUMNS, rows([0, 1]))
+    c.store('NACA 0012', 1e6, 9, COLUMNS, rows([0, 1]))
+    c.lookup('NACA 2412', 1e6, 9, [0, 1])
+    c.store('NACA 4412', 1e6, 9, COLUMNS, rows([0, 1]))
+
+    assert c.stats()['points'] == 4
+    assert c.lookup('NACA 0012', 1e6, 9, [0, 1]) == {}
+    assert len(c.lookup('NACA 2412', 1e6, 9, [0, 1])) == 2
+
+
+def test_keys(tmp_path):
+    x = np.linspace(0, 1, 5)
+    coordinates = np.column_stack([x, 0.05 * x])
+    path = tmp_path / 'foil.dat'
+    np.savetxt(str(path), coordinates, header='foil', comments='')
+
+    assert foil_key('2412') == 'NACA 2412'
+    assert foil_key(str(path)) == coordinates_key(coordinates)
+    assert coordinates_key(coordinates + 1e-9) == coordinates_key(coordinates)
+    assert coordinates_key(coordinates + 1e-6) != coordinates_key(coordinates)
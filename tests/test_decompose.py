@@ -0,0 +1,45 @@
+import decompose
+from decompose import choose, contents, in_plane, ranks
+
+
+def test_ranks():
+    assert ranks(100000, 8) == 5
+    assert ranks(1000000, 8) == 8
+    assert ranks(5000, 8) == 1
+    assert ranks(100000, 8, cells_per_rank=10000) == 8
+
+
+def test_in_plane():
+    assert in_plane(1) == (1, 1, 1)
+    assert in_plane(4) == (2, 1, 2)
+    assert in_plane(6) == (3, 1, 2)
+    assert in_plane(7) == (7, 1, 1)
+    assert in_plane(16) == (4, 1, 4)
+
+
+def test_choose():
+    settings = choose(100000, 8)
+    assert (settings['procs'], settings['method'], settings['n']) == (5, 'scotch', None)
+    assert settings['cells_per_rank'] == 20000
+
+    # Five ranks would be five strips; hierarchical drops to a 2 x 2 split
+    settings = choose(100000, 8, 'hierarchical')
+    assert (settings['procs'], settings['method'], settings['n']) == (4, 'hierarchical', (2, 1, 2))
+
+    # Too small to split, or unknown size
+    assert choose(5000, 8)['method'] is None
+    assert choose(None, 6)['procs'] == 6
+
+
+def test_write(tmp_path):
+    (tmp_path / 'system').mkdir()
+    settings = choose(120000, 8, 'hierarchical')
+    assert list(contents(settings)) == ['numberOfSubdomains', 'method', 'hierarchicalCoeffs']
+    txt = decompose.write(str(tmp_path), settings)
+    with open(str(tmp_path / 'system' / 'decomposeParDict')) as f:
+        assert f.read() == txt
+    assert 'numberOfSubdomains 6;' in txt
+    assert 'n               (3 1 2);' in txt
+    assert 'order           xyz;' in txt
+
+    assert list(contents(choose(100000, 8))) == ['numberOfSubdomains', 'method']
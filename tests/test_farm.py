@@ -0,0 +1,85 @@
+import subprocess
+import sys
+import os
+
+from conftest import FOAM_DIR
+from run import FarmState, case_path, clone_case, farm, run_case
+
+
+def test_key_includes_reynolds_and_speed():
+    keys = {FarmState.key('2412', 2.0, Re, U) for Re in (1e6, 3e6) for U in (10, 20)}
+    assert len(keys) == 4
+    assert FarmState.key('2412', 2.0, 1e6, 10) == '2412/Re1000000_U10/2.0'
+    assert case_path('cases', '2412', 2.0, 1e6, 10) == os.path.join(
+        'cases', '2412', 'Re1000000_U10', '2.0')
+
+
+def test_state_keeps_reynolds_apart(tmp_path):
+    state = FarmState(str(tmp_path))
+    state.set('2412', 2.0, 1e6, 10, 'done', case='a')
+    assert state.status('2412', 2.0, 1e6, 10) == 'done'
+    assert state.status('2412', 2.0, 3e6, 10) is None
+    assert state.status('2412', 2.0, 1e6, 20) is None
+
+    # Saved and read back
+    assert FarmState(str(tmp_path)).status('2412', 2.0, 1e6, 10) == 'done'
+
+
+def test_nearest_weighs_reynolds(tmp_path):
+    state = FarmState(str(tmp_path))
+    state.set('2412', 0.0, 1e6, 10, 'done')
+    state.set('2412', 4.0, 3e6, 10, 'done')
+    state.set('0012', 2.0, 3e6, 10, 'done')
+    assert state.nearest('2412', 3.0, 3e6) == FarmState.key('2412', 4.0, 3e6, 10)
+    assert state.nearest('2412', 1.0, 1e6) == FarmState.key('2412', 0.0, 1e6, 10)
+
+
+def test_new_reynolds_is_not_skipped(tmp_path, monkeypatch):
+    # A second sweep at another Reynolds number in the same root runs every
+    # case again, in folders of its own
+    monkeypatch.chdir(FOAM_DIR)
+    root = str(tmp_path / 'cases')
+    for Reynolds in (1e6, 3e6):
+        farm('2412', [0.0], Reynolds, 10, root=root, slots=1, procs=1, archive=False)
+
+    state = FarmState(root)
+    for Reynolds in (1e6, 3e6):
+        assert state.status('2412', 0.0, Reynolds, 10) == 'done'
+        assert os.path.isdir(case_path(root, '2412', 0.0, Reynolds, 10))
+
+
+def test_cli_farm_with_procs(tmp_path):
+    # --procs rewrites each clone's decomposeParDict through the decompose module
+    root = str(tmp_path / 'cases')
+    subprocess.check_call([sys.executable, 'run.py', '0', '-f', '2412', '--farm', root,
+                           '--procs', '2', '--archive', 'none'], cwd=FOAM_DIR,
+                          stdout=subprocess.DEVNULL)
+    assert FarmState(root).status('2412', 0, 6e6, 1) == 'done'
+
+
+def test_run_case_decomposes_for_procs(tmp_path, monkeypatch):
+    # Outside the farm too, the decomposition matches the ranks asked for
+    monkeypatch.chdir(FOAM_DIR)
+    case = str(tmp_path / 'case')
+    clone_case(case)
+    status, info = run_case('2412', 0, 1e6, 10, case=case, procs=3, archive=False)
+    assert status == 0
+    with open(os.path.join(case, 'airfoil_pimpleFoam', 'system', 'decomposeParDict')) as f:
+        assert 'numberOfSubdomains 3;' in f.read()
+
+
+def test_archives_keyed_like_the_jobs(tmp_path, monkeypatch):
+    # Sweeps of one foil at two Reynolds numbers keep their own archives,
+    # under the farm root rather than the working directory
+    monkeypatch.chdir(FOAM_DIR)
+    root = str(tmp_path / 'cases')
+    for Reynolds in (1e6, 3e6):
+        farm('2412', [0.0], Reynolds, 10, root=root, slots=1, procs=1,
+             archive=dict(format='tar'))
+
+    for Reynolds in (1e6, 3e6):
+        key = FarmState.key('2412', 0.0, Reynolds, 10)
+        archive = FarmState(root).jobs[key]['archive']
+        assert archive == os.path.join(root, 'output', *key.split('/')) + '.tar'
+        assert os.path.isfile(archive)
+    assert not os.path.exists(os.path.join(FOAM_DIR, 'output', '2412'))
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+import numpy as np
+
+import foamfile
+from foamfile import Tokens, dumps, entries, replace_entries, scalar, write
+
+
+def test_scalars():
+    assert scalar(True) == 'on'
+    assert scalar(False) == 'off'
+    assert scalar(4) == '4'
+    assert scalar(2.5) == '2.5'
+    assert scalar(1 / 3.) == '0.33333333'
+    assert scalar('simple') == 'simple'
+
+
+def test_entries():
+    lines = entries(OrderedDict([
+        ('a', 1),
+        ('v', (1, 0, 0)),
+        ('d', OrderedDict([('x', 'y')])),
+        ('#include', '"f"'),
+        ('pts', np.array([[0, 0.5, 1], [1, 1, 1]])),
+        ('blocks', [Tokens('hex', (0, 1, 2), (3, 1, 4))]),
+        ('n', None),
+    ]))
+    assert '\n'.join(lines) == '\n'.join([
+        'a               1;',
+        'v               (1 0 0);',
+        '',
+        'd',
+        '{',
+        '    x               y;',
+        '}',
+        '',
+        '#include        "f"',
+        '',
+        'pts',
+        '(',
+        '    (0 0.5 1)',
+        '    (1 1 1)',
+        ');',
+        '',
+        'blocks',
+        '(',
+        '    hex (0 1 2) (3 1 4)',
+        ');',
+        '',
+        'n',
+    ])
+
+
+def test_write(tmp_path):
+    path = str(tmp_path / 'controlDict')
+    txt = write(path, OrderedDict([('endTime', 100)]), 'controlDict', location='system')
+    with open(path) as f:
+        assert f.read() == txt
+    assert txt.startswith(foamfile.BANNER)
+    assert '    location    "system";\n    object      controlDict;\n' in txt
+    assert 'endTime         100;\n' in txt
+    assert txt.endswith(foamfile.FOOTER)
+
+    # Bare entries, as for an #include'd file
+    assert dumps(OrderedDict([('Re', 1e6)]), banner=False) == 'Re              1000000;\n'
+
+
+def test_replace_entries():
+    txt = 'a 1;\nsub\n{\n    endTime   5;\n    other 2;\n}\n'
+    assert replace_entries(txt, dict(endTime=10, missing=3)) == \
+        'a 1;\nsub\n{\n    endTime   10;\n    other 2;\n}\n'
@@ -0,0 +1,14 @@
+from forcecoeffs import append_polar
+from xfoil import load_df
+
+
+def test_polar_rows_sorted_by_alpha(tmp_path):
+    # Cases finish out of order, and one is run again
+    path = str(tmp_path / 'NACA 2412 Re1000000.dat')
+    for i, alpha in enumerate([0, 2, -2, -4, 4, 2]):
+        append_polar(path, '2412', 1e6, alpha, dict(CL=i, CD=0.01))
+
+    df = load_df(path)
+    assert list(df.alpha) == [-4, -2, 0, 2, 4]
+    assert list(df.CL) == [3, 2, 0, 5, 4]
+    assert (df.Re == 1e6).all()
@@ -0,0 +1,38 @@
+import numpy as np
+
+from panel import expand, naca_coordinates, prescreen, solve
+
+
+def test_solve():
+    result = solve(naca_coordinates(['0012', '2412']), [0, 5])
+    assert result['CL'].shape == result['CM'].shape == (2, 2)
+
+    # Symmetric foil: no lift at zero, close to thin-aerofoil theory at 5 degrees
+    assert np.allclose(result['CL'][0], [0, 0.599], atol=1e-3)
+    assert abs(result['CM'][0, 0]) < 1e-9
+
+    # Cambered foil lifts at zero and pitches nose down
+    assert abs(result['CL'][1, 0] - 0.258) < 1e-3
+    assert abs(result['CM'][1, 0] + 0.055) < 1e-3
+
+
+def test_batched_matches_single():
+    foils = ['0012', '2412', '4415']
+    batched = solve(naca_coordinates(foils), [-2, 4])
+    for i, foil in enumerate(foils):
+        single = solve(naca_coordinates([foil]), [-2, 4])
+        assert np.allclose(batched['CL'][i], single['CL'][0])
+        assert np.allclose(batched['Cp'][i], single['Cp'][0])
+
+
+def test_expand():
+    assert expand(['2410-2412', '0012']) == ['2410', '2411', '2412', '0012']
+    # No camber only comes with P = 0
+    assert expand(['0012-1212']) == ['0012', '1112', '1212']
+
+
+def test_prescreen():
+    df = prescreen(['0012', '2412', '4412', '2410'], cl=0.5, keep=0.5)
+    assert list(df.Cp_min) == sorted(df.Cp_min, reverse=True)
+    assert list(df.keep) == [True, True, False, False]
+    assert np.allclose((df.alpha - df.alpha_0) * df.CL_alpha, 0.5, atol=0.05)
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+import service
+from service import Service
+
+
+def run(service, *requests):
+    # Start the service, submit the requests at once and wait for every point
+    async def go():
+        await service.start()
+        try:
+            submitted = await asyncio.gather(*[service.submit(r) for r in requests])
+            results = [await asyncio.gather(*futures) for futures, _ in submitted]
+            return [counts for _, counts in submitted], results
+        finally:
+            service.close()
+    return asyncio.run(go())
+
+
+def sweep(alphas, foils=('2412',)):
+    return dict(solver='xfoil', foils=list(foils), Reynolds=[1e6], alphas=alphas)
+
+
+def test_overlapping_requests_are_solved_once(tmp_path):
+    s = Service(xfoil_workers=1, root=str(tmp_path))
+    counts, results = run(s, sweep([0, 1, 2, 3]), sweep([2, 3, 4]))
+
+    assert counts[0]['new'] == 4
+    assert counts[1] == dict(new=1, coalesced=2)
+    assert s.counts['xfoil_jobs'] == 2
+    assert not s.inflight
+    assert [r['alpha'] for r in results[1]] == [2, 3, 4]
+    assert all(r['converged'] for r in results[0] + results[1])
+    assert results[0][2] is results[1][0]
+
+
+def test_failed_restart_still_answers_every_point(tmp_path, monkeypatch):
+    # xfoil dies mid-job and won't come back: the job's points fail rather
+    # than hang, and the worker goes on to the next job
+    def broken(session, foil, Reynolds, alphas):
+        monkeypatch.setattr(type(session), 'start', fail)
+        raise OSError('xfoil died')
+
+    def fail(session):
+        raise OSError('no xfoil')
+
+    s = Service(xfoil_workers=1, root=str(tmp_path))
+
+    async def go():
+        await s.start()
+        try:
+            monkeypatch.setattr(service, 'xfoil_polar', broken)
+            futures, _ = await s.submit(sweep([0, 1]))
+            failed = await asyncio.wait_for(asyncio.gather(*futures), 10)
+
+            monkeypatch.setattr(service, 'xfoil_polar', lambda *args: {5.0: dict(converged=True)})
+            futures, _ = await s.submit(sweep([5]))
+            return failed, await asyncio.wait_for(asyncio.gather(*futures), 10)
+        finally:
+            s.close()
+
+    failed, later = asyncio.run(go())
+    assert [r['error'] for r in failed] == ['xfoil died'] * 2
+    assert later[0]['converged']
+    assert not s.inflight
+    assert ('xfoil', '2412', 1e6, 0.0) not in s.results
+
+
+def test_bad_request():
+    s = Service(xfoil_workers=1)
+
+    async def go():
+        await s.start()
+        try:
+            await s.submit(dict(solver='xfoil', foils=['24x2'], Reynolds=[1e6], alphas=[0]))
+        finally:
+            s.close()
+
+    with pytest.raises(ValueError, match='NACA'):
+        asyncio.run(go())
+    assert not s.inflight
@@ -0,0 +1,36 @@
+import pytest
+
+from session import Session, SessionError
+
+
+def test_polar():
+    with Session() as s:
+        s.load_naca('2412')
+        columns, rows, info = s.polar([0, 1, 2], 1e6)
+        assert columns[:3] == ['alpha', 'CL', 'CD']
+        assert list(rows[:, 0]) == [0, 1, 2]
+        assert info['Re'] == 1e6
+
+
+def test_polar_when_xfoil_dies():
+    # The SessionError that sends callers off to restart xfoil isn't hidden
+    # by closing the polar file on a dead process
+    with Session() as s:
+        s.load_naca('2412')
+        s.reynolds(1e6)
+        command = s.command
+
+        def dies(line, timeout=None):
+            if line.startswith('ALFA'):
+                s.p.kill()
+                s.p.wait()
+            return command(line, timeout)
+        s.command = dies
+
+        with pytest.raises(SessionError):
+            s.polar([0, 1])
+        assert not s.alive()
+        s.start()
+        del s.command
+        s.load_naca('0012')
+        assert len(s.polar([0], 1e6)[1]) == 1
@@ -0,0 +1,77 @@
+import subprocess
+import json
+import sys
+import os
+
+import numpy as np
+
+import store
+from store import PolarStore
+from xfoil import write_polar
+
+COLUMNS = ['alpha', 'CL', 'CD', 'CDp', 'CM', 'Top_Xtr', 'Bot_Xtr']
+
+
+def polar(path, foil, alphas, Re=1e6):
+    # A made-up polar file
+    alphas = np.asarray(alphas, dtype=float)
+    rows = np.column_stack([alphas, 0.11 * alphas] + [0.01 + 0 * alphas] * 5)
+    write_polar(str(path / 'NACA {} Re{:.0f}.dat'.format(foil, Re)), 'NACA ' + foil,
+                COLUMNS, rows, dict(Mach=0, Re=Re, Ncrit=9))
+
+
+def test_query(tmp_path):
+    polar(tmp_path, '2412', np.arange(-2, 2.05, 0.1))
+    polar(tmp_path, '0012', [0, 1, 2], Re=3e6)
+    s = PolarStore(str(tmp_path / 'store'))
+    assert s.sync(str(tmp_path / '*.dat')) == 44
+    assert s.sync(str(tmp_path / '*.dat')) == 0
+
+    # Bounds and values exactly as written in the polar file
+    bounds = np.round(np.arange(-2, 2.05, 0.1), 1)[[21, 23]]
+    rows = s.query(foil='2412', alpha=bounds)
+    assert sorted(rows['alpha']) == [0.1, 0.2, 0.3]
+    assert len(s.query(Re=3e6)) == 3
+    assert len(s.query(Re=(0, 2e6))) == 41
+
+    df = s.frame(foil='0012')
+    assert list(df.alpha) == [0, 1, 2]
+    assert (df.Airfoil == '0012').all() and (df.Re == 3e6).all()
+
+
+def test_sync_compacts_garbage(tmp_path):
+    s = PolarStore(str(tmp_path / 'store'))
+    pattern = str(tmp_path / '*.dat')
+    for n in range(3):
+        # The same polar growing, as a sweep writes it
+        polar(tmp_path, '2412', np.arange(n + 2))
+        os.utime(str(tmp_path / 'NACA 2412 Re1000000.dat'), (n, n))
+        s.sync(pattern)
+        assert s.garbage() <= len(s)
+    assert len(s) == 4
+    assert os.path.getsize(s.rows_path) < 2 * 4 * store.dtype.itemsize
+    assert list(s.frame().alpha) == [0, 1, 2, 3]
+
+    os.remove(str(tmp_path / 'NACA 2412 Re1000000.dat'))
+    s.sync(pattern)
+    assert len(s) == 0 and os.path.getsize(s.rows_path) == 0
+
+
+def test_other_layout_is_rebuilt(tmp_path):
+    polar(tmp_path, '2412', [0, 1])
+    s = PolarStore(str(tmp_path / 'store'))
+    s.sync(str(tmp_path / '*.dat'))
+    with open(s.index_path) as f:
+        index = json.load(f)
+    index['layout'] = 'old'
+    with open(s.index_path, 'w') as f:
+        json.dump(index, f)
+
+    s = PolarStore(str(tmp_path / 'store'))
+    assert len(s) == 0
+    assert s.sync(str(tmp_path / '*.dat')) == 2
+
+
+def test_import_leaves_pandas_unloaded():
+    code = 'import sys, store; assert "pandas" not in sys.modules'
+    subprocess.check_call([sys.executable, '-c', code], cwd=os.path.dirname(store.__file__))
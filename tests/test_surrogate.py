@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from cache import PolarCache
+from surrogate import PolarSurrogate, Predictor
+from xfoil import NCRIT
+
+
+def polars(foils=('2412', '0012'), Reynolds=(1e6, 3e6)):
+    # Made-up polars in the columns of load_data
+    alpha = np.arange(-4.0, 9.0)
+    return pd.concat([pd.DataFrame(dict(
+        M=int(foil[0]), P=int(foil[1]), XX=int(foil[2:]), Re=Re, alpha=alpha,
+        CL=0.11 * alpha + 0.1 * int(foil[0]), CD=0.005 + 2e-4 * alpha**2))
+        for foil in foils for Re in Reynolds], ignore_index=True)
+
+
+def test_predicts_known_points():
+    model = PolarSurrogate(polars())
+    mean, std = model.predict(2, 4, 12, 1e6, [0.0, 4.0])
+    assert np.allclose(mean[:, 0], [0.2, 0.64], atol=1e-2)
+    assert np.allclose(mean[:, 1], [0.005, 0.0082], rtol=2e-2)
+    assert (std >= 0).all()
+
+
+def test_xfoil_fallback_keeps_reynolds_exact(tmp_path):
+    # Points xfoil solves go into the cache under the caller's Re, so a
+    # later lookup at that Re finds them
+    cache = PolarCache(str(tmp_path / 'cache.sqlite'))
+    alphas = [0.0, 1.0, 2.0, 3.0]
+    with Predictor(model=PolarSurrogate(), cache=cache) as predictor:
+        df = predictor.query(2, 4, 12, 6e6, alphas)
+
+    assert (df.source == 'xfoil').all()
+    assert (df.Re == 6e6).all()
+    assert sorted(cache.lookup('NACA 2412', 6e6, NCRIT, alphas)) == alphas
+    assert cache.stats()['misses'] == 0
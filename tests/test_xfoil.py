@@ -0,0 +1,81 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import XFOIL_DIR
+from session import SessionError
+from xfoil import batch, grid_polar, run_warm
+
+
+@pytest.mark.parametrize('warm', [False, True])
+def test_batch(tmp_path, monkeypatch, warm):
+    monkeypatch.chdir(tmp_path)
+    df, summary = batch(['2412', '0012'], [1e6], workers=2, warm=warm, start=0, stop=4, step=1)
+    assert sorted(summary.Airfoil) == ['0012', '2412']
+    assert (summary.status == 'ok').all()
+    assert len(df) == 10
+
+
+@pytest.mark.parametrize('warm', [False, True])
+def test_batch_without_jobs(tmp_path, monkeypatch, warm):
+    monkeypatch.chdir(tmp_path)
+    df, summary = batch([], [1e6], warm=warm, start=0, stop=4, step=1)
+    assert len(df) == 0 and len(summary) == 0
+    assert open('logs/batch.csv').read() == 'Airfoil,Re,status,attempts\n'
+
+
+class Recorder(object):
+    # Stands in for a Session, logging the polars asked of it
+    def __init__(self):
+        self.calls = []
+
+    def load_naca(self, foil):
+        pass
+
+    def reinit(self):
+        self.calls.append('INIT')
+
+    def polar(self, alphas, Reynolds):
+        self.calls.append((Reynolds, list(alphas)))
+        rows = np.array([[a, 0.1 * a, 0.01, 0.003, 0, 0.5, 0.6] for a in alphas])
+        return ['alpha', 'CL', 'CD', 'CDp', 'CM', 'Top_Xtr', 'Bot_Xtr'], rows, {}
+
+
+def test_grid_polar_chains_both_branches(tmp_path, monkeypatch):
+    # Every branch after the first Reynolds number starts from the previous
+    # one's solution at the origin
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    session = Recorder()
+    df = grid_polar(session, '2412', [1e6, 3e6], [-2, -1, 0, 1, 2])
+
+    assert session.calls == [
+        (3e6, [0, 1, 2]), 'INIT', (3e6, [0, -1, -2]), 'INIT', (3e6, [0]),
+        (1e6, [0, 1, 2]), 'INIT', (3e6, [0]), (1e6, [0, -1, -2])]
+    assert len(df) == 10 and df.converged.all()
+
+
+class Dead(object):
+    # Stands in for a Session whose xfoil died and won't start again
+    def load_naca(self, foil):
+        raise SessionError('xfoil exited unexpectedly')
+
+    def start(self):
+        raise SessionError('xfoil did not respond within 60 s')
+
+
+def test_run_warm_when_xfoil_wont_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    status, path = run_warm(Dead(), ('2412', 1e6, dict(start=0, stop=4, step=1), None, 1))
+    assert status == dict(Airfoil='2412', Re=1e6, status='failed', attempts=1)
+
+
+@pytest.mark.parametrize('mode', [['-R', '1e6', '3e6'], ['-w'], ['-j', '2'], ['-g', 'grid.csv']])
+def test_cache_refused_outside_single_runs(tmp_path, mode):
+    # Rather than silently ignored by the modes that can't share the cache
+    result = subprocess.run([sys.executable, 'xfoil.py', '0', '2', '1', '-f', '2412', '-c',
+                             str(tmp_path / 'polars.sqlite')] + mode, cwd=XFOIL_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert result.returncode == 2 and b'--cache only works' in result.stderr